@@ -0,0 +1,60 @@
+"""add push outbox table
+
+Revision ID: 20261019_01
+Revises: 20250625_02
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import text
+
+
+# revision identifiers, used by Alembic.
+revision = '20261019_01'
+down_revision = '20250625_02'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+
+    # Проверяем существование таблицы перед созданием
+    table_exists = conn.execute(
+        text("""
+        SELECT 1 FROM information_schema.tables
+        WHERE table_name = 'push_outbox'
+        """)
+    ).fetchone()
+
+    if table_exists:
+        return
+
+    op.create_table('push_outbox',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('subscription_id', sa.Integer(), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('notification_type', sa.String(length=64), nullable=True),
+        sa.Column('ttl', sa.Integer(), nullable=False, server_default='86400'),
+        sa.Column('urgency', sa.String(length=16), nullable=False, server_default='normal'),
+        sa.Column('topic', sa.String(length=32), nullable=True),
+        sa.Column('status', sa.String(length=16), nullable=False, server_default='pending'),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('next_attempt_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('sent_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['subscription_id'], ['push_subscriptions.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_push_outbox_id'), 'push_outbox', ['id'], unique=False)
+    op.create_index(op.f('ix_push_outbox_subscription_id'), 'push_outbox', ['subscription_id'], unique=False)
+    op.create_index('ix_push_outbox_status_next_attempt', 'push_outbox', ['status', 'next_attempt_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_push_outbox_status_next_attempt', table_name='push_outbox')
+    op.drop_index(op.f('ix_push_outbox_subscription_id'), table_name='push_outbox')
+    op.drop_index(op.f('ix_push_outbox_id'), table_name='push_outbox')
+    op.drop_table('push_outbox')
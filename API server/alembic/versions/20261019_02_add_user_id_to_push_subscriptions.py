@@ -0,0 +1,63 @@
+"""add user_id to push subscriptions
+
+Revision ID: 20261019_02
+Revises: 20261019_01
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '20261019_02'
+down_revision = '20261019_01'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+
+    # Проверяем существование колонки перед добавлением
+    column_exists = conn.execute(
+        text("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'push_subscriptions'
+        AND column_name = 'user_id'
+        """)
+    ).fetchone()
+
+    if not column_exists:
+        op.add_column('push_subscriptions', sa.Column('user_id', sa.Integer(), nullable=True))
+        op.create_foreign_key(
+            'push_subscriptions_user_id_fkey', 'push_subscriptions', 'users',
+            ['user_id'], ['id'], ondelete='SET NULL'
+        )
+
+    # json не поддерживает сравнение, поэтому для индекса переводим notification_types в jsonb
+    op.alter_column(
+        'push_subscriptions', 'notification_types',
+        type_=postgresql.JSONB(),
+        postgresql_using='notification_types::jsonb'
+    )
+
+    op.create_index(
+        'ix_push_subscriptions_user_active_types',
+        'push_subscriptions',
+        ['user_id', 'is_active', 'notification_types'],
+        unique=False
+    )
+
+
+def downgrade():
+    op.drop_index('ix_push_subscriptions_user_active_types', table_name='push_subscriptions')
+    op.alter_column(
+        'push_subscriptions', 'notification_types',
+        type_=sa.JSON(),
+        postgresql_using='notification_types::json'
+    )
+    op.drop_constraint('push_subscriptions_user_id_fkey', 'push_subscriptions', type_='foreignkey')
+    op.drop_column('push_subscriptions', 'user_id')
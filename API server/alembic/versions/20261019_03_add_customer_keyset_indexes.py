@@ -0,0 +1,39 @@
+"""add customer keyset pagination indexes
+
+Revision ID: 20261019_03
+Revises: 20261019_02
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '20261019_03'
+down_revision = '20261019_02'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Составные индексы под ORDER BY (name, id) / (created_at, id) внутри владельца:
+    # страница списка читается по индексу без сортировки и без OFFSET
+    op.create_index(
+        'ix_customers_owner_name_id',
+        'customers',
+        ['business_owner_id', 'name', 'id'],
+        unique=False,
+        if_not_exists=True
+    )
+    op.create_index(
+        'ix_customers_owner_created_id',
+        'customers',
+        ['business_owner_id', 'created_at', 'id'],
+        unique=False,
+        if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_index('ix_customers_owner_created_id', table_name='customers', if_exists=True)
+    op.drop_index('ix_customers_owner_name_id', table_name='customers', if_exists=True)
@@ -0,0 +1,54 @@
+"""add trigram search indexes and phone_digits to customers
+
+Revision ID: 20261019_04
+Revises: 20261019_03
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from alembic import op
+from sqlalchemy import text
+
+
+# revision identifiers, used by Alembic.
+revision = '20261019_04'
+down_revision = '20261019_03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
+    # Проверяем существование колонки перед добавлением
+    column_exists = conn.execute(
+        text("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'customers'
+        AND column_name = 'phone_digits'
+        """)
+    ).fetchone()
+
+    if not column_exists:
+        # Вычисляемая колонка: только цифры телефона, заполняется самой БД
+        conn.execute(text(r"""
+        ALTER TABLE customers
+        ADD COLUMN phone_digits VARCHAR(32)
+        GENERATED ALWAYS AS (regexp_replace(phone, '\D', '', 'g')) STORED
+        """))
+
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_customers_name_trgm "
+        "ON customers USING gin (name gin_trgm_ops)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_customers_phone_digits_trgm "
+        "ON customers USING gin (phone_digits gin_trgm_ops)"
+    ))
+
+
+def downgrade():
+    op.drop_index('ix_customers_phone_digits_trgm', table_name='customers', if_exists=True)
+    op.drop_index('ix_customers_name_trgm', table_name='customers', if_exists=True)
+    op.drop_column('customers', 'phone_digits')
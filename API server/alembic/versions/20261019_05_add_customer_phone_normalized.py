@@ -0,0 +1,90 @@
+"""add phone_normalized and unique (business_owner_id, phone_normalized) to customers
+
+Revision ID: 20261019_05
+Revises: 20261019_04
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+from sqlalchemy import text
+
+
+# revision identifiers, used by Alembic.
+revision = '20261019_05'
+down_revision = '20261019_04'
+branch_labels = None
+depends_on = None
+
+
+# Должно совпадать с models.customer.PHONE_NORMALIZED_SQL и crud.customer.normalize_phone
+PHONE_NORMALIZED_SQL = r"""
+CASE
+    WHEN length(regexp_replace(phone, '\D', '', 'g')) = 11 AND left(regexp_replace(phone, '\D', '', 'g'), 1) = '8'
+        THEN '7' || substr(regexp_replace(phone, '\D', '', 'g'), 2)
+    WHEN length(regexp_replace(phone, '\D', '', 'g')) = 10
+        THEN '7' || regexp_replace(phone, '\D', '', 'g')
+    ELSE regexp_replace(phone, '\D', '', 'g')
+END
+"""
+
+# Группы клиентов одного владельца с одинаковым нормализованным номером
+DUPLICATES_SQL = """
+SELECT business_owner_id, phone_normalized, array_agg(id ORDER BY id) AS customer_ids
+FROM customers
+WHERE phone_normalized IS NOT NULL
+GROUP BY business_owner_id, phone_normalized
+HAVING count(*) > 1
+ORDER BY business_owner_id, phone_normalized
+"""
+# Сколько групп дубликатов выводить в сообщении об ошибке
+DUPLICATES_REPORT_LIMIT = 50
+
+
+def upgrade():
+    conn = op.get_bind()
+
+    # Проверяем существование колонки перед добавлением
+    column_exists = conn.execute(
+        text("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'customers'
+        AND column_name = 'phone_normalized'
+        """)
+    ).fetchone()
+
+    if not column_exists:
+        conn.execute(text(
+            f"ALTER TABLE customers ADD COLUMN phone_normalized VARCHAR(32) "
+            f"GENERATED ALWAYS AS ({PHONE_NORMALIZED_SQL}) STORED"
+        ))
+
+    # Уникальный индекс не создастся, пока есть дубликаты (один номер в разных форматах).
+    # Автоматически их не сливаем - это необратимо меняет данные клиентов и бронирований;
+    # миграция останавливается со списком конфликтов для ручного разбора
+    duplicates = conn.execute(text(DUPLICATES_SQL)).fetchall()
+    if duplicates:
+        report = "\n".join(
+            f"  business_owner_id={row.business_owner_id} phone_normalized={row.phone_normalized} "
+            f"customer_ids={list(row.customer_ids)}"
+            for row in duplicates[:DUPLICATES_REPORT_LIMIT]
+        )
+        if len(duplicates) > DUPLICATES_REPORT_LIMIT:
+            report += f"\n  ... и еще {len(duplicates) - DUPLICATES_REPORT_LIMIT}"
+        raise RuntimeError(
+            f"Найдено {len(duplicates)} групп клиентов с одинаковым номером телефона у одного владельца. "
+            f"Объедините или исправьте их (бронирования перенесите на оставляемого клиента) "
+            f"и повторите миграцию:\n{report}"
+        )
+
+    op.create_index(
+        'uq_customers_owner_phone_normalized',
+        'customers',
+        ['business_owner_id', 'phone_normalized'],
+        unique=True,
+        if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_index('uq_customers_owner_phone_normalized', table_name='customers', if_exists=True)
+    op.drop_column('customers', 'phone_normalized')
@@ -0,0 +1,30 @@
+"""add (inventory_type_id, status) index to inventory_items
+
+Revision ID: 20261019_06
+Revises: 20261019_05
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '20261019_06'
+down_revision = '20261019_05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Счетчики items_count/available_count по типам считаются агрегатом в БД
+    op.create_index(
+        'ix_inventory_items_type_status',
+        'inventory_items',
+        ['inventory_type_id', 'status'],
+        unique=False,
+        if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_index('ix_inventory_items_type_status', table_name='inventory_items', if_exists=True)
@@ -0,0 +1,70 @@
+"""add inventory allocation calendar
+
+Revision ID: 20261019_07
+Revises: 20261019_06
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '20261019_07'
+down_revision = '20261019_06'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+
+    # Равенство по integer внутри GiST exclusion-ограничения
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gist"))
+
+    # Проверяем существование таблицы
+    table_exists = conn.execute(
+        text("""
+        SELECT 1 FROM information_schema.tables
+        WHERE table_name = 'inventory_allocations'
+        """)
+    ).fetchone()
+
+    if table_exists:
+        return
+
+    op.create_table(
+        'inventory_allocations',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('item_id', sa.Integer(), nullable=False),
+        sa.Column('booking_id', sa.Integer(), nullable=False),
+        sa.Column('period', postgresql.TSTZRANGE(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['item_id'], ['inventory_items.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['booking_id'], ['bookings.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        postgresql.ExcludeConstraint(
+            (sa.column('item_id'), '='),
+            (sa.column('period'), '&&'),
+            name='ex_inventory_allocations_item_period',
+            using='gist'
+        )
+    )
+    op.create_index('ix_inventory_allocations_id', 'inventory_allocations', ['id'], unique=False)
+    op.create_index('ix_inventory_allocations_booking_id', 'inventory_allocations', ['booking_id'], unique=False)
+    op.create_index(
+        'ix_inventory_allocations_period', 'inventory_allocations', ['period'],
+        unique=False, postgresql_using='gist'
+    )
+    # Уже подтвержденные/выданные бронирования получают единицы разовым скриптом
+    # utils/backfill_inventory_allocations.py (запускается после миграции), а при
+    # следующем изменении бронирования - в sync_booking_allocation
+
+
+def downgrade():
+    op.drop_index('ix_inventory_allocations_period', table_name='inventory_allocations')
+    op.drop_index('ix_inventory_allocations_booking_id', table_name='inventory_allocations')
+    op.drop_index('ix_inventory_allocations_id', table_name='inventory_allocations')
+    op.drop_table('inventory_allocations')
@@ -0,0 +1,30 @@
+"""add (status, planned_start_time) index to bookings
+
+Revision ID: 20261019_08
+Revises: 20261019_07
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '20261019_08'
+down_revision = '20261019_07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Шедулер выбирает и переводит бронирования по статусу и окну времени начала
+    op.create_index(
+        'ix_bookings_status_planned_start',
+        'bookings',
+        ['status', 'planned_start_time'],
+        unique=False,
+        if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_index('ix_bookings_status_planned_start', table_name='bookings', if_exists=True)
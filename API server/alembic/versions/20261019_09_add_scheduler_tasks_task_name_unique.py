@@ -0,0 +1,39 @@
+"""add unique index on scheduler_tasks.task_name
+
+Revision ID: 20261019_09
+Revises: 20261019_08
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '20261019_09'
+down_revision = '20261019_08'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Шедулер сохраняет задачи через INSERT ... ON CONFLICT (task_name).
+    # Раньше уникальности не было - оставляем по каждому task_name последнюю запись
+    op.execute(
+        """
+        DELETE FROM scheduler_tasks t
+        USING scheduler_tasks newer
+        WHERE t.task_name = newer.task_name
+          AND t.id < newer.id
+        """
+    )
+    op.create_index(
+        'uq_scheduler_tasks_task_name',
+        'scheduler_tasks',
+        ['task_name'],
+        unique=True,
+        if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_index('uq_scheduler_tasks_task_name', table_name='scheduler_tasks', if_exists=True)
@@ -0,0 +1,34 @@
+"""add ws_outbox table for oversize NOTIFY payloads
+
+Revision ID: 20261019_10
+Revises: 20261019_09
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261019_10'
+down_revision = '20261019_09'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # События WebSocket сервиса, не помещающиеся в лимит NOTIFY (8000 байт):
+    # шедулер пишет payload сюда, а в канал отправляет ссылку на id
+    op.create_table(
+        'ws_outbox',
+        sa.Column('id', sa.BigInteger(), primary_key=True, autoincrement=True),
+        sa.Column('channel', sa.String(length=63), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False)
+    )
+    op.create_index('ix_ws_outbox_created_at', 'ws_outbox', ['created_at'])
+
+
+def downgrade():
+    op.drop_index('ix_ws_outbox_created_at', table_name='ws_outbox')
+    op.drop_table('ws_outbox')
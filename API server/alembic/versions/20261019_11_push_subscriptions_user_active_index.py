@@ -0,0 +1,38 @@
+"""replace (user_id, is_active, notification_types) push index with (user_id, is_active)
+
+Revision ID: 20261019_11
+Revises: 20261019_10
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '20261019_11'
+down_revision = '20261019_10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Проверка notification_types @> '["..."]' btree-индексом по jsonb не ускоряется,
+    # колонка только раздувала индекс. Подписок у владельца единицы - фильтруем по строкам
+    op.drop_index('ix_push_subscriptions_user_active_types', table_name='push_subscriptions', if_exists=True)
+    op.create_index(
+        'ix_push_subscriptions_user_active',
+        'push_subscriptions',
+        ['user_id', 'is_active'],
+        unique=False,
+        if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_index('ix_push_subscriptions_user_active', table_name='push_subscriptions', if_exists=True)
+    op.create_index(
+        'ix_push_subscriptions_user_active_types',
+        'push_subscriptions',
+        ['user_id', 'is_active', 'notification_types'],
+        unique=False
+    )
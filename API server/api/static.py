@@ -0,0 +1,90 @@
+# backend/API server/api/static.py
+"""
+Раздача статических файлов из data/ (вместо StaticFiles).
+Строгий ETag, Cache-Control: immutable для content-addressed файлов,
+условные и Range-запросы, режим X-Accel-Redirect для nginx.
+"""
+import asyncio
+
+from fastapi import APIRouter, Request, HTTPException, status
+from fastapi.responses import Response, StreamingResponse
+
+from core.config import get_settings
+from services.static_storage import (
+    resolve_static_path,
+    make_etag,
+    cache_control_for,
+    guess_content_type,
+    etag_matches,
+    parse_range,
+    http_date,
+    iter_file_range,
+    RangeNotSatisfiable,
+    STATIC_ROOT,
+)
+
+router = APIRouter()
+
+
+@router.api_route("/static/{file_path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+async def serve_static(file_path: str, request: Request):
+    """Отдать статический файл"""
+    path = await asyncio.to_thread(resolve_static_path, file_path)
+    if path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Файл не найден")
+
+    stat_result = await asyncio.to_thread(path.stat)
+    etag = make_etag(path, stat_result)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control_for(path),
+        "Last-Modified": http_date(stat_result.st_mtime),
+        "Accept-Ranges": "bytes",
+    }
+
+    # Условный запрос: у клиента актуальная версия
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    settings = get_settings()
+    content_type = guess_content_type(path)
+
+    # Продакшн: байты отдает nginx из internal location, Python только проставляет заголовки.
+    # ETag nginx не переносит из ответа API - в /protected-static/ он выставляется
+    # из $upstream_http_etag (etag off), см. nginx/nginx.conf.prod.template
+    if settings.STATIC_X_ACCEL_REDIRECT:
+        relative = path.relative_to(STATIC_ROOT.resolve()).as_posix()
+        headers["X-Accel-Redirect"] = f"{settings.STATIC_X_ACCEL_LOCATION.rstrip('/')}/{relative}"
+        return Response(status_code=status.HTTP_200_OK, headers=headers, media_type=content_type)
+
+    file_size = stat_result.st_size
+    byte_range = None
+    # If-Range: диапазон отдаем только если файл не изменился
+    if_range = request.headers.get("if-range")
+    if not if_range or if_range == etag:
+        try:
+            byte_range = parse_range(request.headers.get("range"), file_size)
+        except RangeNotSatisfiable:
+            return Response(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers={**headers, "Content-Range": f"bytes */{file_size}"}
+            )
+
+    if byte_range is None:
+        start, end, status_code = 0, file_size - 1, status.HTTP_200_OK
+    else:
+        start, end = byte_range
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+        headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+
+    headers["Content-Length"] = str(max(0, end - start + 1))
+
+    if request.method == "HEAD" or file_size == 0:
+        return Response(status_code=status_code, headers=headers, media_type=content_type)
+
+    return StreamingResponse(
+        iter_file_range(path, start, end),
+        status_code=status_code,
+        headers=headers,
+        media_type=content_type
+    )
@@ -2,7 +2,13 @@ from fastapi import APIRouter, Depends, HTTPException, status, Query, Header
 from sqlalchemy.ext.asyncio import AsyncSession
 from db.session import get_db_session
 from crud.booking import get_bookings, create_booking, update_booking
+from crud.inventory_allocation import AllocationConflict
 from crud.user import user_crud
+from core.dependencies import get_redis_client
+from services.inventory_stats_cache import (
+    get_inventory_stats_cached, availability_board_equivalents, availability_total_boards
+)
+from services.booking_automation_queue import enqueue_booking_event
 from schemas.booking import BookingOut, BookingCreate, BookingUpdate
 from typing import List, Optional
 from datetime import datetime, timedelta, timezone
@@ -82,18 +88,32 @@ async def list_bookings(
 # Публичный endpoint удален для безопасности - все бронирования должны быть доступны только авторизованным пользователям
 
 @router.post("/", response_model=BookingOut, status_code=status.HTTP_201_CREATED)
-async def add_booking(booking_in: BookingCreate, db: AsyncSession = Depends(get_db_session)):
-    return await create_booking(db, booking_in)
+async def add_booking(
+    booking_in: BookingCreate,
+    db: AsyncSession = Depends(get_db_session),
+    redis_client = Depends(get_redis_client)
+):
+    try:
+        booking = await create_booking(db, booking_in)
+    except AllocationConflict as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    await enqueue_booking_event(redis_client, booking)
+    return booking
 
 @router.post("/create", response_model=BookingOut, status_code=status.HTTP_201_CREATED)
 async def create_booking_alt(
     booking_in: BookingCreate, 
     db: AsyncSession = Depends(get_db_session),
-    current_user = Depends(get_current_user_optional)
+    current_user = Depends(get_current_user_optional),
+    redis_client = Depends(get_redis_client)
 ):
-    """Альтернативный endpoint для создания бронирования"""
-    from crud.customer import customer_crud
+    """
+    Альтернативный endpoint для создания бронирования.
+    Клиент (поиск/создание по телефону или проверка customer_id), бронирование
+    и статистика клиента записываются одной транзакцией.
+    """
     from schemas.customer import CustomerCreate
+    from services.booking_service import create_booking_with_customer, BookingCustomerNotFound
     
     if not current_user:
         raise HTTPException(
@@ -101,69 +121,52 @@ async def create_booking_alt(
             detail="Необходимо авторизоваться для создания бронирования"
         )
     
-    # Если frontend отправил старые поля (client_name, phone) без customer_id
-    if booking_in.client_name and booking_in.phone and not booking_in.customer_id:
-        # Ищем существующего клиента по телефону у данного бизнесмена
-        customer = await customer_crud.get_customer_by_phone_and_owner(
-            db, booking_in.phone, current_user.id
-        )
-        
-        if not customer:
-            # Создаем нового клиента
-            customer_data = CustomerCreate(
-                name=booking_in.client_name,
-                phone=booking_in.phone,
-                email=None,
-                notes=None
+    if not booking_in.customer_id:
+        if not (booking_in.client_name and booking_in.phone):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Необходимо указать данные клиента (client_name + phone или customer_id)"
             )
-            customer = await customer_crud.create_customer(db, customer_data, current_user.id)
-            print(f"✅ [create_booking] Создан новый клиент: ID={customer.id}, Имя={customer.name}")
-        else:
-            print(f"✅ [create_booking] Найден существующий клиент: ID={customer.id}, Имя={customer.name}")
-        
-        # Обновляем данные бронирования
-        booking_data = booking_in.dict()
-        booking_data['business_owner_id'] = current_user.id
-        booking_data['customer_id'] = customer.id
-        
-        # Создаем новый объект BookingCreate с правильными данными
-        updated_booking = BookingCreate(**booking_data)
-        return await create_booking(db, updated_booking)
-    
-    # Если frontend отправил новые поля (customer_id), проверяем принадлежность
-    elif booking_in.customer_id:
-        customer = await customer_crud.get_customer(db, booking_in.customer_id)
-        if not customer or customer.business_owner_id != current_user.id:
+        # Frontend отправил старые поля (client_name, phone) - проверяем номер как при создании клиента
+        try:
+            CustomerCreate(name=booking_in.client_name, phone=booking_in.phone)
+        except ValueError:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Указанный клиент не найден или не принадлежит вам"
+                detail="Неверный формат номера телефона"
             )
-        
-        # Устанавливаем business_owner_id
-        booking_data = booking_in.dict()
-        booking_data['business_owner_id'] = current_user.id
-        
-        updated_booking = BookingCreate(**booking_data)
-        return await create_booking(db, updated_booking)
     
-    else:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Необходимо указать данные клиента (client_name + phone или customer_id)"
-        )
+    try:
+        booking = await create_booking_with_customer(db, booking_in, current_user.id)
+    except BookingCustomerNotFound as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except AllocationConflict as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    await enqueue_booking_event(redis_client, booking)
+    return booking
 
 @router.patch("/{booking_id}", response_model=BookingOut)
-async def patch_booking(booking_id: int, booking_in: BookingUpdate, db: AsyncSession = Depends(get_db_session)):
-    booking = await update_booking(db, booking_id, booking_in)
+async def patch_booking(
+    booking_id: int,
+    booking_in: BookingUpdate,
+    db: AsyncSession = Depends(get_db_session),
+    redis_client = Depends(get_redis_client)
+):
+    try:
+        booking = await update_booking(db, booking_id, booking_in)
+    except AllocationConflict as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
+    await enqueue_booking_event(redis_client, booking)
     return booking
 
 @router.get("/fully-booked-days")
 async def get_fully_booked_days(
     from_date: str = Query(..., description="Дата начала периода, формат YYYY-MM-DD"),
     to_date: str = Query(..., description="Дата конца периода, формат YYYY-MM-DD"),
-    db: AsyncSession = Depends(get_db_session)
+    db: AsyncSession = Depends(get_db_session),
+    redis_client = Depends(get_redis_client)
 ):
     """
     Возвращает список дат (YYYY-MM-DD), когда все доски заняты в указанный период.
@@ -172,25 +175,12 @@ async def get_fully_booked_days(
     ОБНОВЛЕНО: Использует новую гибкую систему инвентаря с selected_items
     Учитывает только инвентарь с affects_availability=true (SUP доски)
     """
-    from crud.inventory import get_inventory_stats, get_inventory_types
     from crud.booking import get_bookings
     
-    # Получаем типы инвентаря которые влияют на доступность
-    inventory_types = await get_inventory_types(db)
-    availability_affecting_types = {
-        str(inv_type.id): inv_type.board_equivalent 
-        for inv_type in inventory_types 
-        if inv_type.affects_availability
-    }
-    
-    # Получаем общее количество основного инвентаря (только влияющего на доступность)
-    inventory_stats = await get_inventory_stats(db)
-    
-    # Считаем только инвентарь который влияет на доступность
-    total_boards = 0
-    for type_id, type_stats in inventory_stats.get('by_type', {}).items():
-        if str(type_id) in availability_affecting_types:
-            total_boards += type_stats.get('total', 0) * availability_affecting_types[str(type_id)]
+    # Снимок статистики инвентаря (Redis): типы, влияющие на доступность, и их емкость в "досках"
+    inventory_stats = await get_inventory_stats_cached(db, redis_client)
+    availability_affecting_types = availability_board_equivalents(inventory_stats)
+    total_boards = availability_total_boards(inventory_stats)
     
     # Fallback если нет данных
     if total_boards == 0:
@@ -250,16 +240,15 @@ async def get_fully_booked_days(
 @router.get("/availability")
 async def get_day_availability(
     date: str = Query(..., description="Дата, формат YYYY-MM-DD"),
-    db: AsyncSession = Depends(get_db_session)
+    db: AsyncSession = Depends(get_db_session),
+    redis_client = Depends(get_redis_client)
 ):
     """
     Возвращает, есть ли свободные доски на указанный день.
     ОБНОВЛЕНО: Использует новую гибкую систему инвентаря
     """
-    from crud.inventory import get_inventory_stats
-    
-    # Получаем статистику инвентаря
-    inventory_stats = await get_inventory_stats(db)
+    # Снимок статистики инвентаря из Redis
+    inventory_stats = await get_inventory_stats_cached(db, redis_client)
     total_boards = inventory_stats.get('total_items', 12)  # Fallback на 12
     
     # Простая проверка - есть ли хотя бы одна свободная единица инвентаря
@@ -276,7 +265,8 @@ async def get_day_availability(
 async def get_days_availability(
     from_date: str = Query(..., description="Дата начала периода, формат YYYY-MM-DD"),
     to_date: str = Query(..., description="Дата конца периода, формат YYYY-MM-DD"),
-    db: AsyncSession = Depends(get_db_session)
+    db: AsyncSession = Depends(get_db_session),
+    redis_client = Depends(get_redis_client)
 ):
     """
     Возвращает:
@@ -286,25 +276,12 @@ async def get_days_availability(
     ОБНОВЛЕНО: Использует новую гибкую систему инвентаря с selected_items
     Учитывает только инвентарь с affects_availability=true (SUP доски)
     """
-    from crud.inventory import get_inventory_stats, get_inventory_types
     from crud.booking import get_bookings
     
-    # Получаем типы инвентаря которые влияют на доступность
-    inventory_types = await get_inventory_types(db)
-    availability_affecting_types = {
-        str(inv_type.id): inv_type.board_equivalent 
-        for inv_type in inventory_types 
-        if inv_type.affects_availability
-    }
-    
-    # Получаем общее количество основного инвентаря (только влияющего на доступность)
-    inventory_stats = await get_inventory_stats(db)
-    
-    # Считаем только инвентарь который влияет на доступность
-    total_boards = 0
-    for type_id, type_stats in inventory_stats.get('by_type', {}).items():
-        if str(type_id) in availability_affecting_types:
-            total_boards += type_stats.get('total', 0) * availability_affecting_types[str(type_id)]
+    # Снимок статистики инвентаря (Redis): типы, влияющие на доступность, и их емкость в "досках"
+    inventory_stats = await get_inventory_stats_cached(db, redis_client)
+    availability_affecting_types = availability_board_equivalents(inventory_stats)
+    total_boards = availability_total_boards(inventory_stats)
     
     # Fallback если нет данных
     if total_boards == 0:
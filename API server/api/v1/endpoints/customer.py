@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from loguru import logger
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from db.session import get_db_session
@@ -9,6 +10,8 @@ from schemas.customer import (
 )
 from schemas.user import User
 from core.dependencies import get_current_user
+from core.config import settings
+from services.customer_search_index import customer_search_index
 
 router = APIRouter()
 
@@ -38,29 +41,56 @@ async def get_customers(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     search: Optional[str] = Query(None),
+    order_by: Optional[str] = Query(None, pattern="^(name|created_at)$", description="Keyset-пагинация: name или created_at"),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы из next_cursor"),
+    estimate_total: bool = Query(False, description="Разрешить приблизительный total для больших баз"),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db_session)
 ):
     """
-    Получить список клиентов текущего бизнесмена
+    Получить список клиентов текущего бизнесмена.
+    С order_by/cursor используется keyset-пагинация (skip игнорируется), иначе - skip/limit.
     """
-    customers = await customer_crud.get_customers_by_owner(
-        db, 
-        business_owner_id=current_user.id,
-        skip=skip, 
-        limit=limit, 
-        search=search
-    )
+    next_cursor = None
+    if order_by or cursor:
+        try:
+            customers, next_cursor = await customer_crud.get_customers_page(
+                db,
+                business_owner_id=current_user.id,
+                order_by=order_by or "name",
+                cursor=cursor,
+                limit=limit,
+                search=search
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        skip = 0
+    else:
+        customers = await customer_crud.get_customers_by_owner(
+            db, 
+            business_owner_id=current_user.id,
+            skip=skip, 
+            limit=limit, 
+            search=search
+        )
     
-    # Подсчитываем общее количество для пагинации
-    # TODO: Добавить отдельный метод для подсчета
-    total = len(await customer_crud.get_customers_by_owner(db, current_user.id, skip=0, limit=10000))
+    # Общее количество для пагинации: точный COUNT(*), для очень больших баз - оценка планировщика
+    total_is_estimate = False
+    total = None
+    if estimate_total and not search:
+        estimated = await customer_crud.estimate_customers_by_owner(db, current_user.id)
+        if estimated > settings.CUSTOMER_EXACT_COUNT_LIMIT:
+            total, total_is_estimate = estimated, True
+    if total is None:
+        total = await customer_crud.count_customers_by_owner(db, current_user.id, search=search)
     
     return CustomerListResponse(
         customers=customers,
         total=total,
         skip=skip,
-        limit=limit
+        limit=limit,
+        total_is_estimate=total_is_estimate,
+        next_cursor=next_cursor
     )
 
 @router.get("/top", response_model=List[CustomerWithStats])
@@ -102,19 +132,25 @@ async def search_customers_get(
     """
     Поиск клиентов по имени или телефону (GET endpoint для фронтенда)
     """
-    print(f"🔍 [customer search] User ID: {current_user.id}, Query: '{q}', Limit: {limit}")
+    if not q or not q.strip():
+        return await customer_crud.get_customers_by_owner(
+            db, business_owner_id=current_user.id, skip=skip, limit=limit
+        )
+    
+    # Автодополнение из in-process индекса владельца, без запроса к БД
+    customers = await customer_search_index.search(current_user.id, q, limit=limit, skip=skip)
+    if customers is not None:
+        return customers
     
-    customers = await customer_crud.get_customers_by_owner(
+    # Индекс холодный - ранжированный поиск по индексам pg_trgm, лимит ограничивается на сервере
+    customers = await customer_crud.search_customers(
         db,
         business_owner_id=current_user.id,
-        skip=skip,
+        search=q,  # q параметр который ожидает фронтенд
         limit=limit,
-        search=q  # q параметр который ожидает фронтенд
+        skip=skip
     )
-    
-    print(f"✅ [customer search] Найдено клиентов: {len(customers)}")
-    for customer in customers:
-        print(f"   - ID={customer.id}, Name='{customer.name}', Phone='{customer.phone}'")
+    logger.debug(f"🔍 Поиск клиентов владельца {current_user.id} по '{q}': найдено {len(customers)}")
     
     return customers
 
@@ -198,12 +234,23 @@ async def search_customers_post(
     """
     Поиск клиентов по различным критериям (POST endpoint)
     """
-    customers = await customer_crud.get_customers_by_owner(
+    if search_params.search and search_params.search.strip():
+        customers = await customer_search_index.search(
+            current_user.id, search_params.search, limit=search_params.limit, skip=search_params.skip
+        )
+        if customers is not None:
+            return customers
+        return await customer_crud.search_customers(
+            db,
+            business_owner_id=current_user.id,
+            search=search_params.search,
+            limit=search_params.limit,
+            skip=search_params.skip
+        )
+    
+    return await customer_crud.get_customers_by_owner(
         db,
         business_owner_id=current_user.id,
         skip=search_params.skip,
-        limit=search_params.limit,
-        search=search_params.search
-    )
-    
-    return customers 
\ No newline at end of file
+        limit=search_params.limit
+    ) 
\ No newline at end of file
@@ -1,12 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
+from datetime import datetime
 from db.session import get_db_session
+from core.dependencies import get_redis_client
 from crud.inventory import (
     get_inventory_types, get_inventory_type, create_inventory_type, 
     create_inventory_type_with_items, update_inventory_type, delete_inventory_type,
     get_inventory_items, get_inventory_item, create_inventory_item,
-    update_inventory_item, delete_inventory_item, get_inventory_stats,
+    update_inventory_item, delete_inventory_item,
     get_available_inventory_counts
 )
 from schemas.inventory import (
@@ -14,6 +16,8 @@ from schemas.inventory import (
     InventoryTypeWithItems, InventoryItemOut, InventoryItemCreate, InventoryItemUpdate,
     InventoryStats
 )
+from crud.inventory_allocation import get_free_items, count_free_items_by_type
+from services.inventory_stats_cache import get_inventory_stats_cached, invalidate_inventory_stats
 
 router = APIRouter()
 
@@ -34,7 +38,7 @@ async def read_inventory_type(
     db: AsyncSession = Depends(get_db_session)
 ):
     """Получить тип инвентаря по ID с единицами"""
-    inventory_type = await get_inventory_type(db, type_id)
+    inventory_type = await get_inventory_type(db, type_id, with_items=True)
     if not inventory_type:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -45,24 +49,31 @@ async def read_inventory_type(
 @router.post("/types", response_model=InventoryTypeOut, status_code=status.HTTP_201_CREATED)
 async def create_new_inventory_type(
     inventory_type: InventoryTypeCreate,
-    db: AsyncSession = Depends(get_db_session)
+    db: AsyncSession = Depends(get_db_session),
+    redis_client = Depends(get_redis_client)
 ):
     """Создать новый тип инвентаря"""
-    return await create_inventory_type(db, inventory_type)
+    created_type = await create_inventory_type(db, inventory_type)
+    await invalidate_inventory_stats(redis_client)
+    return created_type
 
 @router.post("/types/quick", response_model=InventoryTypeOut, status_code=status.HTTP_201_CREATED)
 async def create_inventory_type_quick(
     inventory_data: InventoryTypeQuickCreate,
-    db: AsyncSession = Depends(get_db_session)
+    db: AsyncSession = Depends(get_db_session),
+    redis_client = Depends(get_redis_client)
 ):
     """Быстро создать тип инвентаря с начальными единицами"""
-    return await create_inventory_type_with_items(db, inventory_data)
+    created_type = await create_inventory_type_with_items(db, inventory_data)
+    await invalidate_inventory_stats(redis_client)
+    return created_type
 
 @router.patch("/types/{type_id}", response_model=InventoryTypeOut)
 async def update_existing_inventory_type(
     type_id: int,
     inventory_type: InventoryTypeUpdate,
-    db: AsyncSession = Depends(get_db_session)
+    db: AsyncSession = Depends(get_db_session),
+    redis_client = Depends(get_redis_client)
 ):
     """Обновить тип инвентаря"""
     updated_type = await update_inventory_type(db, type_id, inventory_type)
@@ -71,12 +82,14 @@ async def update_existing_inventory_type(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Тип инвентаря не найден"
         )
+    await invalidate_inventory_stats(redis_client)
     return updated_type
 
 @router.delete("/types/{type_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_existing_inventory_type(
     type_id: int,
-    db: AsyncSession = Depends(get_db_session)
+    db: AsyncSession = Depends(get_db_session),
+    redis_client = Depends(get_redis_client)
 ):
     """Удалить тип инвентаря (только если нет единиц)"""
     success = await delete_inventory_type(db, type_id)
@@ -85,6 +98,7 @@ async def delete_existing_inventory_type(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Нельзя удалить тип инвентаря с существующими единицами"
         )
+    await invalidate_inventory_stats(redis_client)
 
 # Эндпоинты для единиц инвентаря
 @router.get("/items", response_model=List[InventoryItemOut])
@@ -113,7 +127,8 @@ async def read_inventory_item(
 @router.post("/items", response_model=InventoryItemOut, status_code=status.HTTP_201_CREATED)
 async def create_new_inventory_item(
     inventory_item: InventoryItemCreate,
-    db: AsyncSession = Depends(get_db_session)
+    db: AsyncSession = Depends(get_db_session),
+    redis_client = Depends(get_redis_client)
 ):
     """Создать новую единицу инвентаря"""
     # Проверяем, существует ли тип инвентаря
@@ -124,13 +139,16 @@ async def create_new_inventory_item(
             detail="Указанный тип инвентаря не существует"
         )
     
-    return await create_inventory_item(db, inventory_item)
+    created_item = await create_inventory_item(db, inventory_item)
+    await invalidate_inventory_stats(redis_client)
+    return created_item
 
 @router.patch("/items/{item_id}", response_model=InventoryItemOut)
 async def update_existing_inventory_item(
     item_id: int,
     inventory_item: InventoryItemUpdate,
-    db: AsyncSession = Depends(get_db_session)
+    db: AsyncSession = Depends(get_db_session),
+    redis_client = Depends(get_redis_client)
 ):
     """Обновить единицу инвентаря"""
     updated_item = await update_inventory_item(db, item_id, inventory_item)
@@ -139,12 +157,14 @@ async def update_existing_inventory_item(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Единица инвентаря не найдена"
         )
+    await invalidate_inventory_stats(redis_client)
     return updated_item
 
 @router.delete("/items/{item_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_existing_inventory_item(
     item_id: int,
-    db: AsyncSession = Depends(get_db_session)
+    db: AsyncSession = Depends(get_db_session),
+    redis_client = Depends(get_redis_client)
 ):
     """Удалить единицу инвентаря"""
     success = await delete_inventory_item(db, item_id)
@@ -153,25 +173,55 @@ async def delete_existing_inventory_item(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Единица инвентаря не найдена"
         )
+    await invalidate_inventory_stats(redis_client)
 
 # Статистика и служебные эндпоинты
 @router.get("/stats", response_model=InventoryStats)
-async def read_inventory_stats(db: AsyncSession = Depends(get_db_session)):
-    """Получить статистику инвентаря"""
-    return await get_inventory_stats(db)
+async def read_inventory_stats(
+    db: AsyncSession = Depends(get_db_session),
+    redis_client = Depends(get_redis_client)
+):
+    """Получить статистику инвентаря (снимок из Redis, сбрасывается при изменениях инвентаря)"""
+    return await get_inventory_stats_cached(db, redis_client)
 
 @router.get("/availability")
-async def read_inventory_availability(db: AsyncSession = Depends(get_db_session)):
-    """Получить количество доступного инвентаря по типам"""
-    return await get_available_inventory_counts(db)
+async def read_inventory_availability(
+    start: Optional[datetime] = Query(None, description="Начало интервала (вместе с end - свободные по календарю)"),
+    end: Optional[datetime] = Query(None, description="Конец интервала"),
+    db: AsyncSession = Depends(get_db_session)
+):
+    """Получить количество доступного инвентаря по типам (сейчас или на интервал [start, end))"""
+    if start is None and end is None:
+        return await get_available_inventory_counts(db)
+    _check_interval(start, end)
+    return await count_free_items_by_type(db, start, end)
+
+@router.get("/free-items", response_model=List[InventoryItemOut])
+async def read_free_items(
+    start: datetime = Query(..., description="Начало интервала"),
+    end: datetime = Query(..., description="Конец интервала"),
+    type_id: Optional[int] = Query(None, description="Фильтр по типу инвентаря"),
+    db: AsyncSession = Depends(get_db_session)
+):
+    """Конкретные единицы, свободные на всем интервале [start, end) по календарю занятости"""
+    _check_interval(start, end)
+    return await get_free_items(db, start, end, type_id)
+
+def _check_interval(start: Optional[datetime], end: Optional[datetime]):
+    if start is None or end is None or end <= start:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Укажите start и end, end должен быть позже start"
+        )
 
 # Массовые операции
 @router.post("/items/bulk", response_model=List[InventoryItemOut], status_code=status.HTTP_201_CREATED)
 async def create_multiple_inventory_items(
     type_id: int,
-    quantity: int = Query(..., ge=1, le=50, description="Количество единиц для создания"),
+    quantity: int = Query(..., ge=1, le=500, description="Количество единиц для создания"),
     name_prefix: Optional[str] = Query(None, description="Префикс для названий"),
-    db: AsyncSession = Depends(get_db_session)
+    db: AsyncSession = Depends(get_db_session),
+    redis_client = Depends(get_redis_client)
 ):
     """Создать несколько единиц инвентаря одного типа"""
     from crud.inventory import create_multiple_inventory_items as crud_create_multiple
@@ -186,5 +236,9 @@ async def create_multiple_inventory_items(
     
     base_name = name_prefix or inventory_type.display_name
     created_items = await crud_create_multiple(db, type_id, quantity, base_name)
+    await invalidate_inventory_stats(redis_client)
     
-    return created_items 
\ No newline at end of file
+    # Счетчики типа изменились после вставки - перечитываем их одним агрегирующим запросом
+    # (единицы по-прежнему не выбираются повторно)
+    inventory_type = await get_inventory_type(db, type_id)
+    return [{**item, "inventory_type": inventory_type} for item in created_items] 
\ No newline at end of file
@@ -1,10 +1,13 @@
 from typing import List, Optional, Dict, Any
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from loguru import logger
 
 from db.session import get_db_session
 from crud.push_subscription import crud_push_subscription
+from crud.push_outbox import crud_push_outbox
+from crud.booking import get_booking_by_id
+from core.dependencies import get_current_user_optional, get_redis_client
 from schemas.push_subscription import (
     PushSubscriptionCreate,
     PushSubscriptionUpdate,
@@ -17,9 +20,20 @@ from schemas.push_subscription import (
 from services.push_notification_service import get_push_notification_service
 from core.config import get_settings
 from services.push_notification_service import PushNotificationService
+from services.push_outbox_dispatcher import get_push_outbox_dispatcher
+from services.push_target_cache import get_owner_subscription_ids, invalidate_owner
 
 router = APIRouter()
 
+# TTL уведомлений о бронированиях в push-сервисе (секунды)
+BOOKING_NOTIFICATION_TTL = 3600
+
+# Тип подписки, на который приходят уведомления о бронированиях
+BOOKING_NOTIFICATION_TYPE = "booking_updates"
+
+# Размер пачки при потоковой выборке подписок для рассылки
+SUBSCRIPTION_BATCH_SIZE = 500
+
 # Инициализируем сервис push уведомлений
 push_service = PushNotificationService()
 
@@ -45,7 +59,9 @@ async def get_vapid_public_key():
 async def create_subscription(
     request: Request,
     subscription_data: PushSubscriptionCreate,
-    db: AsyncSession = Depends(get_db_session)
+    db: AsyncSession = Depends(get_db_session),
+    current_user = Depends(get_current_user_optional),
+    redis_client = Depends(get_redis_client)
 ):
     """Создать новую push подписку или обновить существующую"""
     try:
@@ -73,12 +89,22 @@ async def create_subscription(
                 is_active=True,
                 notifications_enabled=True
             )
+            previous_owner_id = existing_subscription.user_id
             subscription = await crud_push_subscription.update(db, db_obj=existing_subscription, obj_in=update_data)
+            # Привязываем устройство к авторизованному владельцу
+            if current_user and subscription.user_id != current_user.id:
+                subscription = await crud_push_subscription.set_owner(db, db_obj=subscription, user_id=current_user.id)
             logger.info(f"Обновлена push подписка: {subscription.id}")
+            await invalidate_owner(redis_client, previous_owner_id, subscription.user_id)
         else:
             # Создаем новую подписку
-            subscription = await crud_push_subscription.create(db, obj_in=subscription_data)
+            subscription = await crud_push_subscription.create(
+                db,
+                obj_in=subscription_data,
+                user_id=current_user.id if current_user else None
+            )
             logger.info(f"Создана новая push подписка: {subscription.id}")
+            await invalidate_owner(redis_client, subscription.user_id)
         
         return subscription
     except Exception as e:
@@ -116,6 +142,33 @@ async def get_subscriptions(
     return subscriptions
 
 
+@router.get("/subscriptions/stats")
+async def get_subscription_stats(db: AsyncSession = Depends(get_db_session)):
+    """Получить статистику подписок"""
+    stats = await crud_push_subscription.get_statistics(db)
+    return stats
+
+
+@router.post("/subscriptions/cleanup")
+async def cleanup_subscriptions(
+    days_inactive: int = 30,
+    db: AsyncSession = Depends(get_db_session)
+):
+    """Очистить неактивные подписки"""
+    try:
+        removed_count = await crud_push_subscription.cleanup_old_subscriptions(db, days_old=days_inactive)
+        return {
+            "message": f"Удалено {removed_count} неактивных подписок",
+            "days_inactive": days_inactive
+        }
+    except Exception as e:
+        logger.error(f"Ошибка при очистке подписок: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Ошибка при очистке подписок"
+        )
+
+
 @router.get("/subscriptions/{subscription_id}", response_model=PushSubscriptionResponse)
 async def get_subscription(
     subscription_id: int,
@@ -135,7 +188,8 @@ async def get_subscription(
 async def update_subscription(
     subscription_id: int,
     subscription_update: PushSubscriptionUpdate,
-    db: AsyncSession = Depends(get_db_session)
+    db: AsyncSession = Depends(get_db_session),
+    redis_client = Depends(get_redis_client)
 ):
     """Обновить push подписку"""
     subscription = await crud_push_subscription.get(db, id=subscription_id)
@@ -148,13 +202,15 @@ async def update_subscription(
     updated_subscription = await crud_push_subscription.update(
         db, db_obj=subscription, obj_in=subscription_update
     )
+    await invalidate_owner(redis_client, updated_subscription.user_id)
     return updated_subscription
 
 
 @router.delete("/subscriptions/{subscription_id}")
 async def delete_subscription(
     subscription_id: int,
-    db: AsyncSession = Depends(get_db_session)
+    db: AsyncSession = Depends(get_db_session),
+    redis_client = Depends(get_redis_client)
 ):
     """Удалить push подписку"""
     subscription = await crud_push_subscription.get(db, id=subscription_id)
@@ -164,17 +220,21 @@ async def delete_subscription(
             detail="Подписка не найдена"
         )
     
+    owner_id = subscription.user_id
     await crud_push_subscription.delete(db, id=subscription_id)
+    await invalidate_owner(redis_client, owner_id)
     return {"message": "Подписка удалена"}
 
 
 @router.post("/send")
 async def send_notification(
     request: SendNotificationRequest,
-    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db_session)
 ):
-    """Отправить push уведомление"""
+    """
+    Поставить push уведомление в очередь (push_outbox).
+    Доставку, повторы и деактивацию недействительных подписок выполняет диспетчер outbox.
+    """
     push_service = get_push_notification_service()
     if not push_service.is_available():
         raise HTTPException(
@@ -182,60 +242,65 @@ async def send_notification(
             detail="Push notification service не настроен"
         )
     
-    # Получаем подписки
+    delivery = push_service.get_delivery_options(request.payload, ttl=request.ttl, urgency=request.urgency)
+    payload = request.payload.model_dump()
+    target_subscriptions = 0
+    queued = 0
+    
+    # Получаем подписки и ставим уведомления в очередь - они переживут рестарт сервера
     if request.subscription_ids:
-        subscriptions = []
-        for sub_id in request.subscription_ids:
-            subscription = await crud_push_subscription.get(db, id=sub_id)
-            if subscription and subscription.is_valid():
-                subscriptions.append(subscription)
-    elif request.notification_type:
-        subscriptions = await crud_push_subscription.get_by_notification_type(
-            db, notification_type=request.notification_type
+        subscription_ids = [
+            subscription.id
+            for subscription in await crud_push_subscription.get_by_ids(db, request.subscription_ids)
+            if subscription.is_valid()
+        ]
+        target_subscriptions = len(subscription_ids)
+        queued = await crud_push_outbox.enqueue(
+            db,
+            subscription_ids=subscription_ids,
+            payload=payload,
+            notification_type=request.notification_type,
+            **delivery
         )
     else:
-        subscriptions = await crud_push_subscription.get_active(db, limit=1000)
+        # Стримим активные подписки пачками (keyset) вместо get_active(limit=1000)
+        async for batch in crud_push_subscription.iter_active(
+            db, notification_type=request.notification_type, batch_size=SUBSCRIPTION_BATCH_SIZE
+        ):
+            target_subscriptions += len(batch)
+            queued += await crud_push_outbox.enqueue(
+                db,
+                subscription_ids=[subscription.id for subscription in batch],
+                payload=payload,
+                notification_type=request.notification_type,
+                **delivery
+            )
     
-    if not subscriptions:
+    if not target_subscriptions:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Не найдено активных подписок"
         )
     
-    # Отправляем уведомления в фоне
-    async def send_notifications_task():
-        try:
-            result = await push_service.send_bulk_notifications(
-                subscriptions=subscriptions,
-                payload=request.payload,
-                max_concurrent=request.max_concurrent or 10
-            )
-            
-            # Деактивируем недействительные подписки
-            if result["invalid_subscriptions"]:
-                for sub_id in result["invalid_subscriptions"]:
-                    await crud_push_subscription.deactivate(db, subscription_id=sub_id)
-            
-            logger.info(f"Отправка завершена: {result}")
-            
-        except Exception as e:
-            logger.error(f"Ошибка при отправке уведомлений: {e}")
+    await db.commit()
+    get_push_outbox_dispatcher().wake()
     
-    background_tasks.add_task(send_notifications_task)
+    logger.info(f"📬 В очередь поставлено {queued} push уведомлений")
     
     return {
-        "message": "Уведомления отправляются в фоне",
-        "target_subscriptions": len(subscriptions)
+        "message": "Уведомления поставлены в очередь отправки",
+        "target_subscriptions": target_subscriptions,
+        "queued": queued
     }
 
 
 @router.post("/send-booking-notification")
 async def send_booking_notification(
     request: SendBookingNotificationRequest,
-    background_tasks: BackgroundTasks,
-    db: AsyncSession = Depends(get_db_session)
+    db: AsyncSession = Depends(get_db_session),
+    redis_client = Depends(get_redis_client)
 ):
-    """Отправить уведомление о бронировании"""
+    """Поставить в очередь уведомление о бронировании"""
     push_service = get_push_notification_service()
     if not push_service.is_available():
         raise HTTPException(
@@ -252,39 +317,58 @@ async def send_booking_notification(
             additional_data=request.additional_data or {}
         )
         
-        # Получаем активные подписки для уведомлений о бронированиях
-        subscriptions = await crud_push_subscription.get_by_notification_type(
-            db, notification_type="booking_updates"
-        )
+        # Уведомления о бронировании актуальны недолго - через час они уже не нужны
+        delivery = push_service.get_delivery_options(payload, ttl=BOOKING_NOTIFICATION_TTL)
+        payload_data = payload.model_dump()
+        target_subscriptions = 0
+        queued = 0
         
-        if not subscriptions:
-            return {"message": "Нет активных подписок для уведомлений о бронированиях"}
+        # Уведомление получают только устройства владельца бронирования
+        business_owner_id = request.business_owner_id
+        if business_owner_id is None:
+            booking = await get_booking_by_id(db, request.booking_id)
+            business_owner_id = booking.business_owner_id if booking else None
         
-        # Отправляем уведомления в фоне
-        async def send_booking_notifications_task():
-            try:
-                result = await push_service.send_bulk_notifications(
-                    subscriptions=subscriptions,
-                    payload=payload,
-                    max_concurrent=10
+        if business_owner_id is not None:
+            subscription_ids = await get_owner_subscription_ids(
+                db, redis_client, user_id=business_owner_id, notification_type=BOOKING_NOTIFICATION_TYPE
+            )
+            target_subscriptions = len(subscription_ids)
+            queued = await crud_push_outbox.enqueue(
+                db,
+                subscription_ids=subscription_ids,
+                payload=payload_data,
+                notification_type=request.notification_type,
+                **delivery
+            )
+        else:
+            # Старые бронирования без владельца - рассылаем всем подписчикам пачками
+            logger.warning(f"⚠️ У бронирования {request.booking_id} нет владельца, рассылка всем подписчикам")
+            async for batch in crud_push_subscription.iter_active(
+                db, notification_type=BOOKING_NOTIFICATION_TYPE, batch_size=SUBSCRIPTION_BATCH_SIZE
+            ):
+                target_subscriptions += len(batch)
+                queued += await crud_push_outbox.enqueue(
+                    db,
+                    subscription_ids=[subscription.id for subscription in batch],
+                    payload=payload_data,
+                    notification_type=request.notification_type,
+                    **delivery
                 )
-                
-                # Деактивируем недействительные подписки
-                if result["invalid_subscriptions"]:
-                    for sub_id in result["invalid_subscriptions"]:
-                        await crud_push_subscription.deactivate(db, subscription_id=sub_id)
-                
-                logger.info(f"Уведомления о бронировании отправлены: {result}")
-                
-            except Exception as e:
-                logger.error(f"Ошибка при отправке уведомлений о бронировании: {e}")
         
-        background_tasks.add_task(send_booking_notifications_task)
+        if not target_subscriptions:
+            return {"message": "Нет активных подписок для уведомлений о бронированиях"}
+        
+        await db.commit()
+        get_push_outbox_dispatcher().wake()
+        
+        logger.info(f"📬 Уведомление о бронировании {request.booking_id} поставлено в очередь: {queued}")
         
         return {
-            "message": f"Уведомление '{request.notification_type}' отправляется",
+            "message": f"Уведомление '{request.notification_type}' поставлено в очередь",
             "booking_id": request.booking_id,
-            "target_subscriptions": len(subscriptions)
+            "target_subscriptions": target_subscriptions,
+            "queued": queued
         }
         
     except ValueError as e:
@@ -294,31 +378,10 @@ async def send_booking_notification(
         )
 
 
-@router.get("/subscriptions/stats")
-async def get_subscription_stats(db: AsyncSession = Depends(get_db_session)):
-    """Получить статистику подписок"""
-    stats = await crud_push_subscription.get_stats(db)
-    return stats
-
-
-@router.post("/subscriptions/cleanup")
-async def cleanup_subscriptions(
-    days_inactive: int = 30,
-    db: AsyncSession = Depends(get_db_session)
-):
-    """Очистить неактивные подписки"""
-    try:
-        removed_count = await crud_push_subscription.cleanup_inactive(db, days=days_inactive)
-        return {
-            "message": f"Удалено {removed_count} неактивных подписок",
-            "days_inactive": days_inactive
-        }
-    except Exception as e:
-        logger.error(f"Ошибка при очистке подписок: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Ошибка при очистке подписок"
-        )
+@router.get("/outbox/stats")
+async def get_outbox_stats(db: AsyncSession = Depends(get_db_session)):
+    """Получить состояние очереди push уведомлений по статусам"""
+    return await crud_push_outbox.get_status_counts(db)
 
 
 @router.get("/debug-config")
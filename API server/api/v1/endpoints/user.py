@@ -1,15 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query, File, UploadFile
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-import os
-import uuid
-from pathlib import Path
 from db.session import get_db_session
 from crud.user import user_crud
 from schemas.user import (
     User, UserCreate, UserUpdate, UserLogin, UserProfile
 )
 from core.dependencies import get_current_user
+from core.config import get_settings
+from services.avatar_service import (
+    save_upload_streaming, process_avatar, remove_avatar_files,
+    AvatarTooLargeError, AvatarProcessingError
+)
 
 router = APIRouter()
 
@@ -182,56 +184,64 @@ async def upload_user_avatar(
             detail="Файл должен быть изображением"
         )
     
-    # Проверяем размер файла (максимум 5MB)
-    if file.size and file.size > 5 * 1024 * 1024:
+    settings = get_settings()
+    max_bytes = settings.AVATAR_MAX_SIZE_MB * 1024 * 1024
+    
+    # Быстрая проверка по заявленному размеру (точная - при потоковом сохранении)
+    if file.size and file.size > max_bytes:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Размер файла не должен превышать 5MB"
+            detail=f"Размер файла не должен превышать {settings.AVATAR_MAX_SIZE_MB}MB"
         )
     
     try:
-        # Создаем директорию для аватаров если её нет
-        avatars_dir = Path("data/avatars")
-        avatars_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Генерируем уникальное имя файла
-        file_extension = file.filename.split('.')[-1] if file.filename and '.' in file.filename else 'jpg'
-        unique_filename = f"user_{user_id}_{uuid.uuid4().hex}.{file_extension}"
-        file_path = avatars_dir / unique_filename
-        
-        # Сохраняем файл
-        content = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(content)
-        
-        # Обновляем путь к аватару в базе данных
-        avatar_url = f"/static/avatars/{unique_filename}"
-        user_update = UserUpdate(avatar=avatar_url)
-        updated_user = await user_crud.update_user(db, user_id, user_update)
-        
-        if not updated_user:
-            # Удаляем файл если не удалось обновить БД
-            if file_path.exists():
-                os.remove(file_path)
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Ошибка при сохранении аватара"
-            )
-        
-        return {
-            "message": "Аватар успешно загружен",
-            "avatar_url": avatar_url,
-            "user": updated_user
-        }
+        # Сохраняем загрузку чанками во временный файл (sha256 считается на лету)
+        tmp_path, digest, _ = await save_upload_streaming(file, max_bytes)
         
+        # Генерируем WebP/JPEG варианты в пуле процессов, имена файлов = sha256 содержимого
+        file_extension = file.filename.split('.')[-1].lower() if file.filename and '.' in file.filename else 'jpg'
+        avatar = await process_avatar(tmp_path, digest, fallback_extension=file_extension)
+    except AvatarTooLargeError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Размер файла не должен превышать {settings.AVATAR_MAX_SIZE_MB}MB"
+        )
+    except AvatarProcessingError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Не удалось прочитать изображение"
+        )
     except Exception as e:
-        # Удаляем файл если произошла ошибка
-        if 'file_path' in locals() and file_path.exists():
-            os.remove(file_path)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка при загрузке аватара: {str(e)}"
         )
+    
+    # Файлы аватаров иммутабельны и могут быть общими для нескольких пользователей,
+    # поэтому при ошибке обновления БД их не удаляем
+    previous_avatar = current_user.avatar
+    avatar_url = avatar["avatar_url"]
+    user_update = UserUpdate(avatar=avatar_url)
+    updated_user = await user_crud.update_user(db, user_id, user_update)
+    
+    if not updated_user:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Ошибка при сохранении аватара"
+        )
+    
+    # Удаляем старый аватар, если он больше никому не нужен
+    if previous_avatar and previous_avatar != avatar_url:
+        if not await user_crud.is_avatar_used_by_others(db, previous_avatar, user_id):
+            await remove_avatar_files(previous_avatar)
+    
+    return {
+        "message": "Аватар успешно загружен",
+        "avatar_url": avatar_url,
+        "avatar_srcset": avatar["srcset"],
+        "avatar_variants": avatar["variants"],
+        "user": updated_user
+    }
 
 @router.delete("/{user_id}/avatar")
 async def delete_user_avatar(
@@ -258,14 +268,9 @@ async def delete_user_avatar(
                 detail="Пользователь не найден"
             )
         
-        # Удаляем файл аватара если он есть
-        if user.avatar:
-            # Извлекаем имя файла из URL
-            if user.avatar.startswith('/static/avatars/'):
-                filename = user.avatar.replace('/static/avatars/', '')
-                file_path = Path("data/avatars") / filename
-                if file_path.exists():
-                    os.remove(file_path)
+        # Удаляем файлы аватара если они есть и не используются другими пользователями
+        if user.avatar and not await user_crud.is_avatar_used_by_others(db, user.avatar, user_id):
+            await remove_avatar_files(user.avatar)
         
         # Обновляем запись в БД
         user_update = UserUpdate(avatar=None)
@@ -82,6 +82,43 @@ class Settings(BaseSettings):
     VAPID_CLAIMS_SUB: str = os.getenv("VAPID_CLAIMS_SUB", "mailto:admin@example.com")
     APPLICATION_SERVER_KEY: str = os.getenv("APPLICATION_SERVER_KEY", "")
 
+    # --- Настройки очереди push-уведомлений (outbox) ---
+    PUSH_DEFAULT_TTL: int = int(os.getenv("PUSH_DEFAULT_TTL", 86400))
+    # Подписки без владельца (созданные до привязки к user_id) получают уведомления о бронированиях
+    # всех владельцев, как раньше, - пока устройство не переподпишется под своим аккаунтом
+    PUSH_INCLUDE_UNOWNED_SUBSCRIPTIONS: bool = os.getenv("PUSH_INCLUDE_UNOWNED_SUBSCRIPTIONS", "true").lower() == "true"
+    PUSH_OUTBOX_ENABLED: bool = os.getenv("PUSH_OUTBOX_ENABLED", "true").lower() == "true"
+    PUSH_OUTBOX_BATCH_SIZE: int = int(os.getenv("PUSH_OUTBOX_BATCH_SIZE", 100))
+    PUSH_OUTBOX_POLL_INTERVAL: float = float(os.getenv("PUSH_OUTBOX_POLL_INTERVAL", 2.0))
+    PUSH_OUTBOX_LEASE_SECONDS: int = int(os.getenv("PUSH_OUTBOX_LEASE_SECONDS", 120))
+    PUSH_OUTBOX_MAX_ATTEMPTS: int = int(os.getenv("PUSH_OUTBOX_MAX_ATTEMPTS", 8))
+    PUSH_OUTBOX_BACKOFF_BASE: float = float(os.getenv("PUSH_OUTBOX_BACKOFF_BASE", 5.0))
+    PUSH_OUTBOX_BACKOFF_MAX: float = float(os.getenv("PUSH_OUTBOX_BACKOFF_MAX", 3600.0))
+    PUSH_OUTBOX_MAX_CONCURRENT: int = int(os.getenv("PUSH_OUTBOX_MAX_CONCURRENT", 20))
+    PUSH_OUTBOX_PER_ORIGIN_CONCURRENT: int = int(os.getenv("PUSH_OUTBOX_PER_ORIGIN_CONCURRENT", 5))
+    PUSH_OUTBOX_RETENTION_HOURS: int = int(os.getenv("PUSH_OUTBOX_RETENTION_HOURS", 72))
+
+    # --- Настройки аватаров ---
+    AVATAR_MAX_SIZE_MB: int = int(os.getenv("AVATAR_MAX_SIZE_MB", 5))
+    AVATAR_WORKERS: int = int(os.getenv("AVATAR_WORKERS", 2))
+
+    # --- Настройки списка клиентов ---
+    # Выше этого порога (по оценке планировщика) total считается приблизительно, без COUNT(*)
+    CUSTOMER_EXACT_COUNT_LIMIT: int = int(os.getenv("CUSTOMER_EXACT_COUNT_LIMIT", 50000))
+    # In-process индекс автодополнения (на каждый процесс свой, свежесть сверяется по версии в Redis).
+    # Ищет по префиксам слов, а не по подстроке/нечетко, как SQL-поиск, - поэтому выключен по умолчанию
+    CUSTOMER_SEARCH_INDEX_ENABLED: bool = os.getenv("CUSTOMER_SEARCH_INDEX_ENABLED", "false").lower() == "true"
+    CUSTOMER_SEARCH_INDEX_MAX_OWNERS: int = int(os.getenv("CUSTOMER_SEARCH_INDEX_MAX_OWNERS", 200))
+    CUSTOMER_SEARCH_INDEX_MAX_CUSTOMERS: int = int(os.getenv("CUSTOMER_SEARCH_INDEX_MAX_CUSTOMERS", 20000))
+    CUSTOMER_SEARCH_INDEX_TTL: int = int(os.getenv("CUSTOMER_SEARCH_INDEX_TTL", 300))  # секунд
+    # Интервал сверки счетчиков клиентов с bookings (секунд, 0 - отключить)
+    CUSTOMER_STATS_RECONCILE_INTERVAL: int = int(os.getenv("CUSTOMER_STATS_RECONCILE_INTERVAL", 900))
+
+    # --- Настройки раздачи статики ---
+    # В продакшне файлы отдает nginx: API отвечает заголовком X-Accel-Redirect на internal location
+    STATIC_X_ACCEL_REDIRECT: bool = os.getenv("STATIC_X_ACCEL_REDIRECT", "false").lower() == "true"
+    STATIC_X_ACCEL_LOCATION: str = os.getenv("STATIC_X_ACCEL_LOCATION", "/protected-static/")
+
     # --- Настройки SMS.ru ---
     SMS_RU_API_ID: str = os.getenv("SMS_RU_API_ID", "")
 
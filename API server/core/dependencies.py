@@ -1,6 +1,6 @@
 import redis.asyncio as redis
 from typing import Optional
-from fastapi import Depends, HTTPException, status, Header
+from fastapi import Depends, HTTPException, status, Header, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from db.session import get_db_session
 from models.user import User
@@ -8,27 +8,9 @@ from crud.user import user_crud
 from core.config import settings
 import jwt
 
-# Глобальная переменная для хранения клиента (импортируется из main или передается)
-# Лучше использовать Request State или DI контейнер в будущем
-# Пока что предполагаем, что redis_client импортируется или доступен глобально
-# TODO: Рефакторить способ доступа к redis_client
-
-# Временное решение: импортируем напрямую из main, но это сохраняет риск
-# Лучше передавать клиент через Request state или через DI.
-# Эта версия все еще может вызвать проблемы при импорте, если main.py сам импортирует что-то отсюда
-# через другие модули.
-try:
-    # Попытка импорта, чтобы получить доступ к глобальной переменной
-    # ВНИМАНИЕ: Это не идеальное решение!
-    from ..main import redis_client as global_redis_client
-except ImportError:
-    # Если импорт не удался (например, при тестировании или другом сценарии),
-    # устанавливаем в None. Зависимость должна будет обработать это.
-    global_redis_client = None
-
-async def get_redis_client() -> Optional[redis.Redis]:
-    # Возвращаем импортированный глобальный клиент
-    return global_redis_client
+async def get_redis_client(request: Request) -> Optional[redis.Redis]:
+    """Redis-клиент приложения: создается в lifespan (main.py) и хранится в app.state. None - Redis недоступен"""
+    return getattr(request.app.state, "redis_client", None)
 
 async def get_current_user(
     authorization: str = Header(None),
@@ -77,4 +59,32 @@ async def get_current_user(
             detail="Пользователь не найден или неактивен"
         )
     
-    return user 
\ No newline at end of file
+    return user
+
+
+async def get_current_user_optional(
+    authorization: str = Header(None),
+    db: AsyncSession = Depends(get_db_session)
+) -> Optional[User]:
+    """
+    Получить текущего пользователя (User) по JWT токену, если он передан.
+    В отличие от get_current_user не выбрасывает 401, а возвращает None.
+    """
+    if not authorization or not authorization.startswith("Bearer "):
+        return None
+    
+    token = authorization.replace("Bearer ", "")
+    if not token.startswith("eyJ"):
+        return None
+    
+    try:
+        payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=["HS256"])
+        user_id = int(payload.get("sub"))
+    except (jwt.InvalidTokenError, ValueError, TypeError):
+        return None
+    
+    user = await user_crud.get_user(db, user_id)
+    if not user or not user.is_active:
+        return None
+    
+    return user
@@ -5,6 +5,20 @@ from schemas.booking import BookingCreate, BookingUpdate
 from fastapi import HTTPException
 from datetime import timedelta, timezone
 from typing import Optional, List
+from crud.inventory_allocation import (
+    sync_booking_allocation, AllocationConflict, ALLOCATING_BOOKING_STATUSES
+)
+
+# Поля, изменение которых требует перезакрепить единицы инвентаря
+SCHEDULE_FIELDS = {'planned_start_time', 'duration_in_hours', 'selected_items'}
+
+async def _sync_allocation(db: AsyncSession, booking: Booking, previous_status: Optional[str] = None, schedule_changed: bool = False):
+    """Синхронизирует календарь инвентаря; при нехватке единиц откатывает транзакцию"""
+    try:
+        await sync_booking_allocation(db, booking, previous_status, schedule_changed)
+    except AllocationConflict:
+        await db.rollback()
+        raise
 
 async def get_bookings(db: AsyncSession, status_filter: str = None, customer_id: Optional[int] = None):
     """Получить список бронирований с фильтрацией"""
@@ -33,6 +47,10 @@ async def create_booking(db: AsyncSession, booking_in: BookingCreate):
     
     booking = Booking(**booking_data)
     db.add(booking)
+    if booking.status in ALLOCATING_BOOKING_STATUSES:
+        # Сразу подтвержденное бронирование закрепляет единицы в календаре
+        await db.flush()
+        await _sync_allocation(db, booking)
     await db.commit()
     await db.refresh(booking)
     
@@ -45,10 +63,17 @@ async def update_booking(db: AsyncSession, booking_id: int, booking_in: BookingU
     if not booking:
         return None
     
+    previous_status = booking.status
+    changes = booking_in.dict(exclude_unset=True)
+    
     # Обновляем поля бронирования
-    for field, value in booking_in.dict(exclude_unset=True).items():
+    for field, value in changes.items():
         setattr(booking, field, value)
     
+    # Календарь занятости инвентаря: закрепить/освободить единицы в той же транзакции
+    schedule_changed = bool(SCHEDULE_FIELDS & changes.keys())
+    await _sync_allocation(db, booking, previous_status, schedule_changed)
+    
     await db.commit()
     await db.refresh(booking)
     return booking
@@ -1,9 +1,98 @@
-from typing import Optional, List
+from typing import Optional, List, Tuple, Any
+from datetime import datetime
+import base64
+import json
+import re
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload
-from sqlalchemy import and_, or_, select
+from sqlalchemy import and_, or_, select, func, tuple_, text, case, update, bindparam
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from models.customer import Customer
 from schemas.customer import CustomerCreate, CustomerUpdate
+from services.customer_search_index import customer_search_index
+
+# Нечеткий поиск (опечатки) включается с этой длины - короче pg_trgm дает слишком много совпадений
+FUZZY_SEARCH_MIN_LENGTH = 3
+# Поиск по телефону - с этого количества цифр в запросе
+PHONE_SEARCH_MIN_DIGITS = 3
+SEARCH_MAX_LIMIT = 100
+
+
+def _escape_like(value: str) -> str:
+    """Экранирует спецсимволы LIKE, чтобы '%' и '_' в запросе искались буквально"""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def normalize_phone(phone: Optional[str]) -> str:
+    """
+    Канонический номер для сравнения: 8XXXXXXXXXX и XXXXXXXXXX -> 7XXXXXXXXXX.
+    Повторяет вычисляемую колонку customers.phone_normalized (models.customer.PHONE_NORMALIZED_SQL).
+    """
+    digits = re.sub(r"\D", "", phone or "")
+    if len(digits) == 11 and digits.startswith("8"):
+        return "7" + digits[1:]
+    if len(digits) == 10:
+        return "7" + digits
+    return digits
+
+
+def _search_terms(search: str) -> Tuple[str, str]:
+    """Нормализует строку поиска: (текст для имени, только цифры для телефона)"""
+    term = " ".join(search.split()).lower()
+    digits = re.sub(r"\D", "", term)
+    return term, digits if len(digits) >= PHONE_SEARCH_MIN_DIGITS else ""
+
+
+# Бронирования в этих статусах не учитываются в статистике клиента
+STATS_EXCLUDED_BOOKING_STATUSES = ("cancelled", "no_show")
+
+# Пересчет total_bookings_count из bookings одним запросом; обновляются только расходящиеся строки
+_RECONCILE_STATS_SQL = text("""
+    UPDATE customers AS c
+    SET total_bookings_count = s.bookings_count, updated_at = now()
+    FROM (
+        SELECT cu.id, count(b.id) AS bookings_count
+        FROM customers cu
+        LEFT JOIN bookings b
+            ON b.customer_id = cu.id
+            AND b.status NOT IN :excluded_statuses
+        WHERE (CAST(:business_owner_id AS integer) IS NULL OR cu.business_owner_id = :business_owner_id)
+        GROUP BY cu.id
+    ) AS s
+    WHERE c.id = s.id
+      AND c.total_bookings_count IS DISTINCT FROM s.bookings_count
+    RETURNING c.id, c.business_owner_id
+""").bindparams(bindparam("excluded_statuses", expanding=True))
+
+
+# Поддерживаемые порядки keyset-пагинации: поле -> направление
+CUSTOMER_KEYSET_ORDERS = {
+    "name": "asc",          # По алфавиту
+    "created_at": "desc",   # Сначала новые
+}
+
+
+def encode_customer_cursor(order_by: str, customer: Customer) -> str:
+    """Курсор keyset-пагинации: значение поля сортировки + id последней записи страницы"""
+    value = getattr(customer, order_by)
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([order_by, value, customer.id], ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_customer_cursor(cursor: str) -> Tuple[str, Any, int]:
+    """Разбирает курсор, выбрасывает ValueError для некорректного значения"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        order_by, value, last_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception as e:
+        raise ValueError("Некорректный курсор") from e
+    if order_by not in CUSTOMER_KEYSET_ORDERS:
+        raise ValueError("Некорректный курсор")
+    if order_by == "created_at":
+        value = datetime.fromisoformat(value)
+    return order_by, value, int(last_id)
 
 class CRUDCustomer:
     async def get_customer(self, db: AsyncSession, customer_id: int) -> Optional[Customer]:
@@ -17,11 +106,11 @@ class CRUDCustomer:
         phone: str, 
         business_owner_id: int
     ) -> Optional[Customer]:
-        """Получить клиента по номеру телефона и владельцу бизнеса"""
+        """Получить клиента по номеру телефона и владельцу бизнеса (в любом формате номера)"""
         result = await db.execute(
             select(Customer).where(
                 and_(
-                    Customer.phone == phone,
+                    Customer.phone_normalized == normalize_phone(phone),
                     Customer.business_owner_id == business_owner_id
                 )
             )
@@ -37,19 +126,136 @@ class CRUDCustomer:
         search: Optional[str] = None
     ) -> List[Customer]:
         """Получить список клиентов конкретного бизнесмена"""
-        query = select(Customer).where(Customer.business_owner_id == business_owner_id)
+        query = select(Customer).where(self._owner_search_filter(business_owner_id, search))
+        query = query.order_by(Customer.id).offset(skip).limit(limit)
+        result = await db.execute(query)
+        return result.scalars().all()
+    
+    def _owner_search_filter(self, business_owner_id: int, search: Optional[str]):
+        """Условие выборки клиентов владельца с необязательным поиском"""
+        condition = Customer.business_owner_id == business_owner_id
+        if search and search.strip():
+            term, digits = _search_terms(search)
+            # Оба условия обслуживаются GIN-индексами pg_trgm (ix_customers_*_trgm)
+            matches = [Customer.name.ilike(f"%{_escape_like(term)}%", escape="\\")]
+            if digits:
+                matches.append(Customer.phone_digits.like(f"%{digits}%"))
+            condition = and_(condition, or_(*matches))
+        return condition
+    
+    async def search_customers(
+        self,
+        db: AsyncSession,
+        business_owner_id: int,
+        search: str,
+        limit: int = 20,
+        skip: int = 0
+    ) -> List[Customer]:
+        """
+        Поиск клиентов для автодополнения с ранжированием.
+        Совпадения по индексам pg_trgm: подстрока имени, цифры телефона, нечеткое совпадение
+        по слову (опечатки). Порядок: точное совпадение, префикс, похожесть имени.
+        """
+        term, digits = _search_terms(search)
+        if not term:
+            return []
+        limit = min(limit, SEARCH_MAX_LIMIT)
+        escaped = _escape_like(term)
+        name_lower = func.lower(Customer.name)
         
-        if search:
-            query = query.where(
-                or_(
-                    Customer.name.ilike(f"%{search}%"),
-                    Customer.phone.ilike(f"%{search}%")
-                )
-            )
+        matches = [Customer.name.ilike(f"%{escaped}%", escape="\\")]
+        if len(term) >= FUZZY_SEARCH_MIN_LENGTH:
+            # name %> term: word_similarity(term, name) выше порога pg_trgm
+            matches.append(Customer.name.op("%>")(term))
+        if digits:
+            matches.append(Customer.phone_digits.like(f"%{digits}%"))
+        
+        exact = [name_lower == term]
+        prefix = [Customer.name.ilike(f"{escaped}%", escape="\\")]
+        if digits:
+            exact.append(Customer.phone_digits == digits)
+            prefix.append(Customer.phone_digits.like(f"{digits}%"))
+        rank = case((or_(*exact), 0), (or_(*prefix), 1), else_=2)
         
-        query = query.offset(skip).limit(limit)
+        query = (
+            select(Customer)
+            .where(Customer.business_owner_id == business_owner_id, or_(*matches))
+            .order_by(rank, func.similarity(Customer.name, term).desc(), Customer.name, Customer.id)
+            .offset(skip)
+            .limit(limit)
+        )
         result = await db.execute(query)
-        return result.scalars().all()
+        return list(result.scalars().all())
+    
+    async def count_customers_by_owner(
+        self,
+        db: AsyncSession,
+        business_owner_id: int,
+        search: Optional[str] = None
+    ) -> int:
+        """Точное количество клиентов бизнесмена (SELECT count(*))"""
+        result = await db.execute(
+            select(func.count(Customer.id)).where(self._owner_search_filter(business_owner_id, search))
+        )
+        return result.scalar_one()
+    
+    async def estimate_customers_by_owner(self, db: AsyncSession, business_owner_id: int) -> int:
+        """
+        Оценка количества клиентов по статистике планировщика (EXPLAIN, без сканирования).
+        Погрешность в пределах нескольких процентов - подходит для "~N клиентов" у больших баз.
+        """
+        result = await db.execute(
+            text("EXPLAIN (FORMAT JSON) SELECT 1 FROM customers WHERE business_owner_id = :owner_id"),
+            {"owner_id": business_owner_id}
+        )
+        plan = result.scalar_one()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+    
+    async def get_customers_page(
+        self,
+        db: AsyncSession,
+        business_owner_id: int,
+        order_by: str = "name",
+        cursor: Optional[str] = None,
+        limit: int = 100,
+        search: Optional[str] = None
+    ) -> Tuple[List[Customer], Optional[str]]:
+        """
+        Keyset-пагинация клиентов по (name, id) или (created_at, id).
+        Каждая страница - O(limit) по индексу, независимо от глубины.
+        Возвращает (клиенты, курсор следующей страницы или None).
+        """
+        if order_by not in CUSTOMER_KEYSET_ORDERS:
+            raise ValueError(f"Неподдерживаемая сортировка: {order_by}")
+        
+        column = getattr(Customer, order_by)
+        descending = CUSTOMER_KEYSET_ORDERS[order_by] == "desc"
+        query = select(Customer).where(self._owner_search_filter(business_owner_id, search))
+        
+        if cursor:
+            cursor_order, cursor_value, cursor_id = decode_customer_cursor(cursor)
+            if cursor_order != order_by:
+                raise ValueError("Курсор относится к другой сортировке")
+            key = tuple_(column, Customer.id)
+            query = query.where(key < (cursor_value, cursor_id) if descending else key > (cursor_value, cursor_id))
+        
+        if descending:
+            query = query.order_by(column.desc(), Customer.id.desc())
+        else:
+            query = query.order_by(column.asc(), Customer.id.asc())
+        
+        # Берем на одну запись больше, чтобы понять, есть ли следующая страница
+        result = await db.execute(query.limit(limit + 1))
+        customers = list(result.scalars().all())
+        
+        next_cursor = None
+        if len(customers) > limit:
+            customers = customers[:limit]
+            next_cursor = encode_customer_cursor(order_by, customers[-1])
+        
+        return customers, next_cursor
     
     async def get_customers_with_bookings(
         self, 
@@ -79,6 +285,7 @@ class CRUDCustomer:
         db.add(db_customer)
         await db.commit()
         await db.refresh(db_customer)
+        await customer_search_index.upsert(db_customer)
         return db_customer
     
     async def update_customer(
@@ -109,6 +316,7 @@ class CRUDCustomer:
         
         await db.commit()
         await db.refresh(db_customer)
+        await customer_search_index.upsert(db_customer)
         return db_customer
     
     async def delete_customer(self, db: AsyncSession, customer_id: int, business_owner_id: int) -> bool:
@@ -128,6 +336,7 @@ class CRUDCustomer:
         
         await db.delete(db_customer)
         await db.commit()
+        await customer_search_index.remove(business_owner_id, customer_id)
         return True
     
     async def update_customer_stats(
@@ -135,24 +344,53 @@ class CRUDCustomer:
         db: AsyncSession, 
         customer_id: int, 
         booking_count_delta: int = 0,
-        spent_delta: int = 0
+        spent_delta: int = 0,
+        commit: bool = True
     ) -> Optional[Customer]:
-        """Обновить статистику клиента"""
-        db_customer = await self.get_customer(db, customer_id)
+        """
+        Атомарно изменить статистику клиента одним UPDATE ... RETURNING.
+        Не уходит в минус (GREATEST(0, ...)), безопасно при параллельных бронированиях.
+        С commit=False выполняется в транзакции вызывающего кода.
+        """
+        result = await db.execute(
+            update(Customer)
+            .where(Customer.id == customer_id)
+            .values(
+                total_bookings_count=func.greatest(0, Customer.total_bookings_count + booking_count_delta),
+                total_spent=func.greatest(0, Customer.total_spent + spent_delta)
+            )
+            .returning(Customer)
+            .execution_options(synchronize_session=False, populate_existing=True)
+        )
+        db_customer = result.scalar_one_or_none()
         if not db_customer:
             return None
         
-        db_customer.total_bookings_count += booking_count_delta
-        db_customer.total_spent += spent_delta
-        
-        # Не позволяем уйти в минус
-        db_customer.total_bookings_count = max(0, db_customer.total_bookings_count)
-        db_customer.total_spent = max(0, db_customer.total_spent)
-        
-        await db.commit()
-        await db.refresh(db_customer)
+        if commit:
+            await db.commit()
+            await customer_search_index.upsert(db_customer)
         return db_customer
     
+    async def reconcile_stats(self, db: AsyncSession, business_owner_id: Optional[int] = None) -> int:
+        """
+        Пересчитывает количество бронирований клиентов из bookings одним агрегирующим запросом
+        (для всех владельцев или одного). Возвращает количество исправленных клиентов.
+        total_spent не пересчитывается: в bookings нет суммы, это накопительный счетчик.
+        """
+        result = await db.execute(
+            _RECONCILE_STATS_SQL,
+            {
+                "excluded_statuses": list(STATS_EXCLUDED_BOOKING_STATUSES),
+                "business_owner_id": business_owner_id,
+            }
+        )
+        changed = result.all()
+        await db.commit()
+        
+        for owner_id in {row.business_owner_id for row in changed}:
+            await customer_search_index.invalidate(owner_id)
+        return len(changed)
+    
     async def get_top_customers(
         self, 
         db: AsyncSession, 
@@ -190,18 +428,30 @@ class CRUDCustomer:
         return result.scalar_one_or_none()
     
     async def create_client(self, db: AsyncSession, client_in: CustomerCreate) -> Customer:
-        """DEPRECATED: Создать клиента без business_owner_id (используется временно)"""
-        db_customer = Customer(
-            name=client_in.name,
-            phone=client_in.phone,
-            email=client_in.email,
-            business_owner_id=1,  # Временно используем ID=1 как default
-            notes=getattr(client_in, 'notes', None)
+        """
+        DEPRECATED: Создать клиента без business_owner_id (используется временно).
+        Номер уже есть у владельца (uq_customers_owner_phone_normalized) - возвращается существующий клиент.
+        """
+        business_owner_id = 1  # Временно используем ID=1 как default
+        statement = (
+            pg_insert(Customer)
+            .values(
+                name=client_in.name,
+                phone=client_in.phone,
+                email=client_in.email,
+                business_owner_id=business_owner_id,
+                notes=getattr(client_in, 'notes', None)
+            )
+            .on_conflict_do_nothing(index_elements=[Customer.business_owner_id, Customer.phone_normalized])
+            .returning(Customer)
         )
-        
-        db.add(db_customer)
+        result = await db.execute(select(Customer).from_statement(statement))
+        db_customer = result.scalar_one_or_none()
         await db.commit()
-        await db.refresh(db_customer)
+        
+        if db_customer is None:
+            return await self.get_customer_by_phone_and_owner(db, client_in.phone, business_owner_id)
+        await customer_search_index.upsert(db_customer)
         return db_customer
 
 # Создаем глобальный экземпляр
@@ -1,5 +1,5 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, delete, func, and_, case
+from sqlalchemy import select, update, delete, insert, func, and_, case
 from sqlalchemy.orm import selectinload
 from typing import List, Optional, Dict, Any
 from models.inventory_type import InventoryType, InventoryItem
@@ -8,45 +8,61 @@ from schemas.inventory import (
     InventoryItemCreate, InventoryItemUpdate
 )
 
+def _item_counters_subquery():
+    """Счетчики единиц по типам, считаются в БД (без загрузки самих единиц)"""
+    return select(
+        InventoryItem.inventory_type_id,
+        func.count(InventoryItem.id).label('items_count'),
+        func.count(InventoryItem.id).filter(InventoryItem.status == 'available').label('available_count')
+    ).group_by(InventoryItem.inventory_type_id).subquery()
+
+def _select_types_with_counters():
+    counters = _item_counters_subquery()
+    return select(
+        InventoryType,
+        func.coalesce(counters.c.items_count, 0),
+        func.coalesce(counters.c.available_count, 0)
+    ).outerjoin(counters, counters.c.inventory_type_id == InventoryType.id)
+
+def _attach_counters(rows) -> List[InventoryType]:
+    types = []
+    for inventory_type, items_count, available_count in rows:
+        # Добавляем атрибуты динамически
+        inventory_type.items_count = items_count
+        inventory_type.available_count = available_count
+        types.append(inventory_type)
+    return types
+
 # CRUD для типов инвентаря
 async def get_inventory_types(db: AsyncSession, skip: int = 0, limit: int = 100, include_inactive: bool = False) -> List[InventoryType]:
-    """Получить все типы инвентаря"""
-    query = select(InventoryType).options(selectinload(InventoryType.items))
+    """Получить все типы инвентаря со счетчиками единиц (единицы не загружаются)"""
+    query = _select_types_with_counters()
     
     if not include_inactive:
         query = query.where(InventoryType.is_active == True)
     
     query = query.offset(skip).limit(limit).order_by(InventoryType.display_name)
     result = await db.execute(query)
-    types = result.scalars().all()
-    
-    # Добавляем расчет счетчиков для каждого типа
-    for inventory_type in types:
-        items_count = len(inventory_type.items) if inventory_type.items else 0
-        available_count = len([item for item in inventory_type.items if item.status == 'available']) if inventory_type.items else 0
-        
-        # Добавляем атрибуты динамически
-        inventory_type.items_count = items_count
-        inventory_type.available_count = available_count
-    
-    return types
+    return _attach_counters(result.all())
 
-async def get_inventory_type(db: AsyncSession, type_id: int) -> Optional[InventoryType]:
-    """Получить тип инвентаря по ID"""
-    query = select(InventoryType).options(selectinload(InventoryType.items)).where(InventoryType.id == type_id)
-    result = await db.execute(query)
-    inventory_type = result.scalar_one_or_none()
-    
-    if inventory_type:
-        # Добавляем расчет счетчиков
-        items_count = len(inventory_type.items) if inventory_type.items else 0
-        available_count = len([item for item in inventory_type.items if item.status == 'available']) if inventory_type.items else 0
-        
-        # Добавляем атрибуты динамически
-        inventory_type.items_count = items_count
-        inventory_type.available_count = available_count
+async def get_inventory_type(db: AsyncSession, type_id: int, with_items: bool = False) -> Optional[InventoryType]:
+    """
+    Получить тип инвентаря по ID со счетчиками единиц.
+    with_items=True - дополнительно загрузить единицы (для InventoryTypeWithItems).
+    """
+    if with_items:
+        query = select(InventoryType).options(selectinload(InventoryType.items)).where(InventoryType.id == type_id)
+        result = await db.execute(query)
+        inventory_type = result.scalar_one_or_none()
+        if inventory_type:
+            # Единицы уже загружены - считаем по ним
+            inventory_type.items_count = len(inventory_type.items)
+            inventory_type.available_count = sum(1 for item in inventory_type.items if item.status == 'available')
+        return inventory_type
     
-    return inventory_type
+    result = await db.execute(_select_types_with_counters().where(InventoryType.id == type_id))
+    types = _attach_counters(result.all())
+    return types[0] if types else None
 
 async def create_inventory_type(db: AsyncSession, inventory_type: InventoryTypeCreate) -> InventoryType:
     """Создать новый тип инвентаря"""
@@ -57,29 +73,23 @@ async def create_inventory_type(db: AsyncSession, inventory_type: InventoryTypeC
     return db_inventory_type
 
 async def create_inventory_type_with_items(db: AsyncSession, inventory_data: InventoryTypeQuickCreate) -> InventoryType:
-    """Создать тип инвентаря с начальными единицами"""
-    # Создаем тип инвентаря
+    """
+    Создать тип инвентаря с начальными единицами одной транзакцией:
+    INSERT типа с RETURNING и пакетный INSERT единиц, без повторной выборки.
+    """
     type_data = inventory_data.model_dump(exclude={'initial_quantity'})
-    db_inventory_type = InventoryType(**type_data)
-    db.add(db_inventory_type)
-    await db.flush()  # Получаем ID без коммита
-    
-    # Создаем единицы инвентаря
-    for i in range(inventory_data.initial_quantity):
-        item_name = f"{inventory_data.display_name} #{i + 1}"
-        db_item = InventoryItem(
-            inventory_type_id=db_inventory_type.id,
-            name=item_name,
-            status='available'
-        )
-        db.add(db_item)
+    db_inventory_type = await db.scalar(
+        insert(InventoryType).values(**type_data).returning(InventoryType)
+    )
     
+    await _bulk_insert_items(
+        db, db_inventory_type.id, inventory_data.initial_quantity, inventory_data.display_name
+    )
     await db.commit()
     
-    # Загружаем созданный тип с единицами
-    query = select(InventoryType).options(selectinload(InventoryType.items)).where(InventoryType.id == db_inventory_type.id)
-    result = await db.execute(query)
-    return result.scalar_one()
+    db_inventory_type.items_count = inventory_data.initial_quantity
+    db_inventory_type.available_count = inventory_data.initial_quantity
+    return db_inventory_type
 
 async def update_inventory_type(db: AsyncSession, type_id: int, inventory_type: InventoryTypeUpdate) -> Optional[InventoryType]:
     """Обновить тип инвентаря"""
@@ -145,109 +155,98 @@ async def delete_inventory_item(db: AsyncSession, item_id: int) -> bool:
     await db.commit()
     return result.rowcount > 0
 
-async def create_multiple_inventory_items(db: AsyncSession, type_id: int, quantity: int, base_name: str) -> List[InventoryItem]:
-    """Создать несколько единиц инвентаря одного типа (оптимизированно)"""
-    # Создаем все единицы за один раз
-    items_to_create = []
-    for i in range(quantity):
-        item = InventoryItem(
-            inventory_type_id=type_id,
-            name=f"{base_name} #{i + 1}",
-            status="available"
-        )
-        items_to_create.append(item)
-    
-    # Добавляем все единицы в сессию
-    db.add_all(items_to_create)
+def _item_rows(type_id: int, quantity: int, base_name: str, start_number: int = 1) -> List[Dict[str, Any]]:
+    return [
+        {
+            "inventory_type_id": type_id,
+            "name": f"{base_name} #{start_number + i}",
+            "status": "available",
+            "condition": "good",
+            "is_active": True,
+        }
+        for i in range(quantity)
+    ]
+
+async def _bulk_insert_items(
+    db: AsyncSession,
+    type_id: int,
+    quantity: int,
+    base_name: str,
+    returning: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    Пакетная вставка единиц (executemany; SQLAlchemy склеивает строки в многострочные
+    INSERT ... VALUES страницами по 1000). С returning=True возвращает строки как словари.
+    """
+    rows = _item_rows(type_id, quantity, base_name)
+    if not rows:
+        return []
+    statement = insert(InventoryItem.__table__)
+    if not returning:
+        await db.execute(statement, rows)
+        return []
+    result = await db.execute(statement.returning(*InventoryItem.__table__.c), rows)
+    return [dict(row._mapping) for row in result]
+
+async def create_multiple_inventory_items(db: AsyncSession, type_id: int, quantity: int, base_name: str) -> List[Dict[str, Any]]:
+    """
+    Создать несколько единиц инвентаря одного типа пакетным INSERT ... RETURNING.
+    Возвращает легкие DTO (словари с колонками единиц) без повторной выборки и загрузки типа.
+    """
+    created_items = await _bulk_insert_items(db, type_id, quantity, base_name, returning=True)
     await db.commit()
-    
-    # Загружаем созданные единицы с типом инвентаря
-    created_ids = [item.id for item in items_to_create]
-    query = select(InventoryItem).options(selectinload(InventoryItem.inventory_type)).where(
-        InventoryItem.id.in_(created_ids)
-    )
-    result = await db.execute(query)
-    return result.scalars().all()
+    return created_items
 
 # Статистика инвентаря
+INVENTORY_STAT_STATUSES = ('available', 'in_use', 'servicing', 'repair')
+
 async def get_inventory_stats(db: AsyncSession) -> Dict[str, Any]:
-    """Получить статистику инвентаря"""
-    # Общая статистика - только для критически важного инвентаря (affects_availability = True)
-    total_types_query = select(func.count(InventoryType.id)).where(InventoryType.is_active == True)
-    
-    # Для общих счетчиков считаем только критически важный инвентарь
-    critical_items_base = select(InventoryItem).join(InventoryType).where(
-        and_(
-            InventoryType.is_active == True,
-            InventoryType.affects_availability == True
-        )
-    )
-    
-    total_items_query = select(func.count()).select_from(critical_items_base.subquery())
-    available_items_query = select(func.count()).select_from(
-        critical_items_base.where(InventoryItem.status == 'available').subquery()
-    )
-    in_use_items_query = select(func.count()).select_from(
-        critical_items_base.where(InventoryItem.status == 'in_use').subquery()
-    )
-    servicing_items_query = select(func.count()).select_from(
-        critical_items_base.where(InventoryItem.status == 'servicing').subquery()
-    )
-    repair_items_query = select(func.count()).select_from(
-        critical_items_base.where(InventoryItem.status == 'repair').subquery()
-    )
-    
-    total_types = (await db.execute(total_types_query)).scalar()
-    total_items = (await db.execute(total_items_query)).scalar()
-    available_items = (await db.execute(available_items_query)).scalar()
-    in_use_items = (await db.execute(in_use_items_query)).scalar()
-    servicing_items = (await db.execute(servicing_items_query)).scalar()
-    repair_items = (await db.execute(repair_items_query)).scalar()
-    
-    print(f"🔍 DEBUG: Статистика критически важного инвентаря:")
-    print(f"  - Всего единиц: {total_items}")
-    print(f"  - Доступно: {available_items}")
-    print(f"  - В использовании: {in_use_items}")
-    
-    # Статистика по типам - упрощенный запрос
+    """
+    Получить статистику инвентаря одним запросом: COUNT(*) FILTER по статусам для каждого
+    активного типа. Общие счетчики - только по критически важному инвентарю
+    (affects_availability = True), они суммируются из строк по типам.
+    """
     by_type_query = select(
+        InventoryType.id,
         InventoryType.name,
         InventoryType.display_name,
+        InventoryType.affects_availability,
+        InventoryType.board_equivalent,
         func.count(InventoryItem.id).label('total'),
-        func.sum(case((InventoryItem.status == 'available', 1), else_=0)).label('available'),
-        func.sum(case((InventoryItem.status == 'in_use', 1), else_=0)).label('in_use'),
-        func.sum(case((InventoryItem.status == 'servicing', 1), else_=0)).label('servicing'),
-        func.sum(case((InventoryItem.status == 'repair', 1), else_=0)).label('repair')
+        *[
+            func.count(InventoryItem.id).filter(InventoryItem.status == item_status).label(item_status)
+            for item_status in INVENTORY_STAT_STATUSES
+        ]
     ).select_from(
         InventoryType.__table__.outerjoin(InventoryItem.__table__, InventoryType.id == InventoryItem.inventory_type_id)
     ).where(
         InventoryType.is_active == True
-    ).group_by(InventoryType.id, InventoryType.name, InventoryType.display_name)
+    ).group_by(InventoryType.id)
     
-    by_type_result = await db.execute(by_type_query)
-    by_type = {}
+    rows = (await db.execute(by_type_query)).all()
     
-    print(f"🔍 DEBUG: Результаты запроса статистики по типам:")
-    for row in by_type_result:
-        print(f"  - {row.name} ({row.display_name}): total={row.total}, available={row.available}, in_use={row.in_use}, servicing={row.servicing}, repair={row.repair}")
+    by_type = {}
+    totals = {'total': 0, **{item_status: 0 for item_status in INVENTORY_STAT_STATUSES}}
+    for row in rows:
         by_type[row.name] = {
+            "id": row.id,
             "display_name": row.display_name,
-            "total": int(row.total or 0),
-            "available": int(row.available or 0),
-            "in_use": int(row.in_use or 0),
-            "servicing": int(row.servicing or 0),
-            "repair": int(row.repair or 0)
+            "affects_availability": bool(row.affects_availability),
+            "board_equivalent": float(row.board_equivalent or 0),
+            "total": row.total,
+            **{item_status: getattr(row, item_status) for item_status in INVENTORY_STAT_STATUSES}
         }
-    
-    print(f"🔍 DEBUG: Итоговая статистика by_type: {by_type}")
+        if row.affects_availability:
+            for key in totals:
+                totals[key] += getattr(row, key)
     
     return {
-        'total_types': total_types,
-        'total_items': total_items,
-        'available_items': available_items,
-        'in_use_items': in_use_items,
-        'servicing_items': servicing_items,
-        'repair_items': repair_items,
+        'total_types': len(rows),
+        'total_items': totals['total'],
+        'available_items': totals['available'],
+        'in_use_items': totals['in_use'],
+        'servicing_items': totals['servicing'],
+        'repair_items': totals['repair'],
         'by_type': by_type
     }
 
@@ -270,36 +269,57 @@ async def get_available_inventory_counts(db: AsyncSession) -> Dict[str, int]:
     return {row.name: row.available_count for row in result}
 
 async def reserve_inventory_items(db: AsyncSession, reservations: Dict[str, int], booking_id: str) -> Dict[str, List[int]]:
-    """Зарезервировать единицы инвентаря для бронирования"""
+    """
+    Зарезервировать единицы инвентаря для бронирования.
+
+    Все типы резервируются в одной транзакции, на каждый тип - один
+    UPDATE ... WHERE id IN (SELECT ... FOR UPDATE SKIP LOCKED LIMIT n) RETURNING id:
+    единицы, которые в этот момент резервирует параллельный запрос, пропускаются,
+    поэтому одна доска не может попасть в два бронирования. Если какого-то типа
+    не хватает - транзакция откатывается целиком и выбрасывается ValueError.
+    Снимок статистики инвентаря в Redis функция не сбрасывает (у CRUD нет Redis-клиента):
+    вызывающий код должен вызвать services.inventory_stats_cache.invalidate_inventory_stats,
+    иначе снимок устареет до истечения INVENTORY_STATS_TTL.
+    """
     reserved_items = {}
     
-    for type_name, quantity in reservations.items():
-        # Находим доступные единицы этого типа
-        query = select(InventoryItem.id).join(InventoryType).where(
-            and_(
-                InventoryType.name == type_name,
-                InventoryItem.status == 'available'
+    try:
+        for type_name, quantity in reservations.items():
+            if quantity <= 0:
+                continue
+            
+            candidates = (
+                select(InventoryItem.id)
+                .where(
+                    and_(
+                        InventoryItem.inventory_type_id.in_(
+                            select(InventoryType.id).where(InventoryType.name == type_name)
+                        ),
+                        InventoryItem.status == 'available'
+                    )
+                )
+                .order_by(InventoryItem.id)
+                .limit(quantity)
+                .with_for_update(skip_locked=True)
+                .scalar_subquery()
             )
-        ).limit(quantity)
-        
-        result = await db.execute(query)
-        available_items = result.scalars().all()
-        
-        if len(available_items) < quantity:
-            # Не хватает инвентаря - откатываем все изменения
-            await db.rollback()
-            raise ValueError(f"Недостаточно единиц типа {type_name}: требуется {quantity}, доступно {len(available_items)}")
-        
-        # Резервируем единицы
-        update_query = update(InventoryItem).where(
-            InventoryItem.id.in_(available_items)
-        ).values(
-            status='booked',
-            current_booking_id=booking_id
-        )
-        
-        await db.execute(update_query)
-        reserved_items[type_name] = available_items
+            result = await db.execute(
+                update(InventoryItem)
+                .where(InventoryItem.id.in_(candidates))
+                .values(status='booked', current_booking_id=booking_id)
+                .returning(InventoryItem.id)
+                .execution_options(synchronize_session=False)
+            )
+            item_ids = sorted(result.scalars().all())
+            
+            if len(item_ids) < quantity:
+                # Не хватает инвентаря - откатываем резервирование всех типов
+                raise ValueError(f"Недостаточно единиц типа {type_name}: требуется {quantity}, доступно {len(item_ids)}")
+            
+            reserved_items[type_name] = item_ids
+    except Exception:
+        await db.rollback()
+        raise
     
     await db.commit()
-    return reserved_items 
\ No newline at end of file
+    return reserved_items
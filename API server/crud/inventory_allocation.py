@@ -0,0 +1,203 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, delete, update, func, and_, literal, exists
+from sqlalchemy.dialects.postgresql import Range, insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from models.booking import Booking
+from models.inventory_allocation import InventoryAllocation
+from models.inventory_type import InventoryType, InventoryItem
+
+# Бронирования в этих статусах держат за собой конкретные единицы
+ALLOCATING_BOOKING_STATUSES = ('confirmed', 'in_use')
+# Время на обслуживание инвентаря после аренды (как в расчете доступности слотов)
+SERVICE_BUFFER = timedelta(hours=1)
+# Единицы в этих статусах не выдаются независимо от календаря
+UNAVAILABLE_ITEM_STATUSES = ('repair', 'servicing')
+
+
+class AllocationConflict(ValueError):
+    """Недостаточно свободных единиц на интервал бронирования"""
+
+
+def booking_period(booking: Booking) -> Range:
+    """Интервал занятости инвентаря бронированием: [начало, конец + обслуживание)"""
+    start = booking.planned_start_time
+    end = start + timedelta(hours=booking.duration_in_hours) + SERVICE_BUFFER
+    return Range(start, end, bounds='[)')
+
+
+def _period(start: datetime, end: datetime) -> Range:
+    return Range(start, end, bounds='[)')
+
+
+def _is_free(period: Range):
+    """Единица не занята ни одним интервалом, пересекающимся с period"""
+    return ~exists().where(
+        and_(
+            InventoryAllocation.item_id == InventoryItem.id,
+            InventoryAllocation.period.overlaps(period)
+        )
+    )
+
+
+def _allocatable_items(period: Range):
+    return and_(
+        InventoryItem.is_active == True,
+        InventoryItem.status.notin_(UNAVAILABLE_ITEM_STATUSES),
+        _is_free(period)
+    )
+
+
+async def allocate_booking_items(db: AsyncSession, booking: Booking) -> Dict[str, List[int]]:
+    """
+    Закрепить за бронированием конкретные единицы по selected_items ({type_id: quantity}).
+    На каждый тип - один INSERT ... SELECT свободных единиц; пересечения интервалов одной
+    единицы отсекает exclusion-ограничение (ON CONFLICT DO NOTHING при гонке).
+    Не коммитит: при нехватке единиц выбрасывает AllocationConflict, вызывающий код откатывает транзакцию.
+    """
+    await release_booking_items(db, booking.id)
+    if not booking.selected_items:
+        # Старые бронирования без selected_items в календарь не попадают
+        return {}
+
+    period = booking_period(booking)
+    allocated: Dict[str, List[int]] = {}
+    for type_id, quantity in booking.selected_items.items():
+        quantity = int(quantity or 0)
+        if quantity <= 0:
+            continue
+
+        candidates = (
+            select(InventoryItem.id, literal(booking.id), literal(period, InventoryAllocation.period.type))
+            .where(
+                and_(
+                    InventoryItem.inventory_type_id == int(type_id),
+                    _allocatable_items(period)
+                )
+            )
+            .order_by(InventoryItem.id)
+            .limit(quantity)
+        )
+        result = await db.execute(
+            pg_insert(InventoryAllocation)
+            .from_select(['item_id', 'booking_id', 'period'], candidates)
+            .on_conflict_do_nothing()
+            .returning(InventoryAllocation.item_id)
+        )
+        item_ids = sorted(result.scalars().all())
+        if len(item_ids) < quantity:
+            raise AllocationConflict(
+                f"Недостаточно свободных единиц типа {type_id}: требуется {quantity}, свободно {len(item_ids)}"
+            )
+        allocated[str(type_id)] = item_ids
+    return allocated
+
+
+async def has_booking_items(db: AsyncSession, booking_id: int) -> bool:
+    """Есть ли у бронирования закрепленные единицы"""
+    result = await db.execute(
+        select(exists().where(InventoryAllocation.booking_id == booking_id))
+    )
+    return bool(result.scalar())
+
+
+async def release_booking_items(db: AsyncSession, booking_id: int) -> int:
+    """Освободить все единицы бронирования (отмена, перенос). Не коммитит"""
+    result = await db.execute(
+        delete(InventoryAllocation).where(InventoryAllocation.booking_id == booking_id)
+    )
+    return result.rowcount
+
+
+async def finish_booking_items(db: AsyncSession, booking_id: int, finished_at: Optional[datetime] = None) -> int:
+    """
+    Бронирование завершено раньше срока: интервалы обрезаются до момента завершения,
+    будущие - удаляются. Не коммитит.
+    """
+    finished_at = finished_at or datetime.now(timezone.utc)
+    removed = await db.execute(
+        delete(InventoryAllocation).where(
+            and_(
+                InventoryAllocation.booking_id == booking_id,
+                func.lower(InventoryAllocation.period) >= finished_at
+            )
+        )
+    )
+    trimmed = await db.execute(
+        update(InventoryAllocation)
+        .where(
+            and_(
+                InventoryAllocation.booking_id == booking_id,
+                func.upper(InventoryAllocation.period) > finished_at
+            )
+        )
+        .values(period=func.tstzrange(func.lower(InventoryAllocation.period), finished_at, '[)'))
+        .execution_options(synchronize_session=False)
+    )
+    return removed.rowcount + trimmed.rowcount
+
+
+async def sync_booking_allocation(
+    db: AsyncSession,
+    booking: Booking,
+    previous_status: Optional[str] = None,
+    schedule_changed: bool = False
+):
+    """
+    Привести календарь в соответствие с бронированием после изменения (до commit):
+    - подтверждено - единицы закрепляются (повторно - только если изменились время или состав,
+      либо у бронирования еще нет закрепленных единиц: подтвержденные до появления календаря);
+    - завершено - интервалы обрезаются моментом возврата;
+    - остальные статусы - единицы освобождаются.
+    """
+    if booking.status in ALLOCATING_BOOKING_STATUSES:
+        # confirmed -> in_use: выданные единицы остаются теми же
+        if (
+            previous_status not in ALLOCATING_BOOKING_STATUSES
+            or schedule_changed
+            or not await has_booking_items(db, booking.id)
+        ):
+            await allocate_booking_items(db, booking)
+    elif booking.status == 'completed':
+        if previous_status != 'completed':
+            await finish_booking_items(db, booking.id, booking.time_returned_by_client)
+    elif booking.status != previous_status or schedule_changed:
+        await release_booking_items(db, booking.id)
+
+
+async def get_free_items(
+    db: AsyncSession,
+    start: datetime,
+    end: datetime,
+    type_id: Optional[int] = None
+) -> List[InventoryItem]:
+    """Какие конкретные единицы свободны на всем интервале [start, end)"""
+    query = (
+        select(InventoryItem)
+        .options(selectinload(InventoryItem.inventory_type))
+        .where(_allocatable_items(_period(start, end)))
+    )
+    if type_id:
+        query = query.where(InventoryItem.inventory_type_id == type_id)
+    result = await db.execute(query.order_by(InventoryItem.inventory_type_id, InventoryItem.id))
+    return result.scalars().all()
+
+
+async def count_free_items_by_type(db: AsyncSession, start: datetime, end: datetime) -> Dict[str, int]:
+    """Количество свободных на интервале единиц по активным типам (ключ - имя типа)"""
+    query = (
+        select(InventoryType.name, func.count(InventoryItem.id).label('free_count'))
+        .select_from(InventoryType.__table__.join(InventoryItem.__table__))
+        .where(
+            and_(
+                InventoryType.is_active == True,
+                _allocatable_items(_period(start, end))
+            )
+        )
+        .group_by(InventoryType.id, InventoryType.name)
+    )
+    result = await db.execute(query)
+    return {row.name: row.free_count for row in result}
@@ -0,0 +1,180 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, delete, insert, func, and_
+from typing import List, Optional, Dict, Any, Iterable
+from datetime import datetime, timedelta, timezone
+
+from models.push_outbox import PushOutbox
+
+
+class CRUDPushOutbox:
+    """CRUD операции для очереди исходящих push-уведомлений"""
+
+    async def enqueue(
+        self,
+        db: AsyncSession,
+        *,
+        subscription_ids: Iterable[int],
+        payload: Dict[str, Any],
+        notification_type: Optional[str] = None,
+        ttl: int = 86400,
+        urgency: str = "normal",
+        topic: Optional[str] = None
+    ) -> int:
+        """
+        Ставит уведомление в очередь для списка подписок одним INSERT.
+        Коммит делает вызывающий код.
+        """
+        rows = [
+            {
+                "subscription_id": sub_id,
+                "payload": payload,
+                "notification_type": notification_type,
+                "ttl": ttl,
+                "urgency": urgency,
+                "topic": topic,
+                "status": PushOutbox.STATUS_PENDING,
+                "attempts": 0,
+            }
+            for sub_id in subscription_ids
+        ]
+        if not rows:
+            return 0
+
+        await db.execute(insert(PushOutbox), rows)
+        return len(rows)
+
+    async def claim_batch(
+        self,
+        db: AsyncSession,
+        *,
+        limit: int,
+        lease_seconds: int,
+        max_attempts: int
+    ) -> List[PushOutbox]:
+        """
+        Захватывает пачку готовых к отправке записей.
+
+        FOR UPDATE SKIP LOCKED позволяет нескольким воркерам разбирать очередь
+        без блокировок друг друга. Захваченная запись получает status='sending'
+        и next_attempt_at = now() + lease: если процесс упадет посреди отправки,
+        запись снова станет доступной после истечения аренды - но не больше
+        max_attempts раз. Записи с истекшей арендой и исчерпанными попытками
+        (например, уведомление, на котором процесс падает) переводятся в failed.
+        """
+        now = func.now()
+        await db.execute(
+            update(PushOutbox)
+            .where(
+                and_(
+                    PushOutbox.status == PushOutbox.STATUS_SENDING,
+                    PushOutbox.next_attempt_at <= now,
+                    PushOutbox.attempts >= max_attempts
+                )
+            )
+            .values(status=PushOutbox.STATUS_FAILED, last_error="lease_expired")
+            .execution_options(synchronize_session=False)
+        )
+        ready = (
+            select(PushOutbox.id)
+            .where(
+                and_(
+                    PushOutbox.status.in_([PushOutbox.STATUS_PENDING, PushOutbox.STATUS_SENDING]),
+                    PushOutbox.next_attempt_at <= now,
+                    PushOutbox.attempts < max_attempts
+                )
+            )
+            .order_by(PushOutbox.next_attempt_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        result = await db.execute(
+            update(PushOutbox)
+            .where(PushOutbox.id.in_(ready))
+            .values(
+                status=PushOutbox.STATUS_SENDING,
+                attempts=PushOutbox.attempts + 1,
+                next_attempt_at=now + timedelta(seconds=lease_seconds)
+            )
+            .returning(PushOutbox)
+            .execution_options(synchronize_session=False)
+        )
+        claimed = list(result.scalars().all())
+        await db.commit()
+        return claimed
+
+    async def mark_sent(self, db: AsyncSession, *, ids: List[int]) -> int:
+        """Отмечает записи как доставленные"""
+        if not ids:
+            return 0
+        result = await db.execute(
+            update(PushOutbox)
+            .where(PushOutbox.id.in_(ids))
+            .values(status=PushOutbox.STATUS_SENT, sent_at=func.now(), last_error=None)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount
+
+    async def mark_final(self, db: AsyncSession, *, ids: List[int], status: str, error: Optional[str] = None) -> int:
+        """Переводит записи в финальный статус (failed / expired)"""
+        if not ids:
+            return 0
+        result = await db.execute(
+            update(PushOutbox)
+            .where(PushOutbox.id.in_(ids))
+            .values(status=status, last_error=error)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount
+
+    async def reschedule(self, db: AsyncSession, *, retries: List[Dict[str, Any]]) -> int:
+        """
+        Возвращает записи в очередь с индивидуальным временем следующей попытки.
+        retries: [{"id": ..., "next_attempt_at": datetime, "last_error": str, "attempts": int?}, ...]
+        "attempts" передается, когда отложенная запись не должна расходовать попытку.
+        Выполняется executemany по первичному ключу.
+        """
+        if not retries:
+            return 0
+        rows = []
+        for item in retries:
+            row = {
+                "id": item["id"],
+                "status": PushOutbox.STATUS_PENDING,
+                "next_attempt_at": item["next_attempt_at"],
+                "last_error": item.get("last_error"),
+            }
+            if "attempts" in item:
+                row["attempts"] = item["attempts"]
+            rows.append(row)
+        await db.execute(update(PushOutbox), rows)
+        return len(rows)
+
+    async def purge_finished(self, db: AsyncSession, *, older_than_hours: int) -> int:
+        """Удаляет старые записи в финальных статусах"""
+        cutoff = datetime.now(timezone.utc) - timedelta(hours=older_than_hours)
+        result = await db.execute(
+            delete(PushOutbox).where(
+                and_(
+                    PushOutbox.status.in_([
+                        PushOutbox.STATUS_SENT,
+                        PushOutbox.STATUS_FAILED,
+                        PushOutbox.STATUS_EXPIRED
+                    ]),
+                    PushOutbox.created_at < cutoff
+                )
+            )
+        )
+        await db.commit()
+        return result.rowcount
+
+    async def get_status_counts(self, db: AsyncSession) -> Dict[str, int]:
+        """Количество записей в очереди по статусам"""
+        result = await db.execute(
+            select(PushOutbox.status, func.count(PushOutbox.id)).group_by(PushOutbox.status)
+        )
+        return {status: count for status, count in result.all()}
+
+
+# Создаем экземпляр для использования
+crud_push_outbox = CRUDPushOutbox()
@@ -1,16 +1,31 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import and_, or_, select
-from typing import List, Optional, Dict, Any
+from sqlalchemy import and_, or_, select, update, delete, func, any_, literal, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
+from typing import List, Optional, Dict, Any, AsyncIterator
 from datetime import datetime, timedelta
 import json
 
 from models.push_subscription import PushSubscription
 from schemas.push_subscription import PushSubscriptionCreate, PushSubscriptionUpdate
 
+
+def _id_array(ids: List[int]):
+    """Один bind-параметр integer[] для выражений вида id = ANY(:ids)"""
+    return literal(list(ids), type_=ARRAY(Integer))
+
+
 class CRUDPushSubscription:
-    async def create(self, db: AsyncSession, *, obj_in: PushSubscriptionCreate, ip_address: Optional[str] = None) -> PushSubscription:
+    async def create(
+        self,
+        db: AsyncSession,
+        *,
+        obj_in: PushSubscriptionCreate,
+        ip_address: Optional[str] = None,
+        user_id: Optional[int] = None
+    ) -> PushSubscription:
         """Создать новую подписку"""
         db_obj = PushSubscription(
+            user_id=user_id,
             endpoint=obj_in.endpoint,
             p256dh=obj_in.keys.p256dh,
             auth=obj_in.keys.auth,
@@ -27,7 +42,16 @@ class CRUDPushSubscription:
         """Получить подписку по ID"""
         result = await db.execute(select(PushSubscription).filter(PushSubscription.id == id))
         return result.scalar_one_or_none()
-    
+
+    async def get_by_ids(self, db: AsyncSession, ids: List[int]) -> List[PushSubscription]:
+        """Получить подписки по списку ID одним запросом"""
+        if not ids:
+            return []
+        result = await db.execute(
+            select(PushSubscription).filter(PushSubscription.id == any_(_id_array(ids)))
+        )
+        return result.scalars().all()
+
     async def get_by_endpoint(self, db: AsyncSession, endpoint: str) -> Optional[PushSubscription]:
         """Получить подписку по endpoint"""
         result = await db.execute(select(PushSubscription).filter(PushSubscription.endpoint == endpoint))
@@ -45,19 +69,93 @@ class CRUDPushSubscription:
         )
         return result.scalars().all()
     
+    async def iter_active(
+        self,
+        db: AsyncSession,
+        *,
+        notification_type: Optional[str] = None,
+        batch_size: int = 500
+    ) -> AsyncIterator[List[PushSubscription]]:
+        """
+        Потоково отдает активные подписки пачками (keyset-пагинация по id).
+        В отличие от offset/limit, каждая пачка стоит O(batch_size) независимо от глубины.
+        """
+        conditions = [
+            PushSubscription.is_active == True,
+            PushSubscription.notifications_enabled == True
+        ]
+        if notification_type:
+            conditions.append(self._accepts_type(notification_type))
+
+        last_id = 0
+        while True:
+            result = await db.execute(
+                select(PushSubscription).filter(
+                    and_(PushSubscription.id > last_id, *conditions)
+                ).order_by(PushSubscription.id).limit(batch_size)
+            )
+            batch = result.scalars().all()
+            if not batch:
+                return
+            yield batch
+            if len(batch) < batch_size:
+                return
+            last_id = batch[-1].id
+
+    @staticmethod
+    def _accepts_type(notification_type: str):
+        """Условие: подписка принимает тип уведомлений (NULL в notification_types = все типы)"""
+        return or_(
+            PushSubscription.notification_types.is_(None),
+            PushSubscription.notification_types.contains([notification_type])
+        )
+
     async def get_by_notification_type(self, db: AsyncSession, notification_type: str, skip: int = 0, limit: int = 100) -> List[PushSubscription]:
         """Получить подписки, которые хотят получать определенный тип уведомлений"""
-        # Временно упрощаем - получаем все активные подписки
-        # TODO: добавить фильтрацию по типам уведомлений после исправления схемы БД
         result = await db.execute(
             select(PushSubscription).filter(
                 and_(
                     PushSubscription.is_active == True,
-                    PushSubscription.notifications_enabled == True
+                    PushSubscription.notifications_enabled == True,
+                    self._accepts_type(notification_type)
                 )
-            ).offset(skip).limit(limit)
+            ).order_by(PushSubscription.id).offset(skip).limit(limit)
         )
         return result.scalars().all()
+
+    async def get_owner_subscription_ids(
+        self,
+        db: AsyncSession,
+        *,
+        user_id: int,
+        notification_type: Optional[str] = None,
+        include_unowned: bool = False
+    ) -> List[int]:
+        """
+        ID активных подписок одного владельца (с include_unowned - и подписок без владельца).
+        Идет по индексу (user_id, is_active) - стоимость O(устройств владельца), типы проверяются по строкам.
+        """
+        owner_condition = PushSubscription.user_id == user_id
+        if include_unowned:
+            owner_condition = or_(owner_condition, PushSubscription.user_id.is_(None))
+        conditions = [
+            owner_condition,
+            PushSubscription.is_active == True,
+            PushSubscription.notifications_enabled == True
+        ]
+        if notification_type:
+            conditions.append(self._accepts_type(notification_type))
+        result = await db.execute(
+            select(PushSubscription.id).filter(and_(*conditions)).order_by(PushSubscription.id)
+        )
+        return list(result.scalars().all())
+
+    async def set_owner(self, db: AsyncSession, *, db_obj: PushSubscription, user_id: Optional[int]) -> PushSubscription:
+        """Привязать подписку к владельцу"""
+        db_obj.user_id = user_id
+        await db.commit()
+        await db.refresh(db_obj)
+        return db_obj
     
     async def get_multi(self, db: AsyncSession, skip: int = 0, limit: int = 100) -> List[PushSubscription]:
         """Получить все подписки"""
@@ -93,19 +191,40 @@ class CRUDPushSubscription:
             await db.commit()
             return True
         return False
-    
+
+    async def update_last_notification_many(self, db: AsyncSession, *, subscription_ids: List[int]) -> int:
+        """Обновить время последнего уведомления у пачки подписок одним UPDATE"""
+        if not subscription_ids:
+            return 0
+        result = await db.execute(
+            update(PushSubscription)
+            .where(PushSubscription.id == any_(_id_array(subscription_ids)))
+            .values(last_notification_sent=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount
+
     async def deactivate(self, db: AsyncSession, *, subscription_id: int) -> bool:
         """Деактивировать подписку (при ошибках отправки)"""
+        deactivated = await self.deactivate_many(db, subscription_ids=[subscription_id])
+        await db.commit()
+        return deactivated > 0
+
+    async def deactivate_many(self, db: AsyncSession, *, subscription_ids: List[int]) -> int:
+        """
+        Деактивировать пачку подписок одним UPDATE ... WHERE id = ANY(:ids)
+        (например, после ответов 404/410). Коммит делает вызывающий код.
+        """
+        if not subscription_ids:
+            return 0
         result = await db.execute(
-            select(PushSubscription).filter(PushSubscription.id == subscription_id)
+            update(PushSubscription)
+            .where(PushSubscription.id == any_(_id_array(subscription_ids)))
+            .values(is_active=False)
+            .execution_options(synchronize_session=False)
         )
-        subscription = result.scalar_one_or_none()
-        if subscription:
-            subscription.is_active = False
-            await db.commit()
-            return True
-        return False
-    
+        return result.rowcount
+
     async def delete(self, db: AsyncSession, *, id: int) -> Optional[PushSubscription]:
         """Удалить подписку"""
         result = await db.execute(select(PushSubscription).filter(PushSubscription.id == id))
@@ -116,52 +235,42 @@ class CRUDPushSubscription:
         return obj
     
     async def cleanup_old_subscriptions(self, db: AsyncSession, days_old: int = 30) -> int:
-        """Очистить старые неактивные подписки"""
+        """Очистить старые неактивные подписки одним DELETE ... RETURNING"""
         cutoff_date = datetime.utcnow() - timedelta(days=days_old)
         result = await db.execute(
-            select(PushSubscription).filter(
+            delete(PushSubscription)
+            .where(
                 and_(
                     PushSubscription.is_active == False,
                     PushSubscription.updated_at < cutoff_date
                 )
             )
+            .returning(PushSubscription.id)
         )
-        old_subscriptions = result.scalars().all()
-        
-        for subscription in old_subscriptions:
-            await db.delete(subscription)
-        
+        removed_ids = result.scalars().all()
         await db.commit()
-        return len(old_subscriptions)
+        return len(removed_ids)
     
     async def get_statistics(self, db: AsyncSession) -> Dict[str, Any]:
-        """Получить статистику по подпискам"""
-        # Общее количество
-        total_result = await db.execute(select(PushSubscription))
-        total = len(total_result.scalars().all())
-        
-        # Активные
-        active_result = await db.execute(
-            select(PushSubscription).filter(PushSubscription.is_active == True)
+        """Получить статистику по подпискам одним агрегирующим запросом (COUNT ... FILTER)"""
+        enabled_condition = and_(
+            PushSubscription.is_active == True,
+            PushSubscription.notifications_enabled == True
         )
-        active = len(active_result.scalars().all())
-        
-        # С включенными уведомлениями
-        enabled_result = await db.execute(
-            select(PushSubscription).filter(
-                and_(
-                    PushSubscription.is_active == True,
-                    PushSubscription.notifications_enabled == True
-                )
+        result = await db.execute(
+            select(
+                func.count(PushSubscription.id).label("total"),
+                func.count(PushSubscription.id).filter(PushSubscription.is_active == True).label("active"),
+                func.count(PushSubscription.id).filter(enabled_condition).label("enabled")
             )
         )
-        enabled = len(enabled_result.scalars().all())
+        row = result.one()
         
         return {
-            "total_subscriptions": total,
-            "active_subscriptions": active,
-            "enabled_subscriptions": enabled,
-            "disabled_subscriptions": total - enabled
+            "total_subscriptions": row.total,
+            "active_subscriptions": row.active,
+            "enabled_subscriptions": row.enabled,
+            "disabled_subscriptions": row.total - row.enabled
         }
 
 # Создаем экземпляр для использования
@@ -99,6 +99,13 @@ class CRUDUser:
         await db.refresh(db_user)
         return db_user
     
+    async def is_avatar_used_by_others(self, db: AsyncSession, avatar_url: str, user_id: int) -> bool:
+        """Проверить, используется ли файл аватара другими пользователями (одинаковые картинки хранятся один раз)"""
+        result = await db.execute(
+            select(User.id).where(and_(User.avatar == avatar_url, User.id != user_id)).limit(1)
+        )
+        return result.scalar_one_or_none() is not None
+    
     async def delete_user(self, db: AsyncSession, user_id: int) -> bool:
         """Удалить пользователя (мягкое удаление)"""
         db_user = await self.get_user(db, user_id)
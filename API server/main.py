@@ -1,5 +1,4 @@
 from fastapi import FastAPI, Request, status, Depends
-from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 import os
 from fastapi.middleware.cors import CORSMiddleware
@@ -13,8 +12,13 @@ import redis.asyncio as redis
 
 
 from api.v1.api import api_router as api_v1_router # Импортируем наш агрегатор V1
+from api.static import router as static_router
 from core.logging_config import setup_logging
 from db.session import get_db_session, async_engine
+from services.push_outbox_dispatcher import get_push_outbox_dispatcher
+from services.avatar_service import shutdown_avatar_pool
+from services.customer_stats_reconciler import get_customer_stats_reconciler
+from services.customer_search_index import customer_search_index
 
 # Загрузка переменных окружения из .env файла
 load_dotenv() 
@@ -49,12 +53,30 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"Не удалось подключиться к Redis/DragonflyDB: {e}")
         redis_client = None # Устанавливаем в None, если не удалось подключиться
+    # Клиент для зависимостей (core.dependencies.get_redis_client)
+    app.state.redis_client = redis_client
     # ---> Конец инициализации Redis < ---
 
+    # Версии клиентов для индекса автодополнения общие для всех воркеров - в Redis
+    customer_search_index.use_redis(redis_client)
+
+    # ---> Запуск диспетчера очереди push-уведомлений < ---
+    push_outbox_dispatcher = get_push_outbox_dispatcher()
+    push_outbox_dispatcher.use_redis(redis_client)
+    await push_outbox_dispatcher.start()
+
+    # ---> Периодическая сверка статистики клиентов с бронированиями < ---
+    customer_stats_reconciler = get_customer_stats_reconciler()
+    await customer_stats_reconciler.start()
+
     yield # Приложение работает
 
     logger.info("Приложение останавливается...")
 
+    await push_outbox_dispatcher.stop()
+    await customer_stats_reconciler.stop()
+    shutdown_avatar_pool()
+
     if redis_client:
         await redis_client.close()
         logger.info("Соединение с Redis/DragonflyDB закрыто.")
@@ -131,8 +153,8 @@ async def preflight_handler(request: Request, full_path: str):
         "Access-Control-Allow-Credentials": "true"
     })
 
-# Добавляем статические файлы для аватаров
-app.mount("/static", StaticFiles(directory="data"), name="static")
+# Статические файлы (аватары): ETag, immutable-кэш, Range, X-Accel-Redirect в продакшне
+app.include_router(static_router)
 
 
 @app.exception_handler(RequestValidationError)
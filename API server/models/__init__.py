@@ -8,7 +8,9 @@ from .board_booking import BoardBooking
 from .user import User
 from .customer import Customer
 from .push_subscription import PushSubscription
+from .push_outbox import PushOutbox
 from .inventory_type import InventoryType, InventoryItem
+from .inventory_allocation import InventoryAllocation
 from .security import DeviceSession, RateLimitEntry, BlockedIP, SecurityLog
 
 __all__ = [
@@ -22,8 +24,10 @@ __all__ = [
     "User",
     "Customer",
     "PushSubscription",
+    "PushOutbox",
     "InventoryType",
     "InventoryItem",
+    "InventoryAllocation",
     "DeviceSession",
     "RateLimitEntry", 
     "BlockedIP",
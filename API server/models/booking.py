@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, JSON, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship, Mapped
 from typing import Optional, TYPE_CHECKING, Dict, Any
@@ -41,6 +41,11 @@ class Booking(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
+    __table_args__ = (
+        # Выборка и переходы статусов по окну времени начала (автоматизация в шедулере)
+        Index('ix_bookings_status_planned_start', 'status', 'planned_start_time'),
+    )
+    
     # Новые связи
     business_owner: Mapped["User"] = relationship("User", back_populates="bookings")
     customer: Mapped["Customer"] = relationship("Customer", back_populates="bookings")
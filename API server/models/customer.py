@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Index, Computed
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship, Mapped
 from typing import List, Optional, TYPE_CHECKING
@@ -8,6 +8,18 @@ if TYPE_CHECKING:
     from .user import User
     from .booking import Booking
 
+# 8XXXXXXXXXX и XXXXXXXXXX приводятся к 7XXXXXXXXXX, остальное - только цифры
+PHONE_NORMALIZED_SQL = r"""
+CASE
+    WHEN length(regexp_replace(phone, '\D', '', 'g')) = 11 AND left(regexp_replace(phone, '\D', '', 'g'), 1) = '8'
+        THEN '7' || substr(regexp_replace(phone, '\D', '', 'g'), 2)
+    WHEN length(regexp_replace(phone, '\D', '', 'g')) = 10
+        THEN '7' || regexp_replace(phone, '\D', '', 'g')
+    ELSE regexp_replace(phone, '\D', '', 'g')
+END
+"""
+
+
 class Customer(Base):
     """
     Модель для клиентов бизнесменов (те, кто арендует SUP доски)
@@ -17,6 +29,10 @@ class Customer(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(255), nullable=False, index=True)
     phone = Column(String(32), nullable=False, index=True)
+    # Только цифры телефона - для поиска по "912 345" / "+7 (912) 345..." в любом формате
+    phone_digits = Column(String(32), Computed(r"regexp_replace(phone, '\D', '', 'g')", persisted=True))
+    # Канонический номер (7XXXXXXXXXX) - ключ уникальности клиента у владельца, см. crud.customer.normalize_phone
+    phone_normalized = Column(String(32), Computed(PHONE_NORMALIZED_SQL, persisted=True))
     email = Column(String(255), nullable=True)
     
     # Связь с бизнесменом
@@ -37,5 +53,16 @@ class Customer(Base):
     business_owner: Mapped["User"] = relationship("User", back_populates="customers")
     bookings: Mapped[List["Booking"]] = relationship("Booking", back_populates="customer")
     
+    __table_args__ = (
+        # Keyset-пагинация списка клиентов владельца: (name, id) и (created_at, id)
+        Index('ix_customers_owner_name_id', 'business_owner_id', 'name', 'id'),
+        Index('ix_customers_owner_created_id', 'business_owner_id', 'created_at', 'id'),
+        # Один клиент на номер у владельца; цель ON CONFLICT при создании бронирования
+        Index('uq_customers_owner_phone_normalized', 'business_owner_id', 'phone_normalized', unique=True),
+        # Поиск по подстроке/префиксу (ILIKE '%..%', LIKE '..%') и нечеткий поиск - pg_trgm
+        Index('ix_customers_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        Index('ix_customers_phone_digits_trgm', 'phone_digits', postgresql_using='gin', postgresql_ops={'phone_digits': 'gin_trgm_ops'}),
+    )
+    
     def __repr__(self):
         return f"<Customer(id={self.id}, name='{self.name}', phone='{self.phone}')>" 
\ No newline at end of file
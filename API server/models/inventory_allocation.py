@@ -0,0 +1,45 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import TSTZRANGE, ExcludeConstraint
+from sqlalchemy.sql import func
+from .base import Base
+
+
+class InventoryAllocation(Base):
+    """
+    Календарь занятости инвентаря: конкретная единица занята бронированием на интервал.
+    Заполняется при подтверждении бронирования. Exclusion-ограничение (GiST) не дает
+    двум интервалам одной единицы пересечься, а вопрос "какие доски свободны с T1 до T2"
+    решается одним индексным запросом по диапазонам.
+    """
+    __tablename__ = "inventory_allocations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    item_id = Column(
+        Integer,
+        ForeignKey("inventory_items.id", ondelete="CASCADE"),
+        nullable=False
+    )
+    booking_id = Column(
+        Integer,
+        ForeignKey("bookings.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True
+    )
+    # [начало, окончание + время на обслуживание)
+    period = Column(TSTZRANGE, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # Требует расширения btree_gist (равенство по item_id в GiST)
+        ExcludeConstraint(
+            (item_id, '='),
+            (period, '&&'),
+            name='ex_inventory_allocations_item_period',
+            using='gist'
+        ),
+        # Поиск занятых единиц на интервал без фильтра по единице
+        Index('ix_inventory_allocations_period', 'period', postgresql_using='gist'),
+    )
+
+    def __repr__(self):
+        return f"<InventoryAllocation(item_id={self.item_id}, booking_id={self.booking_id}, period={self.period})>"
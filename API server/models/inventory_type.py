@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, JSON, ForeignKey, DECIMAL
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, JSON, ForeignKey, DECIMAL, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .base import Base
@@ -46,4 +46,9 @@ class InventoryItem(Base):
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
     # Связи
-    inventory_type = relationship("InventoryType", back_populates="items") 
\ No newline at end of file
+    inventory_type = relationship("InventoryType", back_populates="items")
+
+    __table_args__ = (
+        # Счетчики и выборка единиц типа по статусу (items_count/available_count, резервирование)
+        Index('ix_inventory_items_type_status', 'inventory_type_id', 'status'),
+    ) 
\ No newline at end of file
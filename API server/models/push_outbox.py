@@ -0,0 +1,57 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, JSON, ForeignKey, Index
+from sqlalchemy.sql import func
+from .base import Base
+
+
+class PushOutbox(Base):
+    """
+    Очередь исходящих push-уведомлений (outbox).
+    Одна строка = одно уведомление для одной подписки.
+    Строки переживают рестарт сервера и разбираются диспетчером с повторными попытками.
+    """
+    __tablename__ = "push_outbox"
+
+    # Статусы записи
+    STATUS_PENDING = "pending"    # Ждет отправки (или повторной попытки)
+    STATUS_SENDING = "sending"    # Захвачена диспетчером
+    STATUS_SENT = "sent"          # Доставлена в push-сервис
+    STATUS_FAILED = "failed"      # Исчерпаны попытки / неисправимая ошибка
+    STATUS_EXPIRED = "expired"    # Истек TTL до отправки
+
+    id = Column(Integer, primary_key=True, index=True)
+    subscription_id = Column(
+        Integer,
+        ForeignKey("push_subscriptions.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True
+    )
+
+    # Содержимое уведомления (NotificationPayload.model_dump())
+    payload = Column(JSON, nullable=False)
+    notification_type = Column(String(64), nullable=True)
+
+    # Заголовки Web Push (RFC 8030)
+    ttl = Column(Integer, nullable=False, default=86400)           # Сколько секунд push-сервис хранит сообщение
+    urgency = Column(String(16), nullable=False, default="normal")  # very-low | low | normal | high
+    topic = Column(String(32), nullable=True)                      # Заменяет предыдущее недоставленное с тем же topic
+
+    # Состояние доставки
+    status = Column(String(16), nullable=False, default=STATUS_PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    last_error = Column(Text, nullable=True)
+
+    # Временные метки
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # Основной индекс выборки диспетчера: status + время следующей попытки
+        Index('ix_push_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+    def __repr__(self):
+        return (
+            f"<PushOutbox(id={self.id}, subscription_id={self.subscription_id}, "
+            f"status='{self.status}', attempts={self.attempts})>"
+        )
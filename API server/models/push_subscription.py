@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, JSON, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql import func
 from datetime import datetime
 from .base import Base
@@ -12,6 +13,9 @@ class PushSubscription(Base):
     endpoint = Column(String(512), nullable=False, unique=True, index=True)
     p256dh = Column(String(256), nullable=False)  # Публичный ключ клиента
     auth = Column(String(256), nullable=False)    # Ключ аутентификации
+
+    # Владелец подписки (бизнес-пользователь) - для адресной рассылки по владельцу
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
     
     # Метаданные
     user_agent = Column(String(512), nullable=True)  # Браузер пользователя
@@ -20,12 +24,18 @@ class PushSubscription(Base):
     
     # Настройки уведомлений
     notifications_enabled = Column(Boolean, nullable=False, default=True)
-    notification_types = Column(JSON, nullable=True)  # Какие типы уведомлений включены
+    notification_types = Column(JSONB, nullable=True)  # Какие типы уведомлений включены (NULL = все)
     
     # Временные метки
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     last_notification_sent = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # Выборка подписок одного владельца (и подписок без владельца - user_id IS NULL);
+        # notification_types проверяется по строкам: @> по jsonb btree не ускоряет
+        Index('ix_push_subscriptions_user_active', 'user_id', 'is_active'),
+    )
     
     def __repr__(self):
         return f"<PushSubscription(id={self.id}, endpoint='{self.endpoint[:50]}...', active={self.is_active})>"
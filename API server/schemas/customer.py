@@ -67,4 +67,6 @@ class CustomerListResponse(BaseModel):
     customers: List[Customer]
     total: int
     skip: int
-    limit: int 
\ No newline at end of file
+    limit: int
+    total_is_estimate: bool = False  # total получен по статистике планировщика
+    next_cursor: Optional[str] = None  # Курсор следующей страницы (keyset-пагинация) 
\ No newline at end of file
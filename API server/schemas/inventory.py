@@ -106,5 +106,5 @@ class InventoryTypeQuickCreate(BaseModel):
     color: Optional[str] = None
     affects_availability: bool = False  # По умолчанию НЕ влияет на доступность (аксессуары)
     board_equivalent: float = 0.0       # По умолчанию не эквивалентно доскам
-    initial_quantity: int = Field(1, ge=1, le=100)  # Количество единиц для создания
+    initial_quantity: int = Field(1, ge=1, le=500)  # Количество единиц для создания
     settings: Optional[Dict[str, Any]] = None 
\ No newline at end of file
@@ -27,6 +27,7 @@ class PushSubscriptionUpdate(BaseModel):
 
 class PushSubscriptionResponse(BaseModel):
     id: int
+    user_id: Optional[int] = None
     endpoint: str
     is_active: bool
     notifications_enabled: bool
@@ -58,15 +59,25 @@ class SendNotificationRequest(BaseModel):
     payload: NotificationPayload
     subscription_ids: Optional[List[int]] = Field(None, description="ID подписок (если не указано - всем активным)")
     notification_type: Optional[str] = Field(None, description="Тип уведомления для фильтрации")
-    max_concurrent: Optional[int] = Field(10, description="Максимальное количество одновременных отправок")
+    max_concurrent: Optional[int] = Field(
+        None,
+        description="Устарело, игнорируется: уведомления отправляет диспетчер outbox с лимитом PUSH_OUTBOX_MAX_CONCURRENT",
+        json_schema_extra={"deprecated": True}
+    )
+    ttl: Optional[int] = Field(None, ge=0, le=2419200, description="TTL уведомления в push-сервисе, секунды")
+    urgency: Optional[str] = Field(None, description="Urgency: very-low | low | normal | high")
 
 class NotificationResult(BaseModel):
     success: bool
     error: Optional[str] = None
-    should_remove: bool = False 
+    should_remove: bool = False
+    retryable: bool = False                # Ошибка временная (429/5xx/сеть) - имеет смысл повторить
+    retry_after: Optional[float] = None    # Секунды из заголовка Retry-After
+    status_code: Optional[int] = None
 
 class SendBookingNotificationRequest(BaseModel):
     booking_id: int = Field(..., description="ID бронирования")
     client_name: str = Field(..., description="Имя клиента")
     notification_type: str = Field(..., description="Тип уведомления")
+    business_owner_id: Optional[int] = Field(None, description="Владелец бронирования (если не указан - определяется по booking_id)")
     additional_data: Optional[Dict[str, Any]] = Field(None, description="Дополнительные данные") 
\ No newline at end of file
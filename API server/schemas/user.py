@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, validator
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime
 
 class UserBase(BaseModel):
@@ -74,7 +74,15 @@ class UserInDBBase(UserBase):
 
 class User(UserInDBBase):
     """Схема для возврата пользователя (без конфиденциальных данных)"""
-    pass
+    # srcset уменьшенных копий аватара ({"webp": "... 64w, ... 128w", "jpeg": ...}) для списков
+    avatar_srcset: Optional[Dict[str, str]] = None
+    
+    @validator('avatar_srcset', always=True)
+    def build_avatar_srcset(cls, v, values):
+        if v is not None:
+            return v
+        from services.avatar_service import build_srcset
+        return build_srcset(values.get('avatar'))
 
 class UserInDB(UserInDBBase):
     """Схема для внутреннего использования (с конфиденциальными данными)"""
@@ -0,0 +1,273 @@
+"""
+Обработка аватаров: потоковое сохранение загрузки и генерация уменьшенных копий.
+
+- файл пишется на диск чанками в отдельном потоке, event loop не блокируется;
+- одновременно считается sha256 - имя файлов зависит только от содержимого,
+  поэтому их можно кэшировать навсегда (immutable), а одинаковые картинки не дублируются;
+- WebP/JPEG варианты нескольких размеров рендерятся в пуле процессов (Pillow - CPU-bound)
+  и кладутся в content-addressed хранилище (static_storage.store_file) под ключом
+  <sha256 исходника>_<размер>: data/cas/ab/<sha256>_256.jpg.
+
+Аватары в /static/avatars/ загружены до перехода на CAS - они по-прежнему раздаются и удаляются.
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import UploadFile
+from loguru import logger
+
+from core.config import get_settings
+from services.static_storage import CAS_DIR, CAS_URL_PREFIX, cas_relative_path, cas_url, store_file
+
+try:
+    from PIL import Image, ImageOps
+    PILLOW_AVAILABLE = True
+except ImportError:
+    PILLOW_AVAILABLE = False
+
+AVATARS_DIR = Path("data/avatars")
+AVATARS_URL_PREFIX = "/static/avatars"
+
+# Размеры квадратных вариантов (px) и размер, который пишется в User.avatar
+AVATAR_SIZES = (64, 128, 256, 512)
+AVATAR_DEFAULT_SIZE = 256
+AVATAR_FORMATS = {"webp": "WEBP", "jpeg": "JPEG"}
+AVATAR_EXTENSIONS = {"webp": "webp", "jpeg": "jpg"}
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# /static/cas/ab/<sha256>_<size>.<ext> и старые /static/avatars/<sha256>_<size>.<ext>
+_HASHED_AVATAR_RE = re.compile(
+    r"^(?P<prefix>/static/cas/[0-9a-f]{2}|/static/avatars)/(?P<digest>[0-9a-f]{64})_(?P<size>\d+)\.(?P<ext>webp|jpg)$"
+)
+
+
+class AvatarTooLargeError(ValueError):
+    """Загружаемый файл превышает допустимый размер"""
+
+
+class AvatarProcessingError(ValueError):
+    """Файл не удалось прочитать как изображение"""
+
+
+_avatar_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """Пул процессов для ресайза (ленивая инициализация)"""
+    global _avatar_pool
+    if _avatar_pool is None:
+        _avatar_pool = ProcessPoolExecutor(max_workers=get_settings().AVATAR_WORKERS)
+    return _avatar_pool
+
+
+def shutdown_avatar_pool():
+    """Останавливает пул процессов (вызывается при остановке приложения)"""
+    global _avatar_pool
+    if _avatar_pool is not None:
+        _avatar_pool.shutdown(wait=False, cancel_futures=True)
+        _avatar_pool = None
+
+
+def variant_key(digest: str, size: int) -> str:
+    """Ключ варианта в CAS: содержимое определяется исходником и размером"""
+    return f"{digest}_{size}"
+
+
+def variant_filename(digest: str, size: int, fmt: str) -> str:
+    return f"{variant_key(digest, size)}.{AVATAR_EXTENSIONS[fmt]}"
+
+
+def build_srcset(avatar_url: Optional[str]) -> Optional[Dict[str, str]]:
+    """
+    Строит srcset по URL аватара с content-hash именем.
+    Для старых аватаров (произвольное имя или внешний URL) возвращает None.
+    """
+    if not avatar_url:
+        return None
+    match = _HASHED_AVATAR_RE.match(avatar_url)
+    if not match:
+        return None
+    prefix, digest = match.group("prefix"), match.group("digest")
+    # В CAS подкаталог - первые 2 символа ключа, у всех вариантов он общий
+    return {
+        fmt: ", ".join(
+            f"{prefix}/{variant_filename(digest, size, fmt)} {size}w"
+            for size in AVATAR_SIZES
+        )
+        for fmt in AVATAR_FORMATS
+    }
+
+
+def avatar_digest(avatar_url: Optional[str]) -> Optional[str]:
+    """Возвращает sha256 исходника из URL аватара с content-hash именем"""
+    match = _HASHED_AVATAR_RE.match(avatar_url or "")
+    return match.group("digest") if match else None
+
+
+async def save_upload_streaming(upload: UploadFile, max_bytes: int) -> Tuple[Path, str, int]:
+    """
+    Сохраняет загрузку во временный файл чанками, считая sha256 на лету.
+    Запись на диск выполняется в потоке, чтобы не блокировать event loop.
+    Возвращает (путь к временному файлу, sha256, размер).
+    """
+    AVATARS_DIR.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=AVATARS_DIR, prefix=".upload_", suffix=".tmp")
+    tmp_path = Path(tmp_name)
+    hasher = hashlib.sha256()
+    total = 0
+
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                total += len(chunk)
+                if total > max_bytes:
+                    raise AvatarTooLargeError(f"Размер файла превышает {max_bytes // (1024 * 1024)}MB")
+                hasher.update(chunk)
+                await asyncio.to_thread(tmp_file.write, chunk)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    return tmp_path, hasher.hexdigest(), total
+
+
+def _render_variants(
+    source_path: str, cas_dir: str, tmp_dir: str, digest: str, sizes: List[int]
+) -> Dict[int, Dict[str, Optional[str]]]:
+    """
+    Рендерит квадратные WebP/JPEG варианты во временные файлы (выполняется в дочернем процессе).
+    Варианты, которые уже есть в CAS, не рендерятся (None) - ключ зависит только от содержимого.
+    """
+    variants: Dict[int, Dict[str, Optional[str]]] = {
+        size: {
+            fmt: None if (Path(cas_dir) / cas_relative_path(variant_key(digest, size), ext)).exists() else ""
+            for fmt, ext in AVATAR_EXTENSIONS.items()
+        }
+        for size in sizes
+    }
+    if all(name is None for files in variants.values() for name in files.values()):
+        return variants
+
+    try:
+        _render_missing(source_path, tmp_dir, sizes, variants)
+    except BaseException:
+        for files in variants.values():
+            for name in files.values():
+                if name:
+                    Path(name).unlink(missing_ok=True)
+        raise
+    return variants
+
+
+def _render_missing(source_path: str, tmp_dir: str, sizes: List[int], variants: Dict[int, Dict[str, Optional[str]]]):
+    """Рендерит варианты, отмеченные в variants пустой строкой, и записывает пути временных файлов"""
+    with Image.open(source_path) as image:
+        # Для JPEG декодируем сразу в уменьшенном масштабе - большие фото с телефона обрабатываются в разы быстрее
+        image.draft("RGB", (max(sizes) * 2, max(sizes) * 2))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "L"):
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            rgba = image.convert("RGBA")
+            background.paste(rgba, mask=rgba.split()[-1])
+            image = background
+        else:
+            image = image.convert("RGB")
+
+        for size in sizes:
+            square = None
+            for fmt, pil_format in AVATAR_FORMATS.items():
+                if variants[size][fmt] is None:
+                    continue
+                if square is None:
+                    square = ImageOps.fit(image, (size, size), method=Image.LANCZOS)
+                fd, tmp_name = tempfile.mkstemp(dir=tmp_dir, prefix=".variant_", suffix=f".{AVATAR_EXTENSIONS[fmt]}")
+                os.close(fd)
+                variants[size][fmt] = tmp_name
+                save_kwargs = {"quality": 82, "method": 4} if fmt == "webp" else {"quality": 85, "optimize": True, "progressive": True}
+                square.save(tmp_name, pil_format, **save_kwargs)
+
+
+async def process_avatar(source_path: Path, digest: str, fallback_extension: str = "jpg") -> Dict[str, object]:
+    """
+    Генерирует варианты аватара в пуле процессов и удаляет исходник.
+    Возвращает URL основного аватара, srcset и список вариантов.
+    """
+    try:
+        if not PILLOW_AVAILABLE:
+            # Без Pillow сохраняем исходник как есть в content-addressed хранилище
+            logger.warning("⚠️ Pillow не установлен - аватар сохраняется без уменьшенных копий")
+            avatar_url = await store_file(source_path, digest, fallback_extension)
+            return {"avatar_url": avatar_url, "srcset": None, "variants": {}}
+
+        loop = asyncio.get_running_loop()
+        try:
+            rendered = await loop.run_in_executor(
+                _get_pool(), _render_variants,
+                str(source_path), str(CAS_DIR), str(AVATARS_DIR), digest, list(AVATAR_SIZES)
+            )
+        except Exception as e:
+            logger.error(f"❌ Не удалось обработать изображение аватара: {e}")
+            raise AvatarProcessingError("Не удалось прочитать изображение") from e
+
+        # Временные файлы переносятся в CAS; уже существующие варианты - дедупликация
+        variants: Dict[int, Dict[str, str]] = {}
+        for size, files in rendered.items():
+            variants[size] = {}
+            for fmt, tmp_name in files.items():
+                key, extension = variant_key(digest, size), AVATAR_EXTENSIONS[fmt]
+                if tmp_name is None:
+                    variants[size][fmt] = cas_url(key, extension)
+                else:
+                    variants[size][fmt] = await store_file(Path(tmp_name), key, extension)
+
+        avatar_url = variants[AVATAR_DEFAULT_SIZE]["jpeg"]
+        return {
+            "avatar_url": avatar_url,
+            "srcset": build_srcset(avatar_url),
+            "variants": variants,
+        }
+    finally:
+        await asyncio.to_thread(source_path.unlink, True)
+
+
+async def remove_avatar_files(avatar_url: Optional[str]):
+    """
+    Удаляет файлы аватара (все варианты для content-hash имени, иначе один файл).
+    Вызывающий проверяет, что URL не используется другими пользователями: одинаковые
+    картинки в CAS хранятся один раз и у всех получают один и тот же URL.
+    """
+    if not avatar_url:
+        return
+    if avatar_url.startswith(f"{CAS_URL_PREFIX}/"):
+        base_dir, relative = CAS_DIR, avatar_url[len(CAS_URL_PREFIX) + 1:]
+    elif avatar_url.startswith(f"{AVATARS_URL_PREFIX}/"):
+        base_dir, relative = AVATARS_DIR, Path(avatar_url).name
+    else:
+        return
+
+    digest = avatar_digest(avatar_url)
+    if digest:
+        paths = [
+            base_dir / Path(relative).parent / variant_filename(digest, size, fmt)
+            for size in AVATAR_SIZES
+            for fmt in AVATAR_FORMATS
+        ]
+    else:
+        paths = [base_dir / relative]
+
+    def _unlink_all():
+        for path in paths:
+            path.unlink(missing_ok=True)
+
+    await asyncio.to_thread(_unlink_all)
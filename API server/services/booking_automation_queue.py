@@ -0,0 +1,48 @@
+"""
+Очередь событий бронирований для автоматизации статусов в шедулере.
+
+При создании/изменении бронирования API кладет его снимок в hash и ставит
+бронирование в ZSET с меткой "проверить сейчас", после чего будит воркер
+шедулера. Шедулер сам вычисляет момент следующего перехода (ожидание
+подтверждения, неявка, напоминания) и переставляет score - вместо ежеминутной
+выгрузки всех активных бронирований он просыпается только к ближайшему переходу.
+Ключи должны совпадать с tasks/booking_status_automation/transition_queue.py шедулера.
+"""
+
+import json
+import time
+from typing import Optional
+
+import redis.asyncio as redis
+from loguru import logger
+
+from models.booking import Booking
+from schemas.booking import BookingOut
+
+BOOKING_AUTOMATION_DUE_KEY = "booking_automation:due"
+BOOKING_AUTOMATION_SNAPSHOTS_KEY = "booking_automation:bookings"
+BOOKING_AUTOMATION_WAKE_KEY = "booking_automation:wake"
+
+# Статусы, по которым у шедулера еще могут быть переходы или напоминания
+AUTOMATED_BOOKING_STATUSES = ("booked", "pending_confirmation", "confirmed", "in_use")
+
+
+async def enqueue_booking_event(redis_client: Optional[redis.Redis], booking: Optional[Booking]):
+    """Передать шедулеру изменение бронирования (ошибки Redis не ломают запрос)"""
+    if not redis_client or booking is None:
+        return
+    member = str(booking.id)
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        if booking.status in AUTOMATED_BOOKING_STATUSES:
+            snapshot = BookingOut.model_validate(booking).model_dump(mode="json")
+            pipe.hset(BOOKING_AUTOMATION_SNAPSHOTS_KEY, member, json.dumps(snapshot))
+            pipe.zadd(BOOKING_AUTOMATION_DUE_KEY, {member: time.time()})
+            pipe.lpush(BOOKING_AUTOMATION_WAKE_KEY, member)
+            pipe.ltrim(BOOKING_AUTOMATION_WAKE_KEY, 0, 0)
+        else:
+            pipe.zrem(BOOKING_AUTOMATION_DUE_KEY, member)
+            pipe.hdel(BOOKING_AUTOMATION_SNAPSHOTS_KEY, member)
+        await pipe.execute()
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось передать бронирование #{booking.id} в очередь автоматизации: {e}")
@@ -0,0 +1,128 @@
+"""
+Создание бронирования одной транзакцией.
+
+Клиент и бронирование записываются одним SQL-выражением:
+CTE с upsert клиента (INSERT ... ON CONFLICT (business_owner_id, phone_normalized))
+или с проверкой принадлежности клиента (UPDATE ... WHERE business_owner_id = ...),
+которая одновременно увеличивает счетчик бронирований, и INSERT бронирования
+из этого CTE. Итого один запрос и один commit вместо 4-5 обращений к БД;
+гонка "два одновременных бронирования создают двух одинаковых клиентов" исключена
+уникальным индексом.
+"""
+
+from typing import Optional
+
+from sqlalchemy import select, insert, update, literal, func, Integer
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from crud.customer import STATS_EXCLUDED_BOOKING_STATUSES
+from crud.inventory_allocation import allocate_booking_items, AllocationConflict, ALLOCATING_BOOKING_STATUSES
+from models.booking import Booking
+from models.customer import Customer
+from schemas.booking import BookingCreate
+from services.customer_search_index import customer_search_index
+
+_customers = Customer.__table__
+_bookings = Booking.__table__
+
+# Поля бронирования, которые берутся из запроса как есть
+_BOOKING_FIELDS = [
+    column.name for column in _bookings.c
+    if column.name not in ("id", "business_owner_id", "customer_id", "created_at", "updated_at")
+]
+
+
+class BookingCustomerNotFound(ValueError):
+    """Указанный клиент не найден или принадлежит другому владельцу"""
+
+
+def _customer_upsert_cte(business_owner_id: int, name: str, phone: str, bookings_delta: int):
+    """Новый клиент или +bookings_delta существующему с тем же нормализованным номером"""
+    return (
+        pg_insert(_customers)
+        .values(
+            name=name,
+            phone=phone,
+            business_owner_id=business_owner_id,
+            total_bookings_count=bookings_delta,
+            total_spent=0
+        )
+        .on_conflict_do_update(
+            index_elements=[_customers.c.business_owner_id, _customers.c.phone_normalized],
+            set_={
+                "total_bookings_count": _customers.c.total_bookings_count + bookings_delta,
+                "updated_at": func.now(),
+            }
+        )
+        .returning(_customers.c.id)
+        .cte("customer_row")
+    )
+
+
+def _customer_owned_cte(business_owner_id: int, customer_id: int, bookings_delta: int):
+    """Клиент владельца с увеличенным счетчиком; чужой/несуществующий - пустой результат"""
+    return (
+        update(_customers)
+        .where(_customers.c.id == customer_id, _customers.c.business_owner_id == business_owner_id)
+        .values(
+            total_bookings_count=_customers.c.total_bookings_count + bookings_delta,
+            updated_at=func.now()
+        )
+        .returning(_customers.c.id)
+        .cte("customer_row")
+    )
+
+
+async def create_booking_with_customer(
+    db: AsyncSession,
+    booking_in: BookingCreate,
+    business_owner_id: int
+) -> Booking:
+    """
+    Создает бронирование владельца вместе с клиентом (или для указанного клиента)
+    и обновляет статистику клиента - одним запросом и одним commit.
+
+    - customer_id задан: клиент должен принадлежать владельцу, иначе BookingCustomerNotFound;
+    - иначе клиент ищется/создается по client_name + phone.
+    """
+    bookings_delta = 0 if booking_in.status in STATS_EXCLUDED_BOOKING_STATUSES else 1
+
+    if booking_in.customer_id:
+        customer_row = _customer_owned_cte(business_owner_id, booking_in.customer_id, bookings_delta)
+    elif booking_in.client_name and booking_in.phone:
+        customer_row = _customer_upsert_cte(
+            business_owner_id, booking_in.client_name, booking_in.phone, bookings_delta
+        )
+    else:
+        raise ValueError("Необходимо указать данные клиента (client_name + phone или customer_id)")
+
+    booking_data = booking_in.dict()
+    values = select(
+        literal(business_owner_id, Integer),
+        customer_row.c.id,
+        *[literal(booking_data[field], _bookings.c[field].type) for field in _BOOKING_FIELDS]
+    )
+    statement = (
+        insert(_bookings)
+        .from_select(["business_owner_id", "customer_id", *_BOOKING_FIELDS], values)
+        .returning(*_bookings.c)
+    )
+
+    result = await db.execute(select(Booking).from_statement(statement))
+    booking: Optional[Booking] = result.scalar_one_or_none()
+    if booking is None:
+        await db.rollback()
+        raise BookingCustomerNotFound("Указанный клиент не найден или не принадлежит вам")
+
+    if booking.status in ALLOCATING_BOOKING_STATUSES:
+        # Сразу подтвержденное бронирование закрепляет единицы в календаре в той же транзакции
+        try:
+            await allocate_booking_items(db, booking)
+        except AllocationConflict:
+            await db.rollback()
+            raise
+
+    await db.commit()
+    await customer_search_index.record_booking(business_owner_id, booking.customer_id, bookings_delta)
+    return booking
@@ -0,0 +1,316 @@
+"""
+In-process индекс для автодополнения клиентов (typeahead) по владельцу.
+
+Для каждого бизнесмена в памяти процесса держится отсортированный массив ключей
+(слова нормализованного имени и цифры телефона) -> id клиента. Поиск по префиксу -
+bisect по массиву, без обращения к Postgres.
+
+- индекс строится лениво: первый запрос владельца идет в SQL, а сборка запускается в фоне;
+- каждый процесс (воркер gunicorn/uvicorn) держит свою копию. Хуки CRUD клиентов
+  (создание/изменение/удаление/статистика) увеличивают в Redis версию клиентов владельца
+  (SEARCH_INDEX_VERSION_KEY); перед ответом из индекса версия сверяется, и если клиенты
+  менялись в другом процессе, запрос идет в SQL, а индекс пересобирается в фоне.
+  Без Redis индекс не используется - о чужих изменениях узнать неоткуда;
+- изменение во время сборки отменяет ее результат (по счетчику поколений владельца);
+- индексы вытесняются по LRU и перестраиваются по TTL.
+
+Индекс ищет по префиксам слов имени и цифр телефона, а SQL-поиск (crud.customer.search_customers) -
+по подстроке и нечетко (pg_trgm), поэтому выдача может отличаться. Включается
+CUSTOMER_SEARCH_INDEX_ENABLED (по умолчанию выключен).
+"""
+
+import asyncio
+import re
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import redis.asyncio as redis
+from loguru import logger
+from sqlalchemy import select
+
+from core.config import get_settings
+from db.session import AsyncSessionFactory
+from models.customer import Customer
+
+# Поля, которые возвращает схема schemas.customer.Customer
+_ENTRY_COLUMNS = (
+    Customer.id, Customer.name, Customer.phone, Customer.email, Customer.notes,
+    Customer.business_owner_id, Customer.total_bookings_count, Customer.total_spent,
+    Customer.created_at, Customer.updated_at,
+)
+_ENTRY_FIELDS = tuple(column.key for column in _ENTRY_COLUMNS)
+
+PHONE_MIN_DIGITS = 3
+
+# Версия клиентов владельца, общая для всех процессов API
+SEARCH_INDEX_VERSION_KEY = "customers:search_index:owner:{owner_id}:version"
+
+
+def normalize_text(value: Optional[str]) -> str:
+    return " ".join((value or "").lower().replace("ё", "е").split())
+
+
+def phone_keys(phone: Optional[str]) -> Set[str]:
+    """Цифры телефона целиком и без кода страны (+7/8), чтобы запрос 912 находил +7 912..."""
+    digits = re.sub(r"\D", "", phone or "")
+    if not digits:
+        return set()
+    keys = {digits}
+    if len(digits) == 11 and digits[0] in "78":
+        keys.add(digits[1:])
+    return keys
+
+
+class _OwnerIndex:
+    """Индекс клиентов одного владельца: отсортированные пары (ключ, id) + данные клиентов"""
+
+    def __init__(self, version: int):
+        self.pairs: List[Tuple[str, int]] = []
+        self.entries: Dict[int, dict] = {}
+        self.built_at = time.monotonic()
+        # Версия клиентов владельца в Redis, которой соответствуют данные индекса
+        self.version = version
+
+    @staticmethod
+    def _keys(entry: dict) -> Set[str]:
+        name = normalize_text(entry["name"])
+        keys = set(name.split())
+        if name:
+            keys.add(name)
+        return keys | phone_keys(entry["phone"])
+
+    def load(self, entries: List[dict]):
+        """Полная сборка (выполняется в потоке, чтобы не блокировать event loop)"""
+        pairs = []
+        for entry in entries:
+            self.entries[entry["id"]] = entry
+            pairs.extend((key, entry["id"]) for key in self._keys(entry))
+        pairs.sort()
+        self.pairs = pairs
+
+    def upsert(self, entry: dict):
+        self.remove(entry["id"])
+        self.entries[entry["id"]] = entry
+        for key in self._keys(entry):
+            insort(self.pairs, (key, entry["id"]))
+
+    def remove(self, customer_id: int):
+        entry = self.entries.pop(customer_id, None)
+        if entry is None:
+            return
+        for key in self._keys(entry):
+            position = bisect_left(self.pairs, (key, customer_id))
+            if position < len(self.pairs) and self.pairs[position] == (key, customer_id):
+                del self.pairs[position]
+
+    def _prefix_ids(self, prefix: str) -> Set[int]:
+        ids = set()
+        position = bisect_left(self.pairs, (prefix, -1))
+        while position < len(self.pairs) and self.pairs[position][0].startswith(prefix):
+            ids.add(self.pairs[position][1])
+            position += 1
+        return ids
+
+    def search(self, query: str, limit: int, skip: int = 0) -> List[dict]:
+        term = normalize_text(query)
+        digits = re.sub(r"\D", "", term)
+        words = term.split()
+
+        # Имя: каждое слово запроса - префикс какого-то слова имени
+        matched: Set[int] = set()
+        if words and not term.replace(" ", "").isdigit():
+            matched = self._prefix_ids(words[0])
+            for word in words[1:]:
+                matched = {
+                    customer_id for customer_id in matched
+                    if any(part.startswith(word) for part in normalize_text(self.entries[customer_id]["name"]).split())
+                }
+        # Телефон: префикс цифр (с кодом страны или без)
+        if len(digits) >= PHONE_MIN_DIGITS:
+            matched |= self._prefix_ids(digits)
+
+        def rank(customer_id: int):
+            entry = self.entries[customer_id]
+            name = normalize_text(entry["name"])
+            phones = phone_keys(entry["phone"])
+            if name == term or digits in phones:
+                order = 0
+            elif name.startswith(term):
+                order = 1
+            else:
+                order = 2
+            return order, name, customer_id
+
+        ordered = sorted(matched, key=rank)
+        return [self.entries[customer_id] for customer_id in ordered[skip:skip + limit]]
+
+
+class CustomerSearchIndex:
+    """Реестр индексов по владельцам с LRU-вытеснением"""
+
+    def __init__(self):
+        settings = get_settings()
+        self.enabled = settings.CUSTOMER_SEARCH_INDEX_ENABLED
+        self.max_owners = settings.CUSTOMER_SEARCH_INDEX_MAX_OWNERS
+        self.max_customers = settings.CUSTOMER_SEARCH_INDEX_MAX_CUSTOMERS
+        self.ttl = settings.CUSTOMER_SEARCH_INDEX_TTL
+
+        self._owners: "OrderedDict[int, _OwnerIndex]" = OrderedDict()
+        self._building: Dict[int, asyncio.Task] = {}
+        self._generations: Dict[int, int] = {}
+        # Владельцы со слишком большой базой: индекс не строим до истечения TTL
+        self._skipped_until: Dict[int, float] = {}
+        self._redis: Optional[redis.Redis] = None
+
+    def use_redis(self, redis_client: Optional[redis.Redis]):
+        """Подключить Redis с версиями клиентов (вызывается при старте приложения)"""
+        self._redis = redis_client
+
+    # ---------- Поиск ----------
+
+    async def search(self, business_owner_id: int, query: str, limit: int = 10, skip: int = 0) -> Optional[List[dict]]:
+        """
+        Поиск по индексу владельца. None - индекс холодный или устарел (запрос надо
+        выполнить в SQL), сборка при этом запускается в фоне.
+        """
+        if not self.enabled:
+            return None
+
+        version = await self._shared_version(business_owner_id)
+        if version is None:
+            return None
+
+        index = self._owners.get(business_owner_id)
+        if index is None or index.version != version:
+            # Холодный индекс или клиенты менялись в другом процессе
+            self._schedule_build(business_owner_id)
+            return None
+        if time.monotonic() - index.built_at > self.ttl:
+            # Просроченный по TTL индекс (версия та же) отдаем, пока в фоне собирается новый
+            self._schedule_build(business_owner_id)
+
+        self._owners.move_to_end(business_owner_id)
+        return index.search(query, limit=limit, skip=skip)
+
+    # ---------- Хуки CRUD ----------
+
+    async def upsert(self, customer: Customer):
+        """Клиент создан/изменен (вызывается после commit)"""
+        entry = {field: getattr(customer, field) for field in _ENTRY_FIELDS}
+        await self._apply(customer.business_owner_id, lambda index: index.upsert(entry))
+
+    async def remove(self, business_owner_id: int, customer_id: int):
+        """Клиент удален (вызывается после commit)"""
+        await self._apply(business_owner_id, lambda index: index.remove(customer_id))
+
+    async def record_booking(self, business_owner_id: int, customer_id: int, bookings_delta: int = 1):
+        """
+        Бронирование создано с upsert клиента. Известному клиенту увеличиваем счетчик,
+        новый (созданный в той же транзакции) - повод пересобрать индекс владельца.
+        """
+        def apply(index: _OwnerIndex) -> bool:
+            entry = index.entries.get(customer_id)
+            if entry is None:
+                return False
+            index.entries[customer_id] = {
+                **entry, "total_bookings_count": max(0, entry["total_bookings_count"] + bookings_delta)
+            }
+            return True
+
+        await self._apply(business_owner_id, apply)
+
+    async def invalidate(self, business_owner_id: int):
+        """Массовое изменение клиентов владельца - индекс будет пересобран при следующем запросе"""
+        await self._apply(business_owner_id, lambda index: False)
+
+    async def _apply(self, business_owner_id: int, change: Callable[[_OwnerIndex], Optional[bool]]):
+        """
+        Отметить изменение клиентов владельца (в том числе для других процессов) и применить
+        его к своему индексу. Если change вернул False или между версиями индекса были чужие
+        изменения, индекс отбрасывается.
+        """
+        self._generations[business_owner_id] = self._generations.get(business_owner_id, 0) + 1
+        version = await self._bump_shared_version(business_owner_id)
+        index = self._owners.get(business_owner_id)
+        if index is None:
+            return
+        if version is None or version != index.version + 1 or change(index) is False:
+            self._owners.pop(business_owner_id, None)
+            return
+        index.version = version
+
+    async def _shared_version(self, business_owner_id: int) -> Optional[int]:
+        if self._redis is None:
+            return None
+        try:
+            return int(await self._redis.get(SEARCH_INDEX_VERSION_KEY.format(owner_id=business_owner_id)) or 0)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось прочитать версию индекса клиентов владельца {business_owner_id}: {e}")
+            return None
+
+    async def _bump_shared_version(self, business_owner_id: int) -> Optional[int]:
+        if self._redis is None:
+            return None
+        try:
+            return await self._redis.incr(SEARCH_INDEX_VERSION_KEY.format(owner_id=business_owner_id))
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось обновить версию индекса клиентов владельца {business_owner_id}: {e}")
+            return None
+
+    # ---------- Сборка ----------
+
+    def _schedule_build(self, business_owner_id: int):
+        if business_owner_id in self._building:
+            return
+        if self._skipped_until.get(business_owner_id, 0) > time.monotonic():
+            return
+        task = asyncio.create_task(self._build(business_owner_id), name=f"customer-index-{business_owner_id}")
+        self._building[business_owner_id] = task
+        task.add_done_callback(lambda _: self._building.pop(business_owner_id, None))
+
+    async def _build(self, business_owner_id: int):
+        generation = self._generations.get(business_owner_id, 0)
+        started = time.perf_counter()
+        try:
+            # Версию читаем до выборки: изменения после нее поднимут версию, и индекс пересоберется
+            version = await self._shared_version(business_owner_id)
+            if version is None:
+                return
+            async with AsyncSessionFactory() as db:
+                result = await db.execute(
+                    select(*_ENTRY_COLUMNS)
+                    .where(Customer.business_owner_id == business_owner_id)
+                    .limit(self.max_customers + 1)
+                )
+                entries = [dict(row._mapping) for row in result]
+
+            if len(entries) > self.max_customers:
+                # Большие базы обслуживает SQL-поиск по trigram-индексам
+                self._skipped_until[business_owner_id] = time.monotonic() + self.ttl
+                logger.info(f"🔎 Индекс клиентов владельца {business_owner_id} не строится: больше {self.max_customers} клиентов")
+                return
+
+            index = _OwnerIndex(version)
+            await asyncio.to_thread(index.load, entries)
+
+            if self._generations.get(business_owner_id, 0) != generation:
+                # Клиенты менялись во время сборки - результат может быть неполным
+                logger.debug(f"🔎 Индекс клиентов владельца {business_owner_id} устарел во время сборки, отброшен")
+                return
+
+            self._owners[business_owner_id] = index
+            self._owners.move_to_end(business_owner_id)
+            while len(self._owners) > self.max_owners:
+                self._owners.popitem(last=False)
+
+            logger.debug(
+                f"🔎 Индекс клиентов владельца {business_owner_id} собран: "
+                f"{len(entries)} клиентов за {(time.perf_counter() - started) * 1000:.0f} мс"
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось собрать индекс клиентов владельца {business_owner_id}: {e}")
+
+
+customer_search_index = CustomerSearchIndex()
@@ -0,0 +1,93 @@
+"""
+Периодическая сверка статистики клиентов с бронированиями.
+
+Счетчики в customers обновляются атомарно при бронировании, но могут разойтись
+с bookings (смена статуса, удаление, ручные правки в БД). Вместо пересчета на
+каждое изменение бронирования раз в интервал выполняется один агрегирующий
+UPDATE по всем клиентам. Advisory lock гарантирует, что при нескольких
+процессах API сверку в один момент выполняет только один.
+"""
+
+import asyncio
+from typing import Optional
+
+from loguru import logger
+from sqlalchemy import text
+
+from core.config import get_settings
+from crud.customer import customer_crud
+from db.session import AsyncSessionFactory
+
+# Ключ pg advisory lock для сверки статистики клиентов
+RECONCILE_LOCK_KEY = 734_021_001
+
+
+class CustomerStatsReconciler:
+    def __init__(self):
+        self.settings = get_settings()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+
+    async def start(self):
+        """Запускает фоновую сверку"""
+        if self._task is not None:
+            return
+        if self.settings.CUSTOMER_STATS_RECONCILE_INTERVAL <= 0:
+            logger.info("📊 Сверка статистики клиентов отключена (CUSTOMER_STATS_RECONCILE_INTERVAL=0)")
+            return
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._run(), name="customer-stats-reconciler")
+        logger.info("📊 Сверка статистики клиентов запущена")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopping.set()
+        try:
+            await asyncio.wait_for(self._task, timeout=30)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+        except Exception as e:
+            logger.error(f"❌ Ошибка при остановке сверки статистики клиентов: {e}")
+        finally:
+            self._task = None
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(
+                    self._stopping.wait(), timeout=self.settings.CUSTOMER_STATS_RECONCILE_INTERVAL
+                )
+                break
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"❌ Ошибка сверки статистики клиентов: {e}")
+
+    async def run_once(self) -> Optional[int]:
+        """Одна сверка. None - ее уже выполняет другой процесс"""
+        async with AsyncSessionFactory() as db:
+            locked = (await db.execute(
+                text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": RECONCILE_LOCK_KEY}
+            )).scalar()
+            if not locked:
+                await db.rollback()
+                return None
+            # Lock снимается вместе с транзакцией (commit внутри reconcile_stats)
+            fixed = await customer_crud.reconcile_stats(db)
+
+        if fixed:
+            logger.info(f"📊 Статистика клиентов сверена: исправлено {fixed}")
+        return fixed
+
+
+# Глобальный экземпляр (ленивая инициализация)
+_customer_stats_reconciler = None
+
+def get_customer_stats_reconciler() -> CustomerStatsReconciler:
+    global _customer_stats_reconciler
+    if _customer_stats_reconciler is None:
+        _customer_stats_reconciler = CustomerStatsReconciler()
+    return _customer_stats_reconciler
@@ -0,0 +1,76 @@
+"""
+Кэш статистики инвентаря в Redis.
+
+Снимок (результат crud.inventory.get_inventory_stats) хранится под ключом с номером
+версии. Любое изменение типов/единиц инвентаря увеличивает версию - старый снимок
+перестает читаться и истекает по TTL. Используется /inventory/stats и эндпоинтами
+доступности бронирований, которые раньше пересчитывали статистику на каждый запрос.
+"""
+
+import json
+from typing import Any, Dict, Optional
+
+import redis.asyncio as redis
+from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from crud.inventory import get_inventory_stats
+
+INVENTORY_STATS_VERSION_KEY = "inventory:stats:version"
+INVENTORY_STATS_KEY = "inventory:stats:v{version}"
+INVENTORY_STATS_TTL = 300  # секунд - страховка на случай изменений в обход API
+
+
+async def get_inventory_stats_cached(db: AsyncSession, redis_client: Optional[redis.Redis]) -> Dict[str, Any]:
+    """Статистика инвентаря: из снимка в Redis, при промахе - из БД с сохранением снимка"""
+    version = None
+
+    if redis_client:
+        try:
+            version = await redis_client.get(INVENTORY_STATS_VERSION_KEY) or "0"
+            cached = await redis_client.get(INVENTORY_STATS_KEY.format(version=version))
+            if cached is not None:
+                return json.loads(cached)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось прочитать кэш статистики инвентаря: {e}")
+            version = None
+
+    stats = await get_inventory_stats(db)
+
+    if redis_client and version is not None:
+        try:
+            await redis_client.set(
+                INVENTORY_STATS_KEY.format(version=version), json.dumps(stats), ex=INVENTORY_STATS_TTL
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сохранить кэш статистики инвентаря: {e}")
+
+    return stats
+
+
+async def invalidate_inventory_stats(redis_client: Optional[redis.Redis]):
+    """Сбрасывает снимок (вызывается после изменения типов или единиц инвентаря)"""
+    if not redis_client:
+        return
+    try:
+        await redis_client.incr(INVENTORY_STATS_VERSION_KEY)
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось инвалидировать кэш статистики инвентаря: {e}")
+
+
+def availability_board_equivalents(stats: Dict[str, Any]) -> Dict[str, float]:
+    """{str(type_id): board_equivalent} для типов, влияющих на доступность слотов"""
+    return {
+        str(type_stats["id"]): type_stats["board_equivalent"]
+        for type_stats in stats.get("by_type", {}).values()
+        if type_stats.get("affects_availability")
+    }
+
+
+def availability_total_boards(stats: Dict[str, Any]) -> float:
+    """Емкость в "досках": сумма единиц влияющих на доступность типов с учетом board_equivalent"""
+    return sum(
+        type_stats["total"] * type_stats["board_equivalent"]
+        for type_stats in stats.get("by_type", {}).values()
+        if type_stats.get("affects_availability")
+    )
@@ -1,7 +1,11 @@
 import json
+import re
+import asyncio
 import aiohttp
 import tempfile
 import os
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 from loguru import logger
@@ -11,6 +15,28 @@ from core.config import get_settings
 from models.push_subscription import PushSubscription
 from schemas.push_subscription import NotificationPayload, NotificationResult
 
+# Допустимые значения заголовка Urgency (RFC 8030, раздел 5.3)
+PUSH_URGENCY_LEVELS = ("very-low", "low", "normal", "high")
+
+# Topic может содержать только символы base64url
+_TOPIC_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Разбирает заголовок Retry-After: число секунд или HTTP-дата"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
 
 class PushNotificationService:
     def __init__(self):
@@ -87,10 +113,17 @@ class PushNotificationService:
     async def send_notification(
         self,
         subscription: PushSubscription,
-        payload: NotificationPayload
+        payload: NotificationPayload,
+        ttl: Optional[int] = None,
+        urgency: Optional[str] = None,
+        topic: Optional[str] = None,
+        session: Optional[aiohttp.ClientSession] = None
     ) -> NotificationResult:
         """
         Отправляет push уведомление одному подписчику
+
+        ttl/urgency/topic передаются push-сервису заголовками TTL, Urgency и Topic (RFC 8030).
+        Если передана session, используется она (переиспользование соединений диспетчером).
         """
         if not self.is_available():
             return NotificationResult(
@@ -114,39 +147,74 @@ class PushNotificationService:
                 message=json.dumps(message_data),
                 subscription=web_push_subscription
             )
+
+            # Заголовки доставки: заменяем значения библиотеки своими (без дублей по регистру)
+            headers = {
+                key: value for key, value in dict(message.headers).items()
+                if key.lower() not in ("ttl", "urgency", "topic")
+            }
+            headers["TTL"] = str(ttl if ttl is not None else self.settings.PUSH_DEFAULT_TTL)
+            if urgency in PUSH_URGENCY_LEVELS:
+                headers["Urgency"] = urgency
+            if topic:
+                headers["Topic"] = topic
             
             # Отправляем асинхронно
-            async with aiohttp.ClientSession() as session:
+            own_session = session is None
+            if own_session:
+                session = aiohttp.ClientSession()
+            try:
                 async with session.post(
                     url=subscription.endpoint,
                     data=message.encrypted,
-                    headers=message.headers,
+                    headers=headers,
                     timeout=aiohttp.ClientTimeout(total=30)
                 ) as response:
-                    if response.status == 200 or response.status == 201:
+                    if response.status in (200, 201, 202):
                         logger.info(f"Push уведомление отправлено успешно: {subscription.endpoint}")
-                        return NotificationResult(success=True)
-                    elif response.status == 410:
+                        return NotificationResult(success=True, status_code=response.status)
+                    elif response.status in (404, 410):
                         # Подписка более не действительна
-                        logger.warning(f"Подписка недействительна (410): {subscription.endpoint}")
+                        logger.warning(f"Подписка недействительна ({response.status}): {subscription.endpoint}")
                         return NotificationResult(
                             success=False,
                             error="subscription_invalid",
-                            should_remove=True
+                            should_remove=True,
+                            status_code=response.status
+                        )
+                    elif response.status == 429 or response.status >= 500:
+                        # Push-сервис перегружен или ограничивает частоту - можно повторить позже
+                        error_text = await response.text()
+                        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                        logger.warning(
+                            f"Push-сервис вернул {response.status}, повтор через "
+                            f"{retry_after if retry_after is not None else 'backoff'} сек: {subscription.endpoint}"
+                        )
+                        return NotificationResult(
+                            success=False,
+                            error=f"HTTP {response.status}: {error_text[:500]}",
+                            retryable=True,
+                            retry_after=retry_after,
+                            status_code=response.status
                         )
                     else:
                         error_text = await response.text()
                         logger.error(f"Ошибка отправки push уведомления: {response.status} - {error_text}")
                         return NotificationResult(
                             success=False,
-                            error=f"HTTP {response.status}: {error_text}"
+                            error=f"HTTP {response.status}: {error_text}",
+                            status_code=response.status
                         )
+            finally:
+                if own_session:
+                    await session.close()
         
-        except aiohttp.ClientError as e:
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             logger.error(f"Сетевая ошибка при отправке push уведомления: {e}")
             return NotificationResult(
                 success=False,
-                error=f"Сетевая ошибка: {str(e)}"
+                error=f"Сетевая ошибка: {str(e)}",
+                retryable=True
             )
         except Exception as e:
             logger.error(f"Неожиданная ошибка при отправке push уведомления: {e}")
@@ -175,7 +243,6 @@ class PushNotificationService:
         logger.info(f"Отправка push уведомлений {len(subscriptions)} подписчикам")
         
         # Используем семафор для ограничения одновременных запросов
-        import asyncio
         semaphore = asyncio.Semaphore(max_concurrent)
         
         async def send_with_semaphore(subscription: PushSubscription):
@@ -406,6 +473,36 @@ class PushNotificationService:
         
         return NotificationPayload(**notification_config)
     
+    def get_delivery_options(
+        self,
+        payload: NotificationPayload,
+        ttl: Optional[int] = None,
+        urgency: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Определяет TTL, Urgency и Topic для уведомления.
+        Urgency берется из data.priority, если не задан явно.
+        Topic берется из tag, если он подходит под ограничения RFC 8030 (<= 32 символа base64url).
+        """
+        if urgency not in PUSH_URGENCY_LEVELS:
+            priority = (payload.data or {}).get("priority")
+            urgency = {
+                "urgent": "high",
+                "high": "high",
+                "medium": "normal",
+                "low": "low",
+            }.get(priority, "normal")
+
+        topic = None
+        if payload.tag and len(payload.tag) <= 32 and _TOPIC_RE.match(payload.tag):
+            topic = payload.tag
+
+        return {
+            "ttl": ttl if ttl is not None else self.settings.PUSH_DEFAULT_TTL,
+            "urgency": urgency,
+            "topic": topic,
+        }
+
     def get_vapid_public_key(self) -> Optional[str]:
         """Возвращает публичный VAPID ключ для клиента"""
         if not self.is_available():
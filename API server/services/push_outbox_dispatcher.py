@@ -0,0 +1,274 @@
+"""
+Диспетчер очереди push-уведомлений (push_outbox).
+
+Разбирает таблицу push_outbox в фоне, независимо от жизни HTTP-запросов:
+- захватывает пачки через FOR UPDATE SKIP LOCKED (безопасно для нескольких воркеров);
+- повторяет 429/5xx/сетевые ошибки с экспоненциальной задержкой и jitter;
+- уважает Retry-After и притормаживает весь push-сервис (origin), вернувший 429;
+- ограничивает параллелизм на каждый push-сервис;
+- пачкой деактивирует подписки, получившие 404/410.
+"""
+
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Any
+from urllib.parse import urlsplit
+
+import aiohttp
+import redis.asyncio as redis
+from loguru import logger
+
+from core.config import get_settings
+from crud.push_outbox import crud_push_outbox
+from crud.push_subscription import crud_push_subscription
+from db.session import AsyncSessionFactory
+from models.push_outbox import PushOutbox
+from schemas.push_subscription import NotificationPayload, NotificationResult
+from services.push_notification_service import PushNotificationService, get_push_notification_service
+from services.push_target_cache import invalidate_owner
+
+
+class PushOutboxDispatcher:
+    def __init__(self, push_service: Optional[PushNotificationService] = None):
+        self.settings = get_settings()
+        self.push_service = push_service or get_push_notification_service()
+
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+        self._wakeup = asyncio.Event()
+        self._http_session: Optional[aiohttp.ClientSession] = None
+        # Для сброса кэша адресатов владельцев при деактивации подписок
+        self._redis: Optional[redis.Redis] = None
+
+        # Ограничения по push-сервисам (fcm.googleapis.com, updates.push.services.mozilla.com, ...)
+        self._origin_blocked_until: Dict[str, datetime] = {}
+        self._origin_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._global_semaphore = asyncio.Semaphore(self.settings.PUSH_OUTBOX_MAX_CONCURRENT)
+
+        self._last_purge: Optional[datetime] = None
+
+    # ---------- Жизненный цикл ----------
+
+    def use_redis(self, redis_client: Optional[redis.Redis]):
+        """Подключить Redis приложения (вызывается при старте, до start)"""
+        self._redis = redis_client
+
+    async def start(self):
+        """Запускает фоновый цикл диспетчера"""
+        if self._task is not None:
+            return
+        if not self.settings.PUSH_OUTBOX_ENABLED:
+            logger.info("📭 Диспетчер push outbox отключен настройкой PUSH_OUTBOX_ENABLED")
+            return
+        if not self.push_service.is_available():
+            logger.warning("📭 Push сервис не настроен - диспетчер outbox не запущен, записи останутся в очереди")
+            return
+
+        self._stopping.clear()
+        self._http_session = aiohttp.ClientSession()
+        self._task = asyncio.create_task(self._run(), name="push-outbox-dispatcher")
+        logger.info("📬 Диспетчер push outbox запущен")
+
+    async def stop(self):
+        """Останавливает фоновый цикл, дожидаясь текущей пачки"""
+        if self._task is None:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout=30)
+        except asyncio.TimeoutError:
+            logger.warning("⏱️ Диспетчер push outbox не успел завершиться, отменяем")
+            self._task.cancel()
+        except Exception as e:
+            logger.error(f"❌ Ошибка при остановке диспетчера push outbox: {e}")
+        finally:
+            self._task = None
+            if self._http_session:
+                await self._http_session.close()
+                self._http_session = None
+        logger.info("📪 Диспетчер push outbox остановлен")
+
+    def wake(self):
+        """Будит диспетчер сразу после постановки новых записей (в пределах процесса)"""
+        self._wakeup.set()
+
+    async def _run(self):
+        batch_size = self.settings.PUSH_OUTBOX_BATCH_SIZE
+        while not self._stopping.is_set():
+            processed = 0
+            try:
+                processed = await self.run_once()
+                await self._maybe_purge()
+            except Exception as e:
+                logger.error(f"❌ Ошибка в цикле диспетчера push outbox: {e}")
+
+            # Полная пачка - вероятно, в очереди есть еще, берем следующую без паузы
+            if processed >= batch_size:
+                continue
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.settings.PUSH_OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    # ---------- Обработка пачки ----------
+
+    async def run_once(self) -> int:
+        """Захватывает и обрабатывает одну пачку. Возвращает количество захваченных записей"""
+        async with AsyncSessionFactory() as db:
+            claimed = await crud_push_outbox.claim_batch(
+                db,
+                limit=self.settings.PUSH_OUTBOX_BATCH_SIZE,
+                lease_seconds=self.settings.PUSH_OUTBOX_LEASE_SECONDS,
+                max_attempts=self.settings.PUSH_OUTBOX_MAX_ATTEMPTS
+            )
+            if not claimed:
+                return 0
+
+            subscriptions = {
+                sub.id: sub
+                for sub in await crud_push_subscription.get_by_ids(
+                    db, list({row.subscription_id for row in claimed})
+                )
+            }
+
+        now = datetime.now(timezone.utc)
+        sent_ids: List[int] = []
+        failed: Dict[str, List[int]] = {}
+        expired_ids: List[int] = []
+        retries: List[Dict[str, Any]] = []
+        invalid_subscription_ids: List[int] = []
+        delivered_subscription_ids: List[int] = []
+
+        to_send = []
+        for row in claimed:
+            subscription = subscriptions.get(row.subscription_id)
+            if subscription is None or not subscription.is_valid():
+                failed.setdefault("subscription_inactive", []).append(row.id)
+                continue
+
+            if row.created_at and row.created_at + timedelta(seconds=row.ttl) < now:
+                expired_ids.append(row.id)
+                continue
+
+            origin = urlsplit(subscription.endpoint).netloc
+            blocked_until = self._origin_blocked_until.get(origin)
+            if blocked_until and blocked_until > now:
+                # Push-сервис просил подождать - откладываем без расхода попытки
+                retries.append({
+                    "id": row.id,
+                    "next_attempt_at": blocked_until,
+                    "attempts": row.attempts - 1,
+                    "last_error": row.last_error,
+                })
+                continue
+
+            to_send.append((row, subscription, origin))
+
+        results = await asyncio.gather(
+            *[self._deliver(row, subscription, origin) for row, subscription, origin in to_send],
+            return_exceptions=True
+        )
+
+        for (row, subscription, origin), result in zip(to_send, results):
+            if isinstance(result, Exception):
+                result = NotificationResult(success=False, error=f"Исключение: {result}", retryable=True)
+
+            if result.success:
+                sent_ids.append(row.id)
+                delivered_subscription_ids.append(subscription.id)
+            elif result.should_remove:
+                failed.setdefault(result.error or "subscription_invalid", []).append(row.id)
+                invalid_subscription_ids.append(subscription.id)
+            elif result.retryable and row.attempts < self.settings.PUSH_OUTBOX_MAX_ATTEMPTS:
+                delay = result.retry_after if result.retry_after is not None else self._backoff_delay(row.attempts)
+                retry_at = datetime.now(timezone.utc) + timedelta(seconds=delay)
+                if result.status_code == 429:
+                    self._block_origin(origin, retry_at)
+                retries.append({"id": row.id, "next_attempt_at": retry_at, "last_error": result.error})
+            else:
+                failed.setdefault(result.error or "unknown_error", []).append(row.id)
+
+        async with AsyncSessionFactory() as db:
+            await crud_push_outbox.mark_sent(db, ids=sent_ids)
+            await crud_push_outbox.mark_final(db, ids=expired_ids, status=PushOutbox.STATUS_EXPIRED, error="ttl_expired")
+            for error, ids in failed.items():
+                await crud_push_outbox.mark_final(db, ids=ids, status=PushOutbox.STATUS_FAILED, error=error)
+            await crud_push_outbox.reschedule(db, retries=retries)
+            await crud_push_subscription.update_last_notification_many(
+                db, subscription_ids=list(set(delivered_subscription_ids))
+            )
+            deactivated = await crud_push_subscription.deactivate_many(
+                db, subscription_ids=list(set(invalid_subscription_ids))
+            )
+            await db.commit()
+
+        if invalid_subscription_ids:
+            # Деактивированные устройства больше не должны попадать в кэш адресатов владельцев
+            await invalidate_owner(
+                self._redis,
+                *{subscriptions[sub_id].user_id for sub_id in invalid_subscription_ids}
+            )
+
+        logger.info(
+            f"📨 Push outbox: захвачено {len(claimed)}, отправлено {len(sent_ids)}, "
+            f"повтор {len(retries)}, ошибок {sum(len(ids) for ids in failed.values())}, "
+            f"просрочено {len(expired_ids)}, деактивировано подписок {deactivated}"
+        )
+        return len(claimed)
+
+    async def _deliver(self, row: PushOutbox, subscription, origin: str) -> NotificationResult:
+        """Отправляет одну запись с учетом общего лимита и лимита на push-сервис"""
+        origin_semaphore = self._origin_semaphores.setdefault(
+            origin, asyncio.Semaphore(self.settings.PUSH_OUTBOX_PER_ORIGIN_CONCURRENT)
+        )
+        async with self._global_semaphore, origin_semaphore:
+            return await self.push_service.send_notification(
+                subscription,
+                NotificationPayload(**row.payload),
+                ttl=row.ttl,
+                urgency=row.urgency,
+                topic=row.topic,
+                session=self._http_session
+            )
+
+    def _backoff_delay(self, attempts: int) -> float:
+        """Экспоненциальная задержка с full jitter: random(0, min(max, base * 2^(n-1)))"""
+        ceiling = min(
+            self.settings.PUSH_OUTBOX_BACKOFF_MAX,
+            self.settings.PUSH_OUTBOX_BACKOFF_BASE * (2 ** max(0, attempts - 1))
+        )
+        return max(1.0, random.uniform(0, ceiling))
+
+    def _block_origin(self, origin: str, until: datetime):
+        current = self._origin_blocked_until.get(origin)
+        if current is None or current < until:
+            self._origin_blocked_until[origin] = until
+            logger.warning(f"🚦 Push-сервис {origin} ограничил частоту, пауза до {until.isoformat()}")
+
+    async def _maybe_purge(self):
+        """Раз в час удаляет старые завершенные записи"""
+        now = datetime.now(timezone.utc)
+        if self._last_purge and now - self._last_purge < timedelta(hours=1):
+            return
+        self._last_purge = now
+        async with AsyncSessionFactory() as db:
+            removed = await crud_push_outbox.purge_finished(
+                db, older_than_hours=self.settings.PUSH_OUTBOX_RETENTION_HOURS
+            )
+        if removed:
+            logger.info(f"🧹 Push outbox: удалено {removed} завершенных записей")
+
+
+# Глобальный экземпляр диспетчера (ленивая инициализация)
+_push_outbox_dispatcher = None
+
+def get_push_outbox_dispatcher() -> PushOutboxDispatcher:
+    """Получает экземпляр диспетчера push outbox (ленивая инициализация)"""
+    global _push_outbox_dispatcher
+    if _push_outbox_dispatcher is None:
+        _push_outbox_dispatcher = PushOutboxDispatcher()
+    return _push_outbox_dispatcher
@@ -0,0 +1,86 @@
+"""
+Кэш адресатов push-уведомлений по владельцу (бизнес-пользователю).
+
+Для каждого владельца в Redis хранится набор ID его активных подписок по типам
+уведомлений. Инвалидация - через номер версии: при подписке/отписке версия
+увеличивается, и все старые ключи перестают читаться (запись "устаревшего"
+результата, прочитанного до инвалидации, попадает в ключ старой версии).
+
+С PUSH_INCLUDE_UNOWNED_SUBSCRIPTIONS в набор входят и подписки без владельца,
+поэтому ключ учитывает и общую версию таких подписок (UNOWNED_TARGETS_VERSION_KEY).
+"""
+
+import json
+from typing import List, Optional
+
+import redis.asyncio as redis
+from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import get_settings
+from crud.push_subscription import crud_push_subscription
+
+OWNER_TARGETS_VERSION_KEY = "push:targets:owner:{user_id}:version"
+UNOWNED_TARGETS_VERSION_KEY = "push:targets:unowned:version"
+OWNER_TARGETS_KEY = "push:targets:owner:{user_id}:v{version}"
+OWNER_TARGETS_TTL = 600  # секунд
+
+
+async def get_owner_subscription_ids(
+    db: AsyncSession,
+    redis_client: Optional[redis.Redis],
+    *,
+    user_id: int,
+    notification_type: Optional[str] = None
+) -> List[int]:
+    """ID активных подписок владельца: сначала из Redis, при промахе - из БД"""
+    field = notification_type or "*"
+    include_unowned = get_settings().PUSH_INCLUDE_UNOWNED_SUBSCRIPTIONS
+    version = None
+
+    if redis_client:
+        try:
+            if include_unowned:
+                owner_version, unowned_version = await redis_client.mget(
+                    OWNER_TARGETS_VERSION_KEY.format(user_id=user_id), UNOWNED_TARGETS_VERSION_KEY
+                )
+                version = f"{owner_version or 0}.{unowned_version or 0}"
+            else:
+                version = await redis_client.get(OWNER_TARGETS_VERSION_KEY.format(user_id=user_id)) or "0"
+            cached = await redis_client.hget(OWNER_TARGETS_KEY.format(user_id=user_id, version=version), field)
+            if cached is not None:
+                return json.loads(cached)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось прочитать кэш push-адресатов владельца {user_id}: {e}")
+            version = None
+
+    subscription_ids = await crud_push_subscription.get_owner_subscription_ids(
+        db, user_id=user_id, notification_type=notification_type, include_unowned=include_unowned
+    )
+
+    if redis_client and version is not None:
+        try:
+            key = OWNER_TARGETS_KEY.format(user_id=user_id, version=version)
+            pipe = redis_client.pipeline()
+            pipe.hset(key, field, json.dumps(subscription_ids))
+            pipe.expire(key, OWNER_TARGETS_TTL)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сохранить кэш push-адресатов владельца {user_id}: {e}")
+
+    return subscription_ids
+
+
+async def invalidate_owner(redis_client: Optional[redis.Redis], *user_ids: Optional[int]):
+    """
+    Сбрасывает кэш адресатов для владельцев (вызывается при подписке/отписке).
+    None - подписка без владельца: сбрасывается кэш всех владельцев (общая версия).
+    """
+    if not redis_client:
+        return
+    for user_id in set(user_ids):
+        key = UNOWNED_TARGETS_VERSION_KEY if user_id is None else OWNER_TARGETS_VERSION_KEY.format(user_id=user_id)
+        try:
+            await redis_client.incr(key)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось инвалидировать кэш push-адресатов владельца {user_id}: {e}")
@@ -0,0 +1,161 @@
+"""
+Хранилище и раздача статических файлов (аватары и т.п.).
+
+Content-addressed хранение: файл лежит по пути, вычисленному из его sha256
+(data/cas/ab/<sha256>.<ext>), поэтому одинаковые файлы хранятся один раз,
+а URL однозначно определяет содержимое. Для таких файлов отдаются строгий ETag
+и Cache-Control: immutable - браузер и CDN кэшируют их навсегда.
+
+Раздача поддерживает условные запросы (If-None-Match -> 304), Range-запросы (206)
+и режим X-Accel-Redirect, в котором байты отдает nginx, минуя Python.
+"""
+
+import asyncio
+import mimetypes
+import os
+import re
+from email.utils import formatdate
+from pathlib import Path
+from typing import Optional, Tuple
+
+STATIC_ROOT = Path("data")
+CAS_DIR = STATIC_ROOT / "cas"
+STATIC_URL_PREFIX = "/static"
+CAS_URL_PREFIX = f"{STATIC_URL_PREFIX}/cas"
+
+# Имя файла начинается с sha256 - содержимое по этому имени никогда не меняется
+_CONTENT_HASH_NAME_RE = re.compile(r"^(?P<digest>[0-9a-f]{64})(?:_[0-9a-z]+)?\.[0-9a-z]+$")
+_RANGE_RE = re.compile(r"^bytes=(?P<start>\d*)-(?P<end>\d*)$")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+DEFAULT_CACHE_CONTROL = "public, max-age=86400"
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(ValueError):
+    """Запрошенный диапазон байт за пределами файла"""
+
+
+# ---------- Content-addressed хранилище ----------
+
+def cas_relative_path(digest: str, extension: str) -> str:
+    """Относительный путь внутри CAS: первые 2 символа хэша - подкаталог"""
+    return f"{digest[:2]}/{digest}.{extension.lower().lstrip('.')}"
+
+
+def cas_url(digest: str, extension: str) -> str:
+    return f"{CAS_URL_PREFIX}/{cas_relative_path(digest, extension)}"
+
+
+async def store_file(tmp_path: Path, digest: str, extension: str) -> str:
+    """
+    Кладет временный файл в CAS по его sha256 и возвращает URL.
+    Если такой файл уже есть - временный удаляется (дедупликация).
+    """
+    target = CAS_DIR / cas_relative_path(digest, extension)
+
+    def _store():
+        if target.exists():
+            tmp_path.unlink(missing_ok=True)
+            return
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, target)
+
+    await asyncio.to_thread(_store)
+    return cas_url(digest, extension)
+
+
+# ---------- Раздача ----------
+
+def resolve_static_path(relative_path: str) -> Optional[Path]:
+    """Безопасно разрешает путь внутри data/ (без выхода за пределы каталога)"""
+    root = STATIC_ROOT.resolve()
+    candidate = (root / relative_path).resolve()
+    if candidate != root and root not in candidate.parents:
+        return None
+    if not candidate.is_file():
+        return None
+    return candidate
+
+
+def is_content_addressed(path: Path) -> bool:
+    return _CONTENT_HASH_NAME_RE.match(path.name) is not None
+
+
+def make_etag(path: Path, stat_result: os.stat_result) -> str:
+    """
+    Строгий ETag: для content-addressed файлов - имя (оно и есть хэш содержимого),
+    для остальных - mtime + размер.
+    """
+    if is_content_addressed(path):
+        return f'"{path.stem}"'
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def cache_control_for(path: Path) -> str:
+    return IMMUTABLE_CACHE_CONTROL if is_content_addressed(path) else DEFAULT_CACHE_CONTROL
+
+
+def guess_content_type(path: Path) -> str:
+    content_type, _ = mimetypes.guess_type(path.name)
+    if path.suffix == ".webp":
+        return "image/webp"
+    return content_type or "application/octet-stream"
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Сравнение If-None-Match (поддерживает список и '*')"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def parse_range(range_header: Optional[str], file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    Разбирает заголовок Range с одним диапазоном. Возвращает (start, end) включительно
+    или None, если диапазон не задан/не поддерживается (тогда отдается весь файл).
+    """
+    if not range_header:
+        return None
+    match = _RANGE_RE.match(range_header.strip())
+    if not match:
+        # Несколько диапазонов и прочие единицы не поддерживаем - отдаем весь файл
+        return None
+
+    start_raw, end_raw = match.group("start"), match.group("end")
+    if not start_raw and not end_raw:
+        return None
+
+    if not start_raw:
+        # bytes=-N: последние N байт
+        suffix_length = int(end_raw)
+        if suffix_length == 0:
+            raise RangeNotSatisfiable()
+        start = max(0, file_size - suffix_length)
+        end = file_size - 1
+    else:
+        start = int(start_raw)
+        end = int(end_raw) if end_raw else file_size - 1
+        end = min(end, file_size - 1)
+
+    if start >= file_size or start > end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+def http_date(timestamp: float) -> str:
+    return formatdate(timestamp, usegmt=True)
+
+
+async def iter_file_range(path: Path, start: int, end: int):
+    """Асинхронно отдает байты [start, end] чанками, чтение - в потоке"""
+    with open(path, "rb") as file:
+        await asyncio.to_thread(file.seek, start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await asyncio.to_thread(file.read, min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Разовое заполнение календаря инвентаря (inventory_allocations) для бронирований,
+подтвержденных до его появления (миграция 20261019_07).
+
+Бронирования в статусах confirmed/in_use, которые еще не закончились и не имеют
+закрепленных единиц, получают их через allocate_booking_items - по порядку начала.
+Каждое бронирование закрепляется в своей точке сохранения: если единиц не хватает
+(инвентарь уже перебронирован), бронирование выводится в отчет, остальные продолжают
+обрабатываться. Повторный запуск безопасен - бронирования с единицами пропускаются.
+
+Использование:
+    python utils/backfill_inventory_allocations.py
+    python utils/backfill_inventory_allocations.py --dry-run
+"""
+
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import select, and_, exists, func
+
+from crud.inventory_allocation import (
+    allocate_booking_items, AllocationConflict, ALLOCATING_BOOKING_STATUSES, SERVICE_BUFFER
+)
+from db.session import AsyncSessionFactory
+from models.booking import Booking
+from models.inventory_allocation import InventoryAllocation
+
+
+def _pending_bookings_query():
+    """Незавершенные подтвержденные/выданные бронирования без единиц в календаре"""
+    ends_at = Booking.planned_start_time + func.make_interval(0, 0, 0, 0, Booking.duration_in_hours) + SERVICE_BUFFER
+    return (
+        select(Booking)
+        .where(
+            and_(
+                Booking.status.in_(ALLOCATING_BOOKING_STATUSES),
+                ends_at > func.now(),
+                ~exists().where(InventoryAllocation.booking_id == Booking.id)
+            )
+        )
+        .order_by(Booking.planned_start_time, Booking.id)
+    )
+
+
+async def backfill(dry_run: bool) -> bool:
+    """Закрепляет единицы. Возвращает True, если все бронирования получили единицы"""
+    allocated, skipped, conflicts = 0, 0, []
+    async with AsyncSessionFactory() as db:
+        bookings = (await db.execute(_pending_bookings_query())).scalars().all()
+        print(f"📋 Бронирований без единиц в календаре: {len(bookings)}")
+
+        for booking in bookings:
+            if not booking.selected_items:
+                skipped += 1
+                continue
+            try:
+                async with db.begin_nested():
+                    items = await allocate_booking_items(db, booking)
+            except AllocationConflict as e:
+                conflicts.append((booking.id, str(e)))
+                continue
+            allocated += 1
+            print(f"  ✅ #{booking.id} ({booking.status}, {booking.planned_start_time.isoformat()}): {items}")
+
+        if dry_run:
+            await db.rollback()
+        else:
+            await db.commit()
+
+    print(f"📊 Закреплено: {allocated}, без selected_items: {skipped}, конфликтов: {len(conflicts)}")
+    for booking_id, error in conflicts:
+        print(f"  ❌ #{booking_id}: {error}")
+    if dry_run:
+        print("ℹ️ --dry-run: изменения не сохранены")
+    return not conflicts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Заполнение календаря инвентаря для уже подтвержденных бронирований")
+    parser.add_argument("--dry-run", action="store_true", help="Только показать результат, не сохранять")
+    args = parser.parse_args()
+
+    ok = asyncio.run(backfill(args.dry_run))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
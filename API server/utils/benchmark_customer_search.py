@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк поиска клиентов (автодополнение) на большой базе.
+
+Заполняет базу тестовыми клиентами владельца (по умолчанию 100 000), прогоняет
+типичные запросы из поля поиска через customer_crud.search_customers и выводит
+p50/p95 задержки. Цель - не больше ~20 мс на запрос.
+
+Тестовые клиенты помечаются заметкой и удаляются после прогона (если не указан --keep).
+
+Использование:
+    python utils/benchmark_customer_search.py --owner-id 1
+    python utils/benchmark_customer_search.py --owner-id 1 --customers 100000 --repeat 50 --keep
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import delete, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from crud.customer import customer_crud
+from db.session import AsyncSessionFactory
+from models.customer import Customer
+
+BENCHMARK_NOTE = "benchmark:customer_search"
+INSERT_CHUNK_SIZE = 5000
+TARGET_MS = 20.0
+
+FIRST_NAMES = [
+    "Иван", "Петр", "Алексей", "Дмитрий", "Сергей", "Андрей", "Михаил", "Николай",
+    "Анна", "Мария", "Елена", "Ольга", "Татьяна", "Наталья", "Екатерина", "Юлия",
+]
+LAST_NAMES = [
+    "Иванов", "Петров", "Смирнов", "Кузнецов", "Попов", "Васильев", "Соколов", "Михайлов",
+    "Новиков", "Федоров", "Морозов", "Волков", "Алексеев", "Лебедев", "Семенов", "Егоров",
+]
+
+# Типичные фрагменты из поля поиска: короткие префиксы, подстроки, опечатки, цифры телефона
+QUERIES = ["и", "ив", "иван", "иванов", "ивнов", "петров м", "анна", "912", "+7 912 3", "45-67"]
+
+
+def _random_phone(number: int) -> str:
+    digits = f"9{number:09d}"
+    formats = [
+        f"+7{digits}",
+        f"+7 ({digits[:3]}) {digits[3:6]}-{digits[6:8]}-{digits[8:]}",
+        f"8{digits}",
+    ]
+    return random.choice(formats)
+
+
+def _random_customer(owner_id: int, number: int) -> dict:
+    first, last = random.choice(FIRST_NAMES), random.choice(LAST_NAMES)
+    if first.endswith("а") or first in ("Юлия", "Мария"):
+        last += "а"
+    return {
+        "name": f"{last} {first}",
+        "phone": _random_phone(number),
+        "business_owner_id": owner_id,
+        "notes": BENCHMARK_NOTE,
+    }
+
+
+async def seed(owner_id: int, count: int):
+    """Заполняет базу тестовыми клиентами пачками"""
+    print(f"📥 Добавляем {count} тестовых клиентов владельцу {owner_id}...")
+    started = time.perf_counter()
+    # Телефон уникален в пределах владельца (uq_customers_owner_phone_normalized):
+    # номера без повторов, а совпавшие с уже существующими клиентами пропускаются
+    numbers = random.sample(range(10**9), count)
+    inserted = 0
+    async with AsyncSessionFactory() as db:
+        for offset in range(0, count, INSERT_CHUNK_SIZE):
+            rows = [_random_customer(owner_id, number) for number in numbers[offset:offset + INSERT_CHUNK_SIZE]]
+            result = await db.execute(
+                pg_insert(Customer).values(rows).on_conflict_do_nothing().returning(Customer.id)
+            )
+            inserted += len(result.scalars().all())
+        await db.commit()
+        # Свежая статистика, чтобы планировщик выбрал trigram-индексы
+        await db.execute(text("ANALYZE customers"))
+        await db.commit()
+    print(f"✅ Добавлено {inserted} клиентов за {time.perf_counter() - started:.1f} с")
+
+
+async def cleanup(owner_id: int):
+    async with AsyncSessionFactory() as db:
+        result = await db.execute(
+            delete(Customer).where(
+                Customer.business_owner_id == owner_id,
+                Customer.notes == BENCHMARK_NOTE
+            )
+        )
+        await db.commit()
+    print(f"🧹 Удалено тестовых клиентов: {result.rowcount}")
+
+
+async def run(owner_id: int, repeat: int, limit: int) -> bool:
+    """Прогоняет запросы и печатает p50/p95. Возвращает True, если все укладываются в цель"""
+    all_ok = True
+    print()
+    print(f"{'запрос':<14}{'найдено':>9}{'p50, мс':>10}{'p95, мс':>10}")
+    print("-" * 43)
+    async with AsyncSessionFactory() as db:
+        # Прогрев соединения и кэша
+        await customer_crud.search_customers(db, owner_id, QUERIES[0], limit=limit)
+        for query in QUERIES:
+            timings = []
+            found = 0
+            for _ in range(repeat):
+                started = time.perf_counter()
+                customers = await customer_crud.search_customers(db, owner_id, query, limit=limit)
+                timings.append((time.perf_counter() - started) * 1000)
+                found = len(customers)
+            p50 = statistics.median(timings)
+            p95 = statistics.quantiles(timings, n=20)[-1] if len(timings) >= 2 else timings[0]
+            mark = "✅" if p95 <= TARGET_MS else "⚠️"
+            all_ok = all_ok and p95 <= TARGET_MS
+            print(f"{query!r:<14}{found:>9}{p50:>10.2f}{p95:>10.2f}  {mark}")
+    return all_ok
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк поиска клиентов")
+    parser.add_argument("--owner-id", type=int, required=True, help="ID существующего пользователя-владельца")
+    parser.add_argument("--customers", type=int, default=100_000, help="Сколько клиентов добавить")
+    parser.add_argument("--repeat", type=int, default=30, help="Повторов каждого запроса")
+    parser.add_argument("--limit", type=int, default=10, help="Лимит результатов (как у автодополнения)")
+    parser.add_argument("--skip-seed", action="store_true", help="Не добавлять клиентов (уже добавлены)")
+    parser.add_argument("--keep", action="store_true", help="Не удалять тестовых клиентов после прогона")
+    args = parser.parse_args()
+
+    print("🏄 Бенчмарк поиска клиентов")
+    print("=" * 43)
+
+    if not args.skip_seed:
+        await seed(args.owner_id, args.customers)
+    try:
+        ok = await run(args.owner_id, args.repeat, args.limit)
+    finally:
+        if not args.keep:
+            await cleanup(args.owner_id)
+
+    print()
+    print(f"{'✅' if ok else '⚠️'} Цель p95 <= {TARGET_MS:.0f} мс {'выполнена' if ok else 'не выполнена'}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Нагрузочная проверка резервирования инвентаря при конкуренции.
+
+Создает временный тип инвентаря с N единицами и запускает много параллельных
+reserve_inventory_items (каждая - в своей сессии). Проверяет, что:
+- ни одна единица не попала в два бронирования;
+- зарезервировано ровно столько единиц, сколько вернули успешные вызовы;
+- неуспешные вызовы (не хватило единиц) ничего не оставили за собой.
+
+Временный тип и его единицы удаляются после прогона.
+
+Использование:
+    python utils/stress_inventory_reservation.py
+    python utils/stress_inventory_reservation.py --items 50 --workers 200 --per-booking 3
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import select, delete, insert
+
+from crud.inventory import reserve_inventory_items
+from db.session import AsyncSessionFactory
+from models.inventory_type import InventoryType, InventoryItem
+
+
+async def create_fixture(items: int) -> tuple:
+    """Временный тип инвентаря с items свободными единицами"""
+    type_name = f"stress-{uuid.uuid4().hex[:8]}"
+    async with AsyncSessionFactory() as db:
+        inventory_type = InventoryType(
+            name=type_name,
+            display_name=f"Стресс-тест {type_name}",
+            is_active=False,  # Не показывается в интерфейсе и статистике
+            affects_availability=False,
+            board_equivalent=0
+        )
+        db.add(inventory_type)
+        await db.flush()
+        await db.execute(insert(InventoryItem), [
+            {"inventory_type_id": inventory_type.id, "name": f"{type_name} #{i + 1}", "status": "available"}
+            for i in range(items)
+        ])
+        await db.commit()
+        return inventory_type.id, type_name
+
+
+async def cleanup(type_id: int):
+    async with AsyncSessionFactory() as db:
+        await db.execute(delete(InventoryItem).where(InventoryItem.inventory_type_id == type_id))
+        await db.execute(delete(InventoryType).where(InventoryType.id == type_id))
+        await db.commit()
+
+
+async def reserve(type_name: str, quantity: int, booking_id: str, start: asyncio.Event):
+    await start.wait()
+    async with AsyncSessionFactory() as db:
+        try:
+            reserved = await reserve_inventory_items(db, {type_name: quantity}, booking_id)
+            return booking_id, reserved[type_name]
+        except ValueError:
+            return booking_id, None
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Стресс-тест резервирования инвентаря")
+    parser.add_argument("--items", type=int, default=30, help="Единиц инвентаря")
+    parser.add_argument("--workers", type=int, default=100, help="Параллельных резервирований")
+    parser.add_argument("--per-booking", type=int, default=2, help="Единиц на одно бронирование")
+    args = parser.parse_args()
+
+    print("🏄 Стресс-тест резервирования инвентаря")
+    print("=" * 50)
+
+    type_id, type_name = await create_fixture(args.items)
+    print(f"📦 Создан временный тип '{type_name}' с {args.items} единицами")
+
+    try:
+        start = asyncio.Event()
+        tasks = [
+            asyncio.create_task(reserve(type_name, args.per_booking, f"stress-{i}", start))
+            for i in range(args.workers)
+        ]
+        started = time.perf_counter()
+        start.set()
+        results = await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+        succeeded = {booking_id: ids for booking_id, ids in results if ids is not None}
+        returned_ids = [item_id for ids in succeeded.values() for item_id in ids]
+        duplicates = [item_id for item_id, count in Counter(returned_ids).items() if count > 1]
+
+        async with AsyncSessionFactory() as db:
+            rows = (await db.execute(
+                select(InventoryItem.id, InventoryItem.status, InventoryItem.current_booking_id)
+                .where(InventoryItem.inventory_type_id == type_id)
+            )).all()
+
+        booked_in_db = {row.id: row.current_booking_id for row in rows if row.status == "booked"}
+        mismatched = [
+            item_id for booking_id, ids in succeeded.items() for item_id in ids
+            if booked_in_db.get(item_id) != booking_id
+        ]
+
+        print(f"⏱️ {args.workers} резервирований за {elapsed * 1000:.0f} мс")
+        print(f"✅ Успешных: {len(succeeded)}, отказов: {args.workers - len(succeeded)}")
+        print(f"📋 Зарезервировано в БД: {len(booked_in_db)} из {args.items}")
+
+        ok = True
+        if duplicates:
+            ok = False
+            print(f"❌ Единицы в нескольких бронированиях: {duplicates}")
+        if mismatched:
+            ok = False
+            print(f"❌ current_booking_id не совпадает с результатом для единиц: {mismatched}")
+        if len(booked_in_db) != len(returned_ids):
+            ok = False
+            print(f"❌ В БД {len(booked_in_db)} занятых единиц, вызовы вернули {len(returned_ids)}")
+        if len(succeeded) < min(args.workers, args.items // args.per_booking):
+            # SKIP LOCKED не должен отказывать, пока свободных единиц хватает
+            print(f"⚠️ Успешных меньше возможного: {len(succeeded)} < {min(args.workers, args.items // args.per_booking)}")
+
+        print()
+        print("✅ Двойных резервирований нет" if ok else "❌ Проверка не пройдена")
+        return 0 if ok else 1
+    finally:
+        await cleanup(type_id)
+        print("🧹 Временный тип инвентаря удален")
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -97,7 +97,7 @@ async def reload_tasks(request: Request):
                 detail="Шедулер не инициализирован"
             )
             
-        success = scheduler.reload_scheduled_tasks()
+        success = await scheduler.reload_scheduled_tasks()
         if success:
             return {
                 "status": "success",
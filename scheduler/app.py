@@ -58,6 +58,7 @@ except ImportError:
     raise
 
 from fastapi import FastAPI, HTTPException
+from prometheus_client import make_asgi_app
 
 # Импорты (абсолютные пути)
 from api_scheduler.schedule.routes import router as schedule_router
@@ -66,6 +67,8 @@ from api_scheduler.schedule.notifications.routes import router as notification_r
 from core.config import scheduler_settings
 from scheduler import InventoryScheduler
 from services.database_service import DatabaseService
+from services.http_clients import http_clients
+from tasks.booking_status_automation.event_worker import get_booking_automation_worker
 
 
 @asynccontextmanager
@@ -97,6 +100,9 @@ async def lifespan(app: FastAPI):
         app.state.db_service = db_service
         logger.info("✅ Подключение к базе данных успешно установлено!")
         
+        # Общие HTTP-клиенты с пулом соединений для всех задач шедулера
+        await http_clients.start()
+        
         # Проверяем наличие требуемых таблиц
         logger.info("🔍 Проверка наличия необходимых таблиц...")
         if not await db_service.check_tables_exist():
@@ -104,11 +110,10 @@ async def lifespan(app: FastAPI):
         # Короткая проверка доступности API сервера без блокировки
         logger.info("🔌 Проверка доступности API сервера...")
         try:
-            import requests
             api_url = scheduler_settings.API_URL
             base_api_url = str(api_url).rstrip('/')
             health_check_url = f"{base_api_url}/health"
-            response = requests.get(health_check_url, timeout=1)
+            response = await http_clients.get("api").get(health_check_url, timeout=1)
             if response.status_code == 200:
                 logger.info(f"✅ API сервер доступен: {health_check_url}")
             else:
@@ -120,9 +125,8 @@ async def lifespan(app: FastAPI):
         logger.info("🔌 Проверка доступности Telegram бота...")
         telegram_bot_available = False
         try:
-            import requests
             bot_url = "http://bot:8003" 
-            bot_response = requests.get(f"{bot_url}/health", timeout=1)
+            bot_response = await http_clients.get("bot").get(f"{bot_url}/health", timeout=1)
             if bot_response.status_code == 200:
                 telegram_bot_available = True
                 logger.info(f"✅ Telegram бот доступен: {bot_url}")
@@ -132,7 +136,7 @@ async def lifespan(app: FastAPI):
                     logger.info(f"🔍 Проверка URL: {bot_send_message_health_url}")
                     
                     # Запрашиваем эндпоинт
-                    send_message_response = requests.get(bot_send_message_health_url, timeout=2)
+                    send_message_response = await http_clients.get("bot").get(bot_send_message_health_url, timeout=2)
                     if send_message_response.status_code == 200:
                         logger.info(f"✅ ✅ ✅ ЭНДПОИНТ ОТПРАВКИ СООБЩЕНИЙ БОТА ДОСТУПЕН: {bot_send_message_health_url}")
                         
@@ -164,6 +168,7 @@ async def lifespan(app: FastAPI):
         app.state.scheduler_instance = scheduler_instance
         
         try:
+            await scheduler_instance.start_sharding()
             scheduler_instance.start()
             logger.info("✅ Шедулер успешно запущен.")
             logger.info("🔄 Запуск фоновой загрузки активных задач...")
@@ -173,7 +178,23 @@ async def lifespan(app: FastAPI):
             # Запускаем автоматизацию статусов бронирований
             logger.info("🤖 Запуск автоматизации статусов бронирований...")
             try:
-                await scheduler_instance.task_manager.schedule_booking_status_automation()
+                if scheduler_settings.BOOKING_AUTOMATION_DIRECT_DB:
+                    get_booking_automation_worker().use_database(db_pool)
+                try:
+                    # Отметки отправленных уведомлений в Redis (переживают перезапуск, общие для реплик)
+                    await get_booking_automation_worker().connect()
+                except Exception as redis_error:
+                    logger.warning(f"⚠️ Redis недоступен, отметки уведомлений хранятся локально: {redis_error}")
+                if scheduler_settings.BOOKING_AUTOMATION_EVENT_DRIVEN:
+                    try:
+                        await get_booking_automation_worker().start()
+                    except Exception as worker_error:
+                        # Без Redis остаемся на ежеминутном опросе
+                        logger.error(f"❌ Событийный режим недоступен, используется опрос: {worker_error}")
+                        scheduler_settings.BOOKING_AUTOMATION_EVENT_DRIVEN = False
+                # Cron-задача лежит в общем jobstore - пересоздает ее только лидер
+                if scheduler_instance.is_reconciliation_leader():
+                    await scheduler_instance.task_manager.schedule_booking_status_automation()
                 logger.info("✅ Автоматизация статусов бронирований запущена")
             except Exception as automation_error:
                 logger.error(f"❌ Ошибка запуска автоматизации статусов: {automation_error}")
@@ -188,11 +209,23 @@ async def lifespan(app: FastAPI):
         # Перевыбрасываем исключение, чтобы FastAPI понял, что запуск не удался
         raise HTTPException(status_code=500, detail=f"Ошибка инициализации: {str(e)}")
     finally:
+        # Останавливаем воркер событийной автоматизации статусов
+        await get_booking_automation_worker().stop()
+
         # Останавливаем шедулер, если он был создан и запущен
         if hasattr(app.state, 'scheduler_instance') and app.state.scheduler_instance and app.state.scheduler_instance.is_running():
             logger.info("👋 Остановка шедулера...")
             app.state.scheduler_instance.stop()
             logger.info("✅ Шедулер остановлен.")
+        if hasattr(app.state, 'scheduler_instance') and app.state.scheduler_instance:
+            await app.state.scheduler_instance.stop_sharding()
+            
+        # Закрываем общие HTTP-клиенты
+        await http_clients.close()
+
+        # Отправляем накопленные NOTIFY до закрытия пула
+        if hasattr(app.state, 'db_service') and app.state.db_service:
+            await app.state.db_service.notify_publisher.stop()
             
         # Закрываем пул соединений при завершении
         if db_pool:
@@ -208,6 +241,9 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Метрики Prometheus (выполнение задач, задержки, пропуски)
+app.mount("/metrics", make_asgi_app())
+
 # Подключаем роутеры
 app.include_router(schedule_router, prefix="/scheduler")
 app.include_router(availability_router, prefix="/scheduler")
@@ -55,6 +55,50 @@ class SchedulerSettings(BaseSettings):
     WEBSOCKET_URL: str = Field(default='ws://websocket:8002/ws', env='WEBSOCKET_URL')
     WEBSOCKET_CHANNEL: str = Field(default='websocket_channel', env='WEBSOCKET_CHANNEL')
 
+    # --- Настройки автоматизации статусов бронирований ---
+    # Событийный режим: воркер просыпается к ближайшему переходу из Redis ZSET,
+    # периодическая задача выполняет только полную сверку раз в BOOKING_AUTOMATION_RESYNC_MINUTES
+    BOOKING_AUTOMATION_EVENT_DRIVEN: bool = Field(True, validation_alias='BOOKING_AUTOMATION_EVENT_DRIVEN')
+    BOOKING_AUTOMATION_RESYNC_MINUTES: int = Field(15, validation_alias='BOOKING_AUTOMATION_RESYNC_MINUTES')
+    BOOKING_AUTOMATION_MAX_IDLE_SECONDS: int = Field(60, validation_alias='BOOKING_AUTOMATION_MAX_IDLE_SECONDS')
+    BOOKING_AUTOMATION_REDIS_DB: int = Field(0, validation_alias='BOOKING_AUTOMATION_REDIS_DB') # БД, в которую пишет API
+    # Чтение кандидатов и переходы статусов напрямую в PostgreSQL (без выгрузки через API)
+    BOOKING_AUTOMATION_DIRECT_DB: bool = Field(True, validation_alias='BOOKING_AUTOMATION_DIRECT_DB')
+    # Сколько хранятся отметки отправленных уведомлений по бронированию
+    BOOKING_NOTIFICATION_DEDUP_TTL_HOURS: int = Field(24, validation_alias='BOOKING_NOTIFICATION_DEDUP_TTL_HOURS')
+
+    # --- Настройки HTTP-клиентов (общий пул соединений на адресата) ---
+    HTTP2_ENABLED: bool = Field(True, validation_alias='HTTP2_ENABLED')
+    HTTP_KEEPALIVE_EXPIRY: float = Field(30.0, validation_alias='HTTP_KEEPALIVE_EXPIRY')
+    HTTP_CONNECT_TIMEOUT: float = Field(5.0, validation_alias='HTTP_CONNECT_TIMEOUT')
+    HTTP_API_MAX_CONNECTIONS: int = Field(20, validation_alias='HTTP_API_MAX_CONNECTIONS')
+    HTTP_API_TIMEOUT: float = Field(30.0, validation_alias='HTTP_API_TIMEOUT')
+    HTTP_BOT_MAX_CONNECTIONS: int = Field(20, validation_alias='HTTP_BOT_MAX_CONNECTIONS')
+    HTTP_BOT_TIMEOUT: float = Field(15.0, validation_alias='HTTP_BOT_TIMEOUT')
+    HTTP_DEFAULT_MAX_CONNECTIONS: int = Field(10, validation_alias='HTTP_DEFAULT_MAX_CONNECTIONS')
+    HTTP_DEFAULT_TIMEOUT: float = Field(10.0, validation_alias='HTTP_DEFAULT_TIMEOUT')
+
+    # --- Настройки рассылки в Telegram ---
+    TELEGRAM_GLOBAL_RATE_PER_SECOND: float = Field(25.0, validation_alias='TELEGRAM_GLOBAL_RATE_PER_SECOND') # Лимит Telegram ~30/с на бота
+    TELEGRAM_MAX_CONCURRENT_CHATS: int = Field(20, validation_alias='TELEGRAM_MAX_CONCURRENT_CHATS')
+    TELEGRAM_PER_CHAT_INTERVAL: float = Field(0.3, validation_alias='TELEGRAM_PER_CHAT_INTERVAL') # Пауза между частями в одном чате
+
+    # --- Настройки NOTIFY для WebSocket сервиса ---
+    NOTIFY_BATCH_INTERVAL_MS: int = Field(50, validation_alias='NOTIFY_BATCH_INTERVAL_MS') # Окно сбора событий в пачку
+    NOTIFY_MAX_BATCH_EVENTS: int = Field(100, validation_alias='NOTIFY_MAX_BATCH_EVENTS') # При стольких событиях отправка сразу
+    WS_OUTBOX_RETENTION_HOURS: int = Field(24, validation_alias='WS_OUTBOX_RETENTION_HOURS') # Срок хранения больших событий
+
+    # --- Шардирование задач между репликами шедулера ---
+    SCHEDULER_SHARDING_ENABLED: bool = Field(False, validation_alias='SCHEDULER_SHARDING_ENABLED') # Включать при нескольких репликах
+    SCHEDULER_SHARD_COUNT: int = Field(64, validation_alias='SCHEDULER_SHARD_COUNT') # Одинаковое на всех репликах
+    SCHEDULER_SHARD_LEASE_SECONDS: float = Field(15.0, validation_alias='SCHEDULER_SHARD_LEASE_SECONDS')
+    SCHEDULER_REPLICA_ID: Optional[str] = Field(None, validation_alias='SCHEDULER_REPLICA_ID') # По умолчанию hostname:pid
+
+    # --- Профилирование долгих задач (выключено по умолчанию) ---
+    SCHEDULER_PROFILE_SLOW_JOBS: bool = Field(False, validation_alias='SCHEDULER_PROFILE_SLOW_JOBS')
+    SCHEDULER_SLOW_JOB_THRESHOLD_SECONDS: float = Field(30.0, validation_alias='SCHEDULER_SLOW_JOB_THRESHOLD_SECONDS')
+    SCHEDULER_PROFILE_SAMPLE_INTERVAL_SECONDS: float = Field(1.0, validation_alias='SCHEDULER_PROFILE_SAMPLE_INTERVAL_SECONDS')
+
     # --- Настройки логирования ---
     LOG_LEVEL: str = Field("INFO", validation_alias='LOG_LEVEL')
 
@@ -1,10 +1,13 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES
 import pytz
 import logging
 import asyncio 
 from tasks.task_manager import TaskManager
 from core.config import scheduler_settings as default_settings 
 from services.database_service import DatabaseService
+from services.job_metrics import InstrumentedAsyncIOExecutor, max_instances_listener
+from services.scheduler_sharding import ShardLeaseManager, ShardedRedisJobStore
 import traceback
 
 logger = logging.getLogger('Scheduler')
@@ -26,24 +29,17 @@ class InventoryScheduler:
         except ImportError:
             raise
 
-        jobstores = {
-            'default': { 'type': 'redis',
-                         'host': self.settings.REDIS_HOST,
-                         'port': self.settings.REDIS_PORT,
-                         'db': self.settings.REDIS_DB_SCHEDULER,
-                         'password': self.settings.REDIS_PASSWORD
-                       }
-        }
-
-        job_defaults = {
-            'coalesce': False,
-            'max_instances': 3
-        }
-        self.scheduler = AsyncIOScheduler(
-            jobstores=jobstores,
-            job_defaults=job_defaults,
-            timezone=self.timezone,
-        )
+        # Несколько реплик: каждая выполняет только задачи своих шардов (аренды в Redis)
+        self.shard_leases = None
+        if self.settings.SCHEDULER_SHARDING_ENABLED:
+            self.shard_leases = ShardLeaseManager(
+                self.settings,
+                on_rebalance=self._on_shards_rebalanced,
+                on_leader=self._on_leader_acquired
+            )
+
+        self.scheduler = AsyncIOScheduler(**self._scheduler_options())
+        self.scheduler.add_listener(max_instances_listener, EVENT_JOB_MAX_INSTANCES)
         redis_host = self.settings.REDIS_HOST
         redis_port = self.settings.REDIS_PORT
         redis_db = self.settings.REDIS_DB_SCHEDULER
@@ -54,6 +50,36 @@ class InventoryScheduler:
         # Инициализируем менеджер задач, передаем настройки и сервис БД
         self.task_manager = TaskManager(self.scheduler, self.settings, self.db_service) 
 
+    def _scheduler_options(self):
+        """
+        Конфигурация APScheduler. Собирается заново при каждом вызове: configure()
+        сбрасывает jobstores/executors и изменяет переданные словари.
+        """
+        redis_options = {
+            'host': self.settings.REDIS_HOST,
+            'port': self.settings.REDIS_PORT,
+            'db': self.settings.REDIS_DB_SCHEDULER,
+            'password': self.settings.REDIS_PASSWORD
+        }
+        if self.shard_leases:
+            jobstore = ShardedRedisJobStore(self.shard_leases, **redis_options)
+        else:
+            jobstore = {'type': 'redis', **redis_options}
+        return {
+            'jobstores': {
+                'default': jobstore
+            },
+            # Executor с метриками выполнения задач (см. services/job_metrics.py)
+            'executors': {
+                'default': InstrumentedAsyncIOExecutor()
+            },
+            'job_defaults': {
+                'coalesce': False,
+                'max_instances': 3
+            },
+            'timezone': self.timezone,
+        }
+
     def start(self):
         """Запуск планировщика"""
         try:
@@ -61,7 +87,9 @@ class InventoryScheduler:
 
                 try:
                     loop = asyncio.get_running_loop()
-                    self.scheduler.configure(event_loop=loop)
+                    # configure() перенастраивает планировщик целиком - передаем всю конфигурацию,
+                    # иначе RedisJobStore и executor заменятся значениями по умолчанию
+                    self.scheduler.configure(event_loop=loop, **self._scheduler_options())
                     logger.info(f"Планировщик будет использовать существующий event loop: {loop}")
                 except RuntimeError:
 
@@ -80,6 +108,30 @@ class InventoryScheduler:
             logger.error(traceback.format_exc()) # Добавим трейсбек для детальной ошибки
             raise
 
+    async def start_sharding(self):
+        """Получает аренды шардов до запуска планировщика (если шардирование включено)"""
+        if self.shard_leases:
+            await self.shard_leases.start()
+
+    async def stop_sharding(self):
+        """Отпускает аренды шардов, чтобы их сразу забрали другие реплики"""
+        if self.shard_leases:
+            await self.shard_leases.stop()
+
+    def _on_shards_rebalanced(self):
+        # Новые шарды или задачи, добавленные другой репликой, - пересчитываем расписание
+        if self._is_running:
+            self.scheduler.wakeup()
+
+    def _on_leader_acquired(self):
+        # Лидер сменился (прежний мог упасть посреди сверки) - сверяем задачи здесь
+        if self._is_running:
+            asyncio.create_task(self.reload_scheduled_tasks())
+
+    def is_reconciliation_leader(self):
+        """Сверяет ли эта реплика jobstore с БД (без шардирования - всегда)"""
+        return self.shard_leases is None or self.shard_leases.is_leader
+
     def stop(self):
         """Остановка планировщика"""
         if self._is_running:
@@ -102,6 +154,11 @@ class InventoryScheduler:
                 logger.error("Сервис БД не инициализирован, невозможно загрузить задачи")
                 return False
 
+            if not self.is_reconciliation_leader():
+                # Jobstore общий: сверку выполняет только реплика-лидер
+                logger.info("ℹ️ Реплика не лидер, сверку задач выполняет другая реплика")
+                return False
+
 
             result = await self.task_manager.reload_tasks() 
             
@@ -0,0 +1,133 @@
+"""
+Прямой доступ автоматизации статусов бронирований к PostgreSQL.
+
+Вместо выгрузки всех активных бронирований через API и PATCH на каждый переход
+шедулер выбирает кандидатов запросом по окну времени, а переходы одного типа
+применяет одним UPDATE ... RETURNING. Пороги совпадают с правилами
+BookingStatusAutomationTask._process_booking.
+"""
+
+import logging
+from datetime import datetime
+from typing import Any, Dict, List
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_BOOKING_STATUSES = ['booked', 'pending_confirmation', 'confirmed', 'in_use']
+
+# Поля бронирования в том же виде, что отдает API (client_name - из клиента, если он есть)
+_BOOKING_COLUMNS = """
+    b.id, b.status, b.planned_start_time, b.actual_start_time, b.duration_in_hours,
+    b.business_owner_id, b.customer_id, COALESCE(c.name, b.client_name) AS client_name
+"""
+
+# Окна уведомлений: "скоро придет"/"опаздывает" - начало в [-15, +20] минут,
+# "время возврата"/"просрочка возврата" - возврат в [-60, +15] минут
+_SELECT_WINDOW_SQL = f"""
+    SELECT {_BOOKING_COLUMNS}
+    FROM bookings b
+    LEFT JOIN customers c ON c.id = b.customer_id
+    WHERE (
+        b.status IN ('booked', 'pending_confirmation', 'confirmed')
+        AND b.planned_start_time BETWEEN $1 - interval '15 minutes' AND $1 + interval '20 minutes'
+    ) OR (
+        b.status = 'in_use'
+        AND b.actual_start_time IS NOT NULL
+        AND b.actual_start_time + make_interval(hours => COALESCE(b.duration_in_hours, 4))
+            BETWEEN $1 - interval '60 minutes' AND $1 + interval '15 minutes'
+    )
+"""
+
+_SELECT_ACTIVE_SQL = f"""
+    SELECT {_BOOKING_COLUMNS}
+    FROM bookings b
+    LEFT JOIN customers c ON c.id = b.customer_id
+    WHERE b.status = ANY($1::text[])
+"""
+
+_SELECT_BY_IDS_SQL = f"""
+    SELECT {_BOOKING_COLUMNS}
+    FROM bookings b
+    LEFT JOIN customers c ON c.id = b.customer_id
+    WHERE b.id = ANY($1::int[])
+"""
+
+# BOOKED -> PENDING_CONFIRMATION за 60 минут до начала
+_APPLY_PENDING_CONFIRMATION_SQL = f"""
+    WITH moved AS (
+        UPDATE bookings
+        SET status = 'pending_confirmation', updated_at = now()
+        WHERE status = 'booked'
+          AND planned_start_time BETWEEN $1 AND $1 + interval '60 minutes'
+        RETURNING *
+    )
+    SELECT {_BOOKING_COLUMNS}, 'booked' AS previous_status
+    FROM moved b
+    LEFT JOIN customers c ON c.id = b.customer_id
+"""
+
+# PENDING_CONFIRMATION -> NO_SHOW после 120 минут, BOOKED/CONFIRMED -> NO_SHOW после 90 минут.
+# Закрепленные за неявкой единицы инвентаря освобождаются в том же запросе
+_APPLY_NO_SHOW_SQL = f"""
+    WITH due AS (
+        SELECT id, status AS previous_status
+        FROM bookings
+        WHERE (status = 'pending_confirmation' AND planned_start_time < $1 - interval '120 minutes')
+           OR (status IN ('booked', 'confirmed') AND planned_start_time < $1 - interval '90 minutes')
+        FOR UPDATE SKIP LOCKED
+    ), moved AS (
+        UPDATE bookings
+        SET status = 'no_show', updated_at = now()
+        FROM due
+        WHERE bookings.id = due.id
+        RETURNING bookings.*, due.previous_status
+    ), released AS (
+        DELETE FROM inventory_allocations a
+        USING moved
+        WHERE a.booking_id = moved.id
+    )
+    SELECT {_BOOKING_COLUMNS}, b.previous_status
+    FROM moved b
+    LEFT JOIN customers c ON c.id = b.customer_id
+"""
+
+
+class BookingAutomationRepository:
+    """Запросы автоматизации статусов бронирований поверх пула asyncpg шедулера"""
+
+    def __init__(self, pool: asyncpg.Pool):
+        self.pool = pool
+
+    async def fetch_window_bookings(self, now: datetime) -> List[Dict[str, Any]]:
+        """Бронирования, у которых сейчас открыто окно уведомления"""
+        async with self.pool.acquire() as conn:
+            records = await conn.fetch(_SELECT_WINDOW_SQL, now)
+        return [dict(record) for record in records]
+
+    async def fetch_active_bookings(self) -> List[Dict[str, Any]]:
+        """Все активные бронирования (полная сверка очереди переходов)"""
+        async with self.pool.acquire() as conn:
+            records = await conn.fetch(_SELECT_ACTIVE_SQL, ACTIVE_BOOKING_STATUSES)
+        return [dict(record) for record in records]
+
+    async def fetch_bookings(self, booking_ids: List[int]) -> List[Dict[str, Any]]:
+        """Актуальное состояние бронирований по id (удаленные не возвращаются)"""
+        if not booking_ids:
+            return []
+        async with self.pool.acquire() as conn:
+            records = await conn.fetch(_SELECT_BY_IDS_SQL, booking_ids)
+        return [dict(record) for record in records]
+
+    async def apply_pending_confirmation(self, now: datetime) -> List[Dict[str, Any]]:
+        """Переводит в PENDING_CONFIRMATION все бронирования, до начала которых <= 60 минут"""
+        async with self.pool.acquire() as conn:
+            records = await conn.fetch(_APPLY_PENDING_CONFIRMATION_SQL, now)
+        return [dict(record) for record in records]
+
+    async def apply_no_show(self, now: datetime) -> List[Dict[str, Any]]:
+        """Переводит в NO_SHOW все просроченные бронирования, возвращает их с previous_status"""
+        async with self.pool.acquire() as conn:
+            records = await conn.fetch(_APPLY_NO_SHOW_SQL, now)
+        return [dict(record) for record in records]
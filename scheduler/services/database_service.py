@@ -7,6 +7,8 @@ from datetime import datetime, timezone, timedelta
 import traceback
 import asyncpg
 
+from services.notify_publisher import NotifyPublisher
+
 logger = logging.getLogger(__name__)
 
 # Функция-помощник для преобразования asyncpg.Record в dict
@@ -42,12 +44,22 @@ def _prepare_data_for_json(data: Any) -> Any:
         # Возвращаем другие типы как есть
         return data
 
+# Сохранение задачи: вставка или обновление по уникальному task_name
+UPSERT_TASK_SQL = """
+    INSERT INTO scheduler_tasks (task_name, payload, scheduled_for, status)
+    VALUES ($1, $2, $3, 'pending')
+    ON CONFLICT (task_name) DO UPDATE
+    SET payload = EXCLUDED.payload, scheduled_for = EXCLUDED.scheduled_for, status = 'pending'
+"""
+
 class DatabaseService:
     """Сервис для работы с базой данных PostgreSQL для шедулера, использующий asyncpg"""
     
     def __init__(self, pool: asyncpg.Pool):
         """Инициализация сервиса с пулом соединений asyncpg"""
         self.pool = pool
+        # События для WebSocket сервиса: пачки pg_notify, большие payload - через ws_outbox
+        self.notify_publisher = NotifyPublisher(pool)
         logger.info(f"✅ DatabaseService шедулера инициализирован с пулом соединений asyncpg")
 
     async def close_connection(self):
@@ -83,6 +95,41 @@ class DatabaseService:
             logger.error(traceback.format_exc())
             return False
 
+    @staticmethod
+    def _task_row(task_data: Dict[str, Any]) -> Optional[tuple]:
+        """Задача -> (task_name, payload, scheduled_for) для scheduler_tasks; None, если данных не хватает"""
+        # Адаптируем данные под существующую структуру таблицы
+        task_id = task_data.get('task_id')
+        task_type = task_data.get('task_type')
+        next_run_time = task_data.get('next_run_time')
+
+        if not task_id or not task_type or not next_run_time:
+            logger.error(f"Недостаточно данных для сохранения задачи: {task_data}")
+            return None
+
+        # Создаем payload с метаданными
+        payload = {
+            'chat_id': task_data.get('chat_id'),
+            'task_type': task_type,
+            'data': task_data.get('data', {})
+        }
+
+        # Преобразуем next_run_time в datetime если это строка
+        if isinstance(next_run_time, str):
+            try:
+                next_run_time = datetime.fromisoformat(next_run_time.replace('Z', '+00:00'))
+            except ValueError as e:
+                logger.error(f"Ошибка парсинга next_run_time для задачи {task_id}: {e}")
+                return None
+
+        # Убедимся, что время в UTC
+        if next_run_time.tzinfo is None:
+            next_run_time = next_run_time.replace(tzinfo=timezone.utc)
+        elif next_run_time.tzinfo.utcoffset(next_run_time) != timedelta(0):
+            next_run_time = next_run_time.astimezone(timezone.utc)
+
+        return task_id, json.dumps(payload), next_run_time
+
     async def save_task(self, task_data: Dict[str, Any]) -> bool:
         """Сохраняет задачу в PostgreSQL таблицу scheduler_tasks (с адаптацией к существующей структуре)"""
         if not self.pool:
@@ -90,73 +137,46 @@ class DatabaseService:
             return False
             
         try:
-            # Адаптируем данные под существующую структуру таблицы
-            task_id = task_data.get('task_id')
-            chat_id = task_data.get('chat_id') 
-            task_type = task_data.get('task_type')
-            next_run_time = task_data.get('next_run_time')
-            data = task_data.get('data', {})
-            
-            if not task_id or not task_type or not next_run_time:
-                logger.error(f"Недостаточно данных для сохранения задачи: {task_data}")
+            row = self._task_row(task_data)
+            if row is None:
                 return False
-            
-            # Создаем payload с метаданными
-            payload = {
-                'chat_id': chat_id,
-                'task_type': task_type,
-                'data': data
-            }
-            
-            # Преобразуем next_run_time в datetime если это строка
-            if isinstance(next_run_time, str):
-                try:
-                    next_run_time = datetime.fromisoformat(next_run_time.replace('Z', '+00:00'))
-                except ValueError as e:
-                    logger.error(f"Ошибка парсинга next_run_time: {e}")
-                    return False
-            
-            # Убедимся, что время в UTC
-            if next_run_time.tzinfo is None:
-                next_run_time = next_run_time.replace(tzinfo=timezone.utc)
-            elif next_run_time.tzinfo.utcoffset(next_run_time) != timedelta(0):
-                next_run_time = next_run_time.astimezone(timezone.utc)
 
             async with self.pool.acquire() as conn:
-                # Проверяем, существует ли задача
-                exists = await conn.fetchval(
-                    "SELECT EXISTS(SELECT 1 FROM scheduler_tasks WHERE task_name = $1)",
-                    task_id
-                )
-                
-                if exists:
-                    # Обновляем существующую задачу
-                    await conn.execute(
-                        """
-                        UPDATE scheduler_tasks 
-                        SET payload = $2, scheduled_for = $3, status = 'pending'
-                        WHERE task_name = $1
-                        """,
-                        task_id, json.dumps(payload), next_run_time
-                    )
-                    logger.debug(f"Обновлена задача {task_id} в PostgreSQL")
-                else:
-                    # Создаем новую задачу
-                    await conn.execute(
-                        """
-                        INSERT INTO scheduler_tasks (task_name, payload, scheduled_for, status)
-                        VALUES ($1, $2, $3, 'pending')
-                        """,
-                        task_id, json.dumps(payload), next_run_time
-                    )
-                    logger.debug(f"Создана задача {task_id} в PostgreSQL")
-                
+                # Один запрос вместо SELECT EXISTS + UPDATE/INSERT
+                await conn.execute(UPSERT_TASK_SQL, *row)
+                logger.debug(f"Сохранена задача {row[0]} в PostgreSQL")
                 return True
         except Exception as e:
             logger.error(f"Ошибка при сохранении задачи в PostgreSQL: {str(e)}")
             logger.error(traceback.format_exc())
             return False
 
+    async def save_tasks_bulk(self, tasks: List[Dict[str, Any]]) -> int:
+        """Сохраняет пачку задач одним executemany в транзакции. Возвращает число сохраненных задач"""
+        if not self.pool:
+            logger.error("Пул соединений не инициализирован.")
+            return 0
+
+        rows = {}
+        for task_data in tasks:
+            row = self._task_row(task_data)
+            if row is not None:
+                # Одна задача дважды в пачке - берем последнюю версию
+                rows[row[0]] = row
+        if not rows:
+            return 0
+
+        try:
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    await conn.executemany(UPSERT_TASK_SQL, list(rows.values()))
+            logger.debug(f"Сохранено {len(rows)} задач в PostgreSQL одной пачкой")
+            return len(rows)
+        except Exception as e:
+            logger.error(f"Ошибка при пакетном сохранении {len(rows)} задач в PostgreSQL: {str(e)}")
+            logger.error(traceback.format_exc())
+            return 0
+
     async def get_all_active_tasks(self) -> List[Dict[str, Any]]:
         """Получает все активные задачи из PostgreSQL (адаптировано к существующей структуре)"""
         if not self.pool:
@@ -237,6 +257,25 @@ class DatabaseService:
             
         return overdue_task_ids
 
+    async def delete_overdue_tasks(self) -> List[str]:
+        """Удаляет все просроченные задачи одним запросом, возвращает их ID"""
+        try:
+            async with self.pool.acquire() as conn:
+                records = await conn.fetch(
+                    """
+                    DELETE FROM scheduler_tasks
+                    WHERE scheduled_for < now() AND status = 'pending'
+                    RETURNING task_name
+                    """
+                )
+            deleted_ids = [record['task_name'] for record in records]
+            logger.debug(f"Удалено {len(deleted_ids)} просроченных задач из PostgreSQL.")
+            return deleted_ids
+        except Exception as e:
+            logger.error(f"Ошибка при удалении просроченных задач: {str(e)}")
+            logger.error(traceback.format_exc())
+            return []
+
     async def delete_task(self, task_id: str) -> bool:
         """Удаляет задачу из PostgreSQL по ID (адаптировано к существующей структуре)"""
         try:
@@ -256,55 +295,28 @@ class DatabaseService:
             logger.error(traceback.format_exc())
             return False
 
-    async def notify_websocket(self, channel: str, payload: Dict[str, Any]) -> bool:
-        """Отправляет NOTIFY в указанный канал PostgreSQL для WebSocket сервиса"""
-        # ... (код notify_websocket без изменений) ...
-
     async def notify_channel(self, channel: str, payload: Dict[str, Any]) -> bool:
-        """Отправляет NOTIFY в указанный канал PostgreSQL.
+        """Отправляет событие в канал PostgreSQL (NOTIFY) для WebSocket сервиса.
+
+        Событие ставится в очередь NotifyPublisher и уходит вместе с соседними
+        событиями одной транзакцией через pg_notify($1, $2).
 
         Args:
             channel: Имя канала PostgreSQL.
             payload: Словарь с данными для отправки (будет преобразован в JSON).
 
         Returns:
-            True, если NOTIFY выполнен успешно, иначе False.
+            True, если событие принято к отправке, иначе False.
         """
         # Проверяем, что имя канала валидно (простая проверка)
         if not channel or not channel.isidentifier():
             logger.error(f"❌ Недопустимое имя канала для NOTIFY: '{channel}'")
             return False
-            
-        payload_json = "{}"
-        try:
-            # Преобразуем payload в JSON строку
-            payload_json = json.dumps(payload).replace('\u0000', '') # Убираем нулевые байты
 
-            # Проверка длины payload
-            if len(payload_json.encode('utf-8')) >= 7999:
-                logger.warning(f"Payload для NOTIFY канала '{channel}' слишком большой ({len(payload_json.encode('utf-8'))} байт), может быть обрезан PostgreSQL.")
-
-            async with self.pool.acquire() as conn:
-                # --- ИСПРАВЛЕНИЕ: Формируем строку NOTIFY с экранированным payload --- #
-                # Экранируем одинарные кавычки в JSON-строке
-                escaped_payload = payload_json.replace("'", "''")
-                # Формируем SQL запрос, вставляя payload как строковый литерал
-                sql_query = f"NOTIFY \"{channel}\", '{escaped_payload}'"
-                # Выполняем запрос без параметров
-                await conn.execute(sql_query)
-                # -------------------------------------------------------------------- #
-                logger.info(f"✅ NOTIFY отправлен в канал '{channel}' с payload: {payload_json[:200]}{'...' if len(payload_json) > 200 else ''}")
-                return True
-        except json.JSONDecodeError as json_err:
-            logger.error(f"❌ Ошибка кодирования payload в JSON для NOTIFY канала '{channel}': {json_err}")
-            return False
-        except asyncpg.PostgresError as pg_err:
-            logger.error(f"❌ Ошибка PostgreSQL при отправке NOTIFY в канал '{channel}': {pg_err}")
-            return False
-        except Exception as e:
-            logger.error(f"❌ Неизвестная ошибка при отправке NOTIFY в канал '{channel}': {e}")
-            logger.error(traceback.format_exc())
-            return False
+        accepted = await self.notify_publisher.publish(channel, payload)
+        if accepted:
+            logger.info(f"✅ Событие '{payload.get('type')}' поставлено в очередь NOTIFY канала '{channel}'")
+        return accepted
 
     async def get_task_by_id(self, task_id: str) -> Optional[Dict[str, Any]]:
         """Получает данные задачи по ее ID из таблицы scheduler_tasks (адаптировано к существующей структуре)."""
@@ -382,7 +394,3 @@ class DatabaseService:
             logger.error(f"Ошибка при обновлении scheduled_for для задачи {task_id}: {str(e)}")
             logger.error(traceback.format_exc())
             return False
-
-    async def notify_channel(self, channel: str, payload: Dict[str, Any]) -> bool:
-        # ... (код notify_channel) ...
-        return False # Placeholder
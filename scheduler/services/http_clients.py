@@ -0,0 +1,97 @@
+"""
+Общие HTTP-клиенты шедулера.
+
+Раньше каждая задача создавала новый httpx.AsyncClient на каждый запрос: новое
+TCP-соединение (и TLS-рукопожатие) на каждую отправку. Реестр создает по одному
+долгоживущему клиенту на адресата (API сервер, Telegram бот, прочее) в lifespan
+приложения: пул соединений с keep-alive, лимиты и таймауты на адресата, HTTP/2
+(для https, если установлен пакет h2).
+
+Использование в задачах:
+    async with self.http_clients.session("bot") as client:
+        await client.post(url, json=payload)
+Клиент при выходе из блока не закрывается - он общий.
+"""
+
+import importlib.util
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict
+
+import httpx
+
+from core.config import scheduler_settings
+
+logger = logging.getLogger(__name__)
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class HttpClientRegistry:
+    # Адресаты: (максимум соединений, общий таймаут запроса в секундах)
+    TARGETS = {
+        "api": ("HTTP_API_MAX_CONNECTIONS", "HTTP_API_TIMEOUT"),
+        "bot": ("HTTP_BOT_MAX_CONNECTIONS", "HTTP_BOT_TIMEOUT"),
+        "default": ("HTTP_DEFAULT_MAX_CONNECTIONS", "HTTP_DEFAULT_TIMEOUT"),
+    }
+
+    def __init__(self, settings=None):
+        self.settings = settings or scheduler_settings
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def _create_client(self, target: str) -> httpx.AsyncClient:
+        max_connections_setting, timeout_setting = self.TARGETS[target]
+        max_connections = getattr(self.settings, max_connections_setting)
+        return httpx.AsyncClient(
+            http2=self.settings.HTTP2_ENABLED and HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=self.settings.HTTP_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(
+                getattr(self.settings, timeout_setting),
+                connect=self.settings.HTTP_CONNECT_TIMEOUT
+            )
+        )
+
+    async def start(self):
+        """Создает клиенты всех адресатов (вызывается в lifespan)"""
+        for target in self.TARGETS:
+            if target not in self._clients:
+                self._clients[target] = self._create_client(target)
+        logger.info(
+            f"🌐 HTTP-клиенты шедулера созданы: {', '.join(self._clients)} "
+            f"(HTTP/2: {'да' if self.settings.HTTP2_ENABLED and HTTP2_AVAILABLE else 'нет'})"
+        )
+
+    async def close(self):
+        for target, client in list(self._clients.items()):
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.error(f"❌ Ошибка закрытия HTTP-клиента '{target}': {e}")
+        self._clients.clear()
+
+    def get(self, target: str = "default") -> httpx.AsyncClient:
+        """Клиент адресата; вне lifespan (скрипты) создается при первом обращении"""
+        if target not in self.TARGETS:
+            target = "default"
+        client = self._clients.get(target)
+        if client is None or client.is_closed:
+            client = self._create_client(target)
+            self._clients[target] = client
+        return client
+
+    @asynccontextmanager
+    async def session(self, target: str = "default"):
+        """Замена `async with httpx.AsyncClient()` без закрытия общего клиента"""
+        yield self.get(target)
+
+
+# Глобальный реестр шедулера
+http_clients = HttpClientRegistry()
+
+
+def get_http_client(target: str = "default") -> httpx.AsyncClient:
+    return http_clients.get(target)
@@ -0,0 +1,113 @@
+"""
+Метрики выполнения задач шедулера (Prometheus, отдаются на /metrics).
+
+Замеры делает InstrumentedAsyncIOExecutor - executor APScheduler, который при
+отправке задачи на выполнение знает и саму задачу (task_type из kwargs), и
+asyncio-future ее выполнения:
+    scheduler_job_duration_seconds{task_type, status} - длительность выполнения
+    scheduler_job_runs_total{task_type, status}        - выполнения (success/error)
+    scheduler_job_lag_seconds{task_type}               - задержка последнего запуска
+                                                         относительно расписания
+    scheduler_job_missed_total{task_type, reason}      - пропущенные запуски
+                                                         (misfire, max_instances)
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MISSED, JobSubmissionEvent
+from apscheduler.executors.asyncio import AsyncIOExecutor
+from prometheus_client import Counter, Gauge, Histogram
+
+from services.slow_job_profiler import slow_job_profiler
+
+logger = logging.getLogger(__name__)
+
+job_duration = Histogram(
+    'scheduler_job_duration_seconds',
+    'Scheduler job run duration',
+    ['task_type', 'status'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+job_runs = Counter(
+    'scheduler_job_runs_total',
+    'Scheduler job runs',
+    ['task_type', 'status']
+)
+job_lag = Gauge(
+    'scheduler_job_lag_seconds',
+    'Delay between scheduled and actual start of the latest run',
+    ['task_type']
+)
+job_missed = Counter(
+    'scheduler_job_missed_total',
+    'Scheduler job runs that were skipped',
+    ['task_type', 'reason']
+)
+
+UNKNOWN_TASK_TYPE = 'unknown'
+
+# job_id -> task_type выполняющихся задач (для событий, где есть только job_id)
+_running_task_types: Dict[str, str] = {}
+
+
+def job_task_type(job) -> str:
+    return (job.kwargs or {}).get('task_type') or UNKNOWN_TASK_TYPE
+
+
+def _observe_lag(task_type: str, run_times: List[datetime]):
+    if run_times:
+        lag = (datetime.now(timezone.utc) - run_times[-1]).total_seconds()
+        job_lag.labels(task_type=task_type).set(max(0.0, lag))
+
+
+def _observe_run(job_id: str, task_type: str, future: asyncio.Future, duration: float):
+    _running_task_types.pop(job_id, None)
+    if future.cancelled():
+        return
+    if future.exception() is not None:
+        # Сбой самого executor'а (ошибки задачи приходят событиями ниже)
+        status = 'error'
+        job_runs.labels(task_type=task_type, status=status).inc()
+    else:
+        codes = [event.code for event in future.result() or []]
+        for _ in range(codes.count(EVENT_JOB_MISSED)):
+            job_missed.labels(task_type=task_type, reason='misfire').inc()
+        executed = codes.count(EVENT_JOB_EXECUTED)
+        failed = codes.count(EVENT_JOB_ERROR)
+        if executed:
+            job_runs.labels(task_type=task_type, status='success').inc(executed)
+        if failed:
+            job_runs.labels(task_type=task_type, status='error').inc(failed)
+        if not executed and not failed:
+            return # Все запуски пропущены - длительность не учитываем
+        status = 'error' if failed else 'success'
+    job_duration.labels(task_type=task_type, status=status).observe(duration)
+
+
+def max_instances_listener(event: JobSubmissionEvent):
+    """EVENT_JOB_MAX_INSTANCES: запуск пропущен, предыдущий еще выполняется"""
+    task_type = _running_task_types.get(event.job_id, UNKNOWN_TASK_TYPE)
+    job_missed.labels(task_type=task_type, reason='max_instances').inc()
+    logger.warning(f"⏭️ Запуск задачи {event.job_id} ({task_type}) пропущен: достигнут max_instances")
+
+
+class InstrumentedAsyncIOExecutor(AsyncIOExecutor):
+    """AsyncIOExecutor с замером длительности, задержки и пропусков задач"""
+
+    def _do_submit_job(self, job, run_times):
+        task_type = job_task_type(job)
+        _observe_lag(task_type, run_times)
+        _running_task_types[job.id] = task_type
+
+        started = time.monotonic()
+        submitted_before = set(self._pending_futures)
+        super()._do_submit_job(job, run_times)
+        for future in self._pending_futures - submitted_before:
+            future.add_done_callback(
+                lambda f: _observe_run(job.id, task_type, f, time.monotonic() - started)
+            )
+            slow_job_profiler.watch(job.id, task_type, future)
@@ -0,0 +1,121 @@
+"""
+Публикация событий для WebSocket сервиса через PostgreSQL NOTIFY.
+
+События копятся в буфере по каналам и раз в NOTIFY_BATCH_INTERVAL_MS
+отправляются одной транзакцией через параметризованный pg_notify($1, $2):
+одно событие уходит как есть, несколько - пачкой {"type": "batch", "events": [...]},
+разбитой так, чтобы каждое уведомление укладывалось в лимит NOTIFY (8000 байт).
+Событие, которое не помещается в лимит само по себе, записывается в таблицу
+ws_outbox, а в канал уходит ссылка {"type": "outbox", "outbox_id": id}.
+"""
+
+import asyncio
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+import asyncpg
+
+from core.config import scheduler_settings
+
+logger = logging.getLogger(__name__)
+
+# Лимит payload NOTIFY в PostgreSQL - 8000 байт, оставляем запас
+NOTIFY_MAX_PAYLOAD_BYTES = 7900
+# Накладные расходы обертки пачки {"type": "batch", "events": []}
+_BATCH_OVERHEAD_BYTES = 40
+
+
+class NotifyPublisher:
+    def __init__(self, pool: asyncpg.Pool, settings=None):
+        self.pool = pool
+        self.settings = settings or scheduler_settings
+        self._buffers: Dict[str, List[str]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    async def publish(self, channel: str, payload: Dict[str, Any]) -> bool:
+        """Поставить событие в очередь на отправку (без обращения к БД)"""
+        try:
+            payload_json = json.dumps(payload, default=str)
+        except (TypeError, ValueError) as e:
+            logger.error(f"❌ Ошибка кодирования payload в JSON для NOTIFY канала '{channel}': {e}")
+            return False
+
+        buffer = self._buffers.setdefault(channel, [])
+        buffer.append(payload_json)
+        if len(buffer) >= self.settings.NOTIFY_MAX_BATCH_EVENTS:
+            # Всплеск событий - отправляем, не дожидаясь интервала
+            return await self.flush()
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+        return True
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.settings.NOTIFY_BATCH_INTERVAL_MS / 1000)
+        await self.flush()
+
+    async def flush(self) -> bool:
+        """Отправить накопленные события. False - часть событий не отправлена"""
+        async with self._lock:
+            buffers, self._buffers = self._buffers, {}
+            if not buffers:
+                return True
+            try:
+                async with self.pool.acquire() as conn:
+                    async with conn.transaction():
+                        notifications = []
+                        for channel, events in buffers.items():
+                            for payload in await self._pack(conn, channel, events):
+                                notifications.append((channel, payload))
+                        await conn.executemany("SELECT pg_notify($1, $2)", notifications)
+                logger.debug(f"📣 Отправлено {len(notifications)} NOTIFY ({sum(len(e) for e in buffers.values())} событий)")
+                return True
+            except Exception as e:
+                lost = sum(len(events) for events in buffers.values())
+                logger.error(f"❌ Ошибка отправки NOTIFY ({lost} событий в каналы {list(buffers)}): {e}", exc_info=True)
+                return False
+
+    async def _pack(self, conn: asyncpg.Connection, channel: str, events: List[str]) -> List[str]:
+        """События канала -> payload'ы уведомлений, каждый в пределах лимита"""
+        payloads = []
+        batch: List[str] = []
+        batch_size = _BATCH_OVERHEAD_BYTES
+
+        def close_batch():
+            if len(batch) == 1:
+                payloads.append(batch[0])
+            elif batch:
+                payloads.append('{"type": "batch", "events": [' + ', '.join(batch) + ']}')
+
+        for event in events:
+            size = len(event.encode('utf-8'))
+            if size + _BATCH_OVERHEAD_BYTES > NOTIFY_MAX_PAYLOAD_BYTES:
+                event = await self._spill(conn, channel, event, size)
+                size = len(event.encode('utf-8'))
+            if batch and batch_size + size + 2 > NOTIFY_MAX_PAYLOAD_BYTES:
+                close_batch()
+                batch, batch_size = [], _BATCH_OVERHEAD_BYTES
+            batch.append(event)
+            batch_size += size + 2
+        close_batch()
+        return payloads
+
+    async def _spill(self, conn: asyncpg.Connection, channel: str, event: str, size: int) -> str:
+        """Сохранить большое событие в ws_outbox, вернуть ссылку на него"""
+        outbox_id = await conn.fetchval(
+            "INSERT INTO ws_outbox (channel, payload) VALUES ($1, $2) RETURNING id",
+            channel, event
+        )
+        await conn.execute(
+            "DELETE FROM ws_outbox WHERE created_at < now() - make_interval(hours => $1)",
+            self.settings.WS_OUTBOX_RETENTION_HOURS
+        )
+        logger.info(f"📦 Событие для канала '{channel}' ({size} байт) сохранено в ws_outbox #{outbox_id}")
+        return json.dumps({'type': 'outbox', 'outbox_id': outbox_id})
+
+    async def stop(self):
+        """Отправить остаток буфера (вызывается при остановке приложения)"""
+        await self.flush()
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
@@ -0,0 +1,262 @@
+"""
+Шардирование задач APScheduler между репликами шедулера (SCHEDULER_SHARDING_ENABLED).
+
+Все реплики работают с одним RedisJobStore. Задачи делятся на
+SCHEDULER_SHARD_COUNT шардов по хэшу chat_id/booking_id из ID задачи; шардом
+владеет реплика, которая держит его аренду в Redis (SET NX PX). Реплика берет
+из jobstore на выполнение только задачи своих шардов - каждая задача
+срабатывает один раз.
+
+Раз в треть срока аренды реплика продлевает свои аренды, отмечается в списке
+живых реплик и выравнивает нагрузку: держит не больше ceil(шардов / реплик),
+лишние отпускает, свободные (в том числе после падения соседа - его аренды
+истекают) забирает. Если продлить аренды не удалось, реплика считает, что
+шардов у нее нет, и перестает запускать задачи до восстановления связи с Redis.
+
+Сверку jobstore с БД (reload_tasks: удаление лишних и просроченных задач,
+синхронизация с API) выполняет только лидер - реплика, держащая аренду
+LEADER_LEASE_KEY по той же схеме SET NX PX. Реплика, ставшая лидером после
+падения прежнего, запускает сверку через on_leader.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import random
+import re
+import socket
+import time
+import zlib
+from typing import Callable, Optional, Set
+
+import redis.asyncio as redis
+from apscheduler.jobstores.redis import RedisJobStore
+from apscheduler.util import datetime_to_utc_timestamp, utc_timestamp_to_datetime
+
+from core.config import scheduler_settings
+
+logger = logging.getLogger(__name__)
+
+SHARD_LEASE_KEY = "scheduler:shard:{shard}"
+LEADER_LEASE_KEY = "scheduler:leader"
+REPLICAS_KEY = "scheduler:replicas"
+
+# Продление/освобождение только своей аренды
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# ID задач: "{task_type}_{chat_id}_{YYYYmmddHHMMSS}" и "reminder:{notification_id}:{chat_id}"
+_TASK_ID_PATTERN = re.compile(r'^[a-z_]+?_(?P<key>-?\d+)_\d{14}$')
+_REMINDER_ID_PATTERN = re.compile(r'^reminder:[^:]+:(?P<key>-?\d+)$')
+
+
+def job_shard_key(job_id) -> str:
+    """chat_id/booking_id из ID задачи; задачи без них шардируются по самому ID"""
+    if isinstance(job_id, bytes):
+        job_id = job_id.decode()
+    for pattern in (_TASK_ID_PATTERN, _REMINDER_ID_PATTERN):
+        match = pattern.match(job_id)
+        if match:
+            return match.group('key')
+    return job_id
+
+
+def shard_for(key, shard_count: int) -> int:
+    return zlib.crc32(str(key).encode()) % shard_count
+
+
+class ShardLeaseManager:
+    def __init__(
+        self,
+        settings=None,
+        on_rebalance: Optional[Callable[[], None]] = None,
+        on_leader: Optional[Callable[[], None]] = None
+    ):
+        self.settings = settings or scheduler_settings
+        self.shard_count = self.settings.SCHEDULER_SHARD_COUNT
+        self.lease_ms = int(self.settings.SCHEDULER_SHARD_LEASE_SECONDS * 1000)
+        self.replica_id = self.settings.SCHEDULER_REPLICA_ID or f"{socket.gethostname()}:{os.getpid()}"
+        # Вызывается после каждого раунда (пробудить планировщик): могли появиться новые
+        # шарды, а задачи своих шардов могла добавить другая реплика
+        self.on_rebalance = on_rebalance
+        # Вызывается, когда реплика стала лидером уже после старта (прежний лидер пропал)
+        self.on_leader = on_leader
+        self.owned: Set[int] = set()
+        self._leader = False
+        self._valid_until = 0.0
+        self._redis: Optional[redis.Redis] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def owns(self, job_id) -> bool:
+        """Выполняет ли эта реплика задачу с таким ID"""
+        if time.monotonic() >= self._valid_until:
+            return False
+        return shard_for(job_shard_key(job_id), self.shard_count) in self.owned
+
+    @property
+    def is_leader(self) -> bool:
+        """Выполняет ли эта реплика сверку задач (reload_tasks)"""
+        return self._leader and time.monotonic() < self._valid_until
+
+    async def start(self):
+        """Первое распределение шардов и запуск цикла продления аренд"""
+        if self._task is not None:
+            return
+        self._redis = redis.Redis(
+            host=self.settings.REDIS_HOST,
+            port=self.settings.REDIS_PORT,
+            db=self.settings.REDIS_DB_SCHEDULER,
+            password=self.settings.REDIS_PASSWORD,
+            decode_responses=True
+        )
+        self._renew = self._redis.register_script(_RENEW_SCRIPT)
+        self._release = self._redis.register_script(_RELEASE_SCRIPT)
+        await self.rebalance()
+        self._task = asyncio.create_task(self._run(), name="scheduler-shard-leases")
+        logger.info(f"🧩 Шардирование задач включено: реплика {self.replica_id}, шардов {len(self.owned)}/{self.shard_count}")
+
+    async def stop(self):
+        """Отпустить аренды, чтобы другие реплики сразу забрали шарды"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._redis is None:
+            return
+        try:
+            for shard in list(self.owned):
+                await self._release(keys=[SHARD_LEASE_KEY.format(shard=shard)], args=[self.replica_id])
+            if self._leader:
+                await self._release(keys=[LEADER_LEASE_KEY], args=[self.replica_id])
+            await self._redis.zrem(REPLICAS_KEY, self.replica_id)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось отпустить аренды шардов: {e}")
+        self.owned = set()
+        self._leader = False
+        self._valid_until = 0.0
+        await self._redis.close()
+        self._redis = None
+
+    async def _run(self):
+        interval = self.lease_ms / 1000 / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.rebalance()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка продления аренд шардов: {e}")
+
+    async def rebalance(self):
+        """Продлить свои аренды и выровнять число шардов по живым репликам"""
+        round_started = time.monotonic()
+        now = time.time()
+        lease_seconds = self.lease_ms / 1000
+
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.zadd(REPLICAS_KEY, {self.replica_id: now})
+        pipe.zremrangebyscore(REPLICAS_KEY, '-inf', now - lease_seconds)
+        pipe.zcard(REPLICAS_KEY)
+        _, _, live_replicas = await pipe.execute()
+        fair_share = math.ceil(self.shard_count / max(1, live_replicas))
+
+        previous = set(self.owned)
+        owned = set()
+        for shard in previous:
+            if await self._renew(keys=[SHARD_LEASE_KEY.format(shard=shard)], args=[self.replica_id, self.lease_ms]):
+                owned.add(shard)
+        lost = previous - owned
+        self.owned = owned
+
+        # Пришли новые реплики - отдаем лишнее. Шард убирается из своих до
+        # освобождения аренды, чтобы его задачи не запустились здесь после передачи
+        for shard in sorted(owned)[fair_share:]:
+            self.owned.discard(shard)
+            await self._release(keys=[SHARD_LEASE_KEY.format(shard=shard)], args=[self.replica_id])
+
+        # Свободные шарды (новые или оставшиеся от упавших реплик)
+        if len(self.owned) < fair_share:
+            candidates = [shard for shard in range(self.shard_count) if shard not in self.owned]
+            random.shuffle(candidates)
+            for shard in candidates:
+                if len(self.owned) >= fair_share:
+                    break
+                acquired = await self._redis.set(
+                    SHARD_LEASE_KEY.format(shard=shard), self.replica_id, nx=True, px=self.lease_ms
+                )
+                if acquired:
+                    self.owned.add(shard)
+
+        # Лидерство: продлеваем свою аренду или забираем свободную
+        was_leader = self._leader
+        if was_leader:
+            self._leader = bool(await self._renew(keys=[LEADER_LEASE_KEY], args=[self.replica_id, self.lease_ms]))
+        if not self._leader:
+            self._leader = bool(await self._redis.set(LEADER_LEASE_KEY, self.replica_id, nx=True, px=self.lease_ms))
+
+        changed = self.owned != previous
+        # Аренды действительны от начала раунда; запас на задержки часов и сети
+        self._valid_until = round_started + lease_seconds * 0.8
+        if was_leader != self._leader:
+            logger.info(f"👑 Реплика {self.replica_id} {'стала лидером' if self._leader else 'больше не лидер'}")
+        if lost:
+            logger.warning(f"⚠️ Реплика {self.replica_id} потеряла аренды шардов: {sorted(lost)}")
+        if changed:
+            logger.info(f"🧩 Шарды реплики {self.replica_id}: {len(self.owned)} из {self.shard_count} (живых реплик: {live_replicas})")
+        if self.on_rebalance:
+            self.on_rebalance()
+        # Первую сверку после старта запускает приложение, здесь - только смена лидера
+        if self._leader and not was_leader and self._task is not None and self.on_leader:
+            self.on_leader()
+
+
+class ShardedRedisJobStore(RedisJobStore):
+    """RedisJobStore, отдающий планировщику только задачи шардов этой реплики"""
+
+    # Сколько ближайших запусков просматривать за один запрос в get_next_run_time
+    NEXT_RUN_PAGE = 200
+
+    def __init__(self, leases: ShardLeaseManager, **kwargs):
+        super().__init__(**kwargs)
+        self.leases = leases
+
+    def get_due_jobs(self, now):
+        timestamp = datetime_to_utc_timestamp(now)
+        job_ids = [
+            job_id for job_id in self.redis.zrangebyscore(self.run_times_key, 0, timestamp)
+            if self.leases.owns(job_id)
+        ]
+        if job_ids:
+            job_states = self.redis.hmget(self.jobs_key, *job_ids)
+            return self._reconstitute_jobs(zip(job_ids, job_states))
+        return []
+
+    def get_next_run_time(self):
+        # Ближайший запуск среди своих задач: чужие просроченные задачи не должны
+        # будить планировщик в цикле
+        start = 0
+        while True:
+            page = self.redis.zrange(
+                self.run_times_key, start, start + self.NEXT_RUN_PAGE - 1, withscores=True
+            )
+            if not page:
+                return None
+            for job_id, run_time in page:
+                if self.leases.owns(job_id):
+                    return utc_timestamp_to_datetime(run_time)
+            start += self.NEXT_RUN_PAGE
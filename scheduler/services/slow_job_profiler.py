@@ -0,0 +1,93 @@
+"""
+Выборочный профилировщик долгих задач шедулера (включается SCHEDULER_PROFILE_SLOW_JOBS).
+
+Если выполнение задачи длится дольше SCHEDULER_SLOW_JOB_THRESHOLD_SECONDS,
+раз в SCHEDULER_PROFILE_SAMPLE_INTERVAL_SECONDS снимается стек ее asyncio-задачи
+(цепочка await, на которой она стоит). После завершения в лог выводятся самые
+частые стеки - видно, где задача проводит время (ожидание HTTP, БД, sleep...).
+Пока задача укладывается в порог, профилировщик ничего не делает.
+"""
+
+import asyncio
+import logging
+import time
+import traceback
+from collections import Counter as StackCounter
+from typing import Optional
+
+from prometheus_client import Counter
+
+from core.config import scheduler_settings
+
+logger = logging.getLogger(__name__)
+
+slow_job_runs = Counter(
+    'scheduler_slow_job_runs_total',
+    'Runs that exceeded the slow job threshold',
+    ['task_type']
+)
+
+# Сколько разных стеков выводить в лог
+TOP_STACKS = 3
+
+
+class SlowJobProfiler:
+    def __init__(self, settings=None):
+        self.settings = settings or scheduler_settings
+
+    @property
+    def enabled(self) -> bool:
+        return self.settings.SCHEDULER_PROFILE_SLOW_JOBS
+
+    def watch(self, job_id: str, task_type: str, future: asyncio.Future):
+        """Начать наблюдение за выполнением задачи (вызывается при отправке в executor)"""
+        if not self.enabled or not isinstance(future, asyncio.Task):
+            return
+        loop = future.get_loop()
+        started = time.monotonic()
+        samples = StackCounter()
+        handle: Optional[asyncio.TimerHandle] = None
+
+        def sample():
+            nonlocal handle
+            if future.done():
+                return
+            stack = _await_chain(future)
+            if stack:
+                frames = traceback.StackSummary.extract(
+                    ((frame, frame.f_lineno) for frame in stack), lookup_lines=True
+                )
+                samples[''.join(frames.format())] += 1
+            handle = loop.call_later(self.settings.SCHEDULER_PROFILE_SAMPLE_INTERVAL_SECONDS, sample)
+
+        def report(_):
+            if handle:
+                handle.cancel()
+            if not samples:
+                return
+            duration = time.monotonic() - started
+            slow_job_runs.labels(task_type=task_type).inc()
+            total = sum(samples.values())
+            lines = [f"🐢 Долгая задача {job_id} ({task_type}): {duration:.1f} с, снимков стека: {total}"]
+            for stack, count in samples.most_common(TOP_STACKS):
+                lines.append(f"--- {count}/{total} снимков ---\n{stack}")
+            logger.warning("\n".join(lines))
+
+        handle = loop.call_later(self.settings.SCHEDULER_SLOW_JOB_THRESHOLD_SECONDS, sample)
+        future.add_done_callback(report)
+
+
+def _await_chain(task: asyncio.Task):
+    """Кадры цепочки await задачи (Task.get_stack отдает только внешнюю корутину)"""
+    frames = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, 'cr_frame', None) or getattr(awaitable, 'gi_frame', None)
+        if frame is None:
+            break
+        frames.append(frame)
+        awaitable = getattr(awaitable, 'cr_await', None) or getattr(awaitable, 'gi_yieldfrom', None)
+    return frames
+
+
+slow_job_profiler = SlowJobProfiler()
@@ -1,20 +1,25 @@
 from abc import ABC, abstractmethod
 import logging
 from datetime import datetime
+from typing import Optional
+
+from services.http_clients import HttpClientRegistry, http_clients as default_http_clients
 
 logger = logging.getLogger(__name__)
 
 class BaseTask(ABC):
-    def __init__(self, scheduler_instance, task_manager, settings):
+    def __init__(self, scheduler_instance, task_manager, settings, http_clients: Optional[HttpClientRegistry] = None):
         """
         Базовый класс для всех задач
         :param scheduler_instance: Экземпляр планировщика APScheduler
         :param task_manager: Экземпляр TaskManager
         :param settings: Объект настроек SchedulerSettings
+        :param http_clients: Реестр общих HTTP-клиентов (по умолчанию - глобальный реестр шедулера)
         """
         self.scheduler = scheduler_instance
         self.task_manager = task_manager
         self.settings = settings # Сохраняем настройки
+        self.http_clients = http_clients or getattr(task_manager, 'http_clients', None) or default_http_clients
 
     @abstractmethod
     def execute(self, *args, **kwargs):
@@ -6,13 +6,15 @@
 import asyncio
 import httpx
 from datetime import datetime, timedelta, timezone
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Set
 import logging
 import traceback
 
 logger = logging.getLogger(__name__)
 
 from ..base_task import BaseTask
+from .transition_queue import parse_booking_time
+from .notification_dedup import NotificationDedupStore
 
 
 class BookingStatusAutomationTask(BaseTask):
@@ -27,13 +29,20 @@ class BookingStatusAutomationTask(BaseTask):
         super().__init__(scheduler_instance, task_manager, settings)
         self.api_base_url = "http://server:8000/api/v1"
         self.task_name = "booking_status_automation"
-        # Отслеживание отправленных уведомлений (booking_id -> set of sent notification types)
-        self.sent_notifications = {}
+        # Отметки отправленных уведомлений: Redis с TTL (задается BookingAutomationWorker),
+        # до подключения - ограниченный по времени локальный кэш
+        dedup_ttl_hours = getattr(settings, 'BOOKING_NOTIFICATION_DEDUP_TTL_HOURS', 24)
+        self.dedup = NotificationDedupStore(ttl_seconds=dedup_ttl_hours * 3600)
+        # Очередь переходов событийного режима (задается BookingAutomationWorker)
+        self.transition_queue = None
+        # Прямой доступ к БД (BookingAutomationRepository); None - работа через API
+        self.repository = None
         
     async def execute(self):
         """
         Выполняет автоматизацию статусов бронирований.
-        Работает автономно, получая данные напрямую из API.
+        С repository переходы применяются пакетными UPDATE в БД, а для уведомлений
+        выбираются только бронирования в окне времени; без него данные берутся из API.
         """
         from zoneinfo import ZoneInfo
         
@@ -45,18 +54,26 @@ class BookingStatusAutomationTask(BaseTask):
         logger.info("🔄 Начинаем проверку и обновление статусов бронирований...")
         
         try:
-            # Получаем все активные бронирования
-            bookings = await self._get_active_bookings()
+            # Счетчики для статистики
+            updated_count = 0
+            notifications_sent = 0
+            
+            if self.repository:
+                updated_count = len(await self.apply_due_transitions())
+                if self.transition_queue:
+                    # Полная сверка очереди событийного режима
+                    bookings = await self.repository.fetch_active_bookings()
+                else:
+                    bookings = await self.repository.fetch_window_bookings(current_time)
+            else:
+                # Получаем все активные бронирования
+                bookings = await self._get_active_bookings()
             if not bookings:
-                logger.info("📭 Активных бронирований не найдено")
+                logger.info(f"📭 Бронирований для проверки не найдено (переведено статусов: {updated_count})")
                 return
             
             logger.info(f"📋 Найдено {len(bookings)} активных бронирований для проверки")
             
-            # Счетчики для статистики
-            updated_count = 0
-            notifications_sent = 0
-            
             # Обрабатываем каждое бронирование
             for booking in bookings:
                 try:
@@ -74,6 +91,9 @@ class BookingStatusAutomationTask(BaseTask):
                     if result and result.get('notification_sent'):
                         notifications_sent += 1
                         logger.info(f"📤 Уведомление отправлено для бронирования #{booking_id}")
+                    if self.transition_queue and not (result and result.get('updated')):
+                        # Полная сверка заполняет очередь событийного режима
+                        await self.transition_queue.schedule(booking)
                         
                 except Exception as e:
                     logger.error(f"❌ Ошибка при обработке бронирования {booking.get('id', 'N/A')}: {e}")
@@ -86,6 +106,39 @@ class BookingStatusAutomationTask(BaseTask):
             logger.error(traceback.format_exc())
             raise
     
+    async def apply_due_transitions(self) -> Set[int]:
+        """
+        Применяет наступившие переходы напрямую в БД: один UPDATE ... RETURNING
+        на тип перехода вместо PATCH на каждое бронирование. Возвращает id переведенных.
+        """
+        now = datetime.now(timezone.utc)
+        moved_ids = set()
+        
+        for booking in await self.repository.apply_pending_confirmation(now):
+            booking_id = booking['id']
+            moved_ids.add(booking_id)
+            logger.info(f"✅ Бронирование {booking_id} переведено в PENDING_CONFIRMATION")
+            await self._clear_notification_tracking(booking_id)
+            await self._send_push_notification(
+                booking_id=booking_id,
+                client_name=booking.get('client_name') or 'Неизвестный клиент',
+                notification_type="pending_confirmation"
+            )
+            if self.transition_queue:
+                await self.transition_queue.schedule(booking)
+        
+        for booking in await self.repository.apply_no_show(now):
+            booking_id = booking['id']
+            moved_ids.add(booking_id)
+            logger.info(f"⚠️ Бронирование {booking_id} переведено в NO_SHOW (из {booking.get('previous_status')})")
+            await self._clear_notification_tracking(booking_id)
+            if self.transition_queue:
+                await self.transition_queue.schedule(booking)
+        
+        if moved_ids:
+            logger.info(f"🔄 Пакетно переведено статусов бронирований: {len(moved_ids)}")
+        return moved_ids
+    
     async def _get_active_bookings(self) -> List[Dict[str, Any]]:
         """Получает активные бронирования из API"""
         try:
@@ -97,7 +150,7 @@ class BookingStatusAutomationTask(BaseTask):
                 "status": ",".join(statuses)
             }
             
-            async with httpx.AsyncClient() as client:
+            async with self.http_clients.session("api") as client:
                 response = await client.get(url, params=params, timeout=30)
                 response.raise_for_status()
                 
@@ -122,14 +175,10 @@ class BookingStatusAutomationTask(BaseTask):
         if not planned_start:
             return {"updated": False, "notification_sent": False}
         
-        # Парсим время начала
-        start_time = datetime.fromisoformat(planned_start.replace('Z', '+00:00'))
+        # Парсим время начала (строка из API или datetime из БД)
+        start_time = parse_booking_time(planned_start)
         now = datetime.now().astimezone()
         
-        # Конвертируем в локальное время
-        if start_time.tzinfo is None:
-            start_time = start_time.replace(tzinfo=now.tzinfo)
-        
         time_until_start = start_time - now
         minutes_until_start = time_until_start.total_seconds() / 60
         
@@ -156,17 +205,19 @@ class BookingStatusAutomationTask(BaseTask):
         
         # 4. Уведомление "клиент скоро придет" (за 15 минут)
         elif status == "confirmed" and 10 <= minutes_until_start <= 20:
-            if not self._was_notification_sent(booking_id, "client_arriving_soon"):
-                await self._send_arriving_soon_notification(booking)
-                self._mark_notification_sent(booking_id, "client_arriving_soon")
-                notification_sent = True
+            if await self.dedup.claim(booking_id, "client_arriving_soon"):
+                notification_sent = await self._send_arriving_soon_notification(booking)
+                if not notification_sent:
+                    # Не отправилось - снимаем отметку, попробуем при следующей проверке
+                    await self.dedup.release(booking_id, "client_arriving_soon")
         
         # 5. Уведомление "клиент опаздывает" (от 1 до 15 минут опоздания)
         elif status in ["confirmed", "pending_confirmation"] and -15 <= minutes_until_start <= -1:
-            if not self._was_notification_sent(booking_id, "client_overdue"):
-                await self._send_overdue_notification(booking)
-                self._mark_notification_sent(booking_id, "client_overdue")
-                notification_sent = True
+            if await self.dedup.claim(booking_id, "client_overdue"):
+                notification_sent = await self._send_overdue_notification(booking)
+                if not notification_sent:
+                    # Не отправилось - снимаем отметку, попробуем при следующей проверке
+                    await self.dedup.release(booking_id, "client_overdue")
         
         # 6. Обработка статуса IN_USE (проверка времени возврата)
         elif status == "in_use":
@@ -184,7 +235,7 @@ class BookingStatusAutomationTask(BaseTask):
         
         try:
             # Обновляем статус
-            async with httpx.AsyncClient() as client:
+            async with self.http_clients.session("api") as client:
                 response = await client.patch(
                     f"{self.api_base_url}/bookings/{booking_id}",
                     json={"status": "pending_confirmation"}
@@ -194,7 +245,7 @@ class BookingStatusAutomationTask(BaseTask):
             logger.info(f"✅ Бронирование {booking_id} переведено в PENDING_CONFIRMATION")
             
             # Очищаем отслеживание уведомлений при смене статуса
-            self._clear_notification_tracking(booking_id)
+            await self._clear_notification_tracking(booking_id)
             
             # Отправляем push-уведомление
             await self._send_push_notification(
@@ -214,7 +265,7 @@ class BookingStatusAutomationTask(BaseTask):
         
         try:
             # Обновляем статус
-            async with httpx.AsyncClient() as client:
+            async with self.http_clients.session("api") as client:
                 response = await client.patch(
                     f"{self.api_base_url}/bookings/{booking_id}",
                     json={"status": "no_show"}
@@ -224,7 +275,7 @@ class BookingStatusAutomationTask(BaseTask):
             logger.info(f"⚠️ Бронирование {booking_id} переведено в NO_SHOW (из {from_status})")
             
             # Очищаем отслеживание уведомлений при смене статуса
-            self._clear_notification_tracking(booking_id)
+            await self._clear_notification_tracking(booking_id)
             
         except Exception as e:
             logger.error(f"Ошибка перехода в NO_SHOW для {booking_id}: {e}")
@@ -236,7 +287,7 @@ class BookingStatusAutomationTask(BaseTask):
         client_name = booking.get('client_name', 'Неизвестный клиент')
         
         try:
-            await self._send_push_notification(
+            return await self._send_push_notification(
                 booking_id=booking_id,
                 client_name=client_name,
                 notification_type="client_arriving_soon"
@@ -244,6 +295,7 @@ class BookingStatusAutomationTask(BaseTask):
             
         except Exception as e:
             logger.error(f"Ошибка отправки уведомления 'arriving_soon' для {booking_id}: {e}")
+            return False
     
     async def _send_overdue_notification(self, booking: Dict[str, Any]):
         """Уведомление 'клиент опаздывает'"""
@@ -254,15 +306,13 @@ class BookingStatusAutomationTask(BaseTask):
         # Вычисляем количество минут опоздания
         minutes_overdue = 0
         if planned_start:
-            start_time = datetime.fromisoformat(planned_start.replace('Z', '+00:00'))
+            start_time = parse_booking_time(planned_start)
             now = datetime.now().astimezone()
-            if start_time.tzinfo is None:
-                start_time = start_time.replace(tzinfo=now.tzinfo)
             time_until_start = start_time - now
             minutes_overdue = abs(int(time_until_start.total_seconds() / 60))
         
         try:
-            await self._send_push_notification(
+            return await self._send_push_notification(
                 booking_id=booking_id,
                 client_name=client_name,
                 notification_type="client_overdue",
@@ -271,6 +321,7 @@ class BookingStatusAutomationTask(BaseTask):
             
         except Exception as e:
             logger.error(f"Ошибка отправки уведомления 'overdue' для {booking_id}: {e}")
+            return False
 
     async def _process_in_use_booking(self, booking: Dict[str, Any]) -> Dict[str, Any]:
         """Обработка бронирования в статусе IN_USE (проверка времени возврата)"""
@@ -284,13 +335,9 @@ class BookingStatusAutomationTask(BaseTask):
             return {"updated": False, "notification_sent": False}
         
         # Парсим время фактического начала
-        start_time = datetime.fromisoformat(actual_start.replace('Z', '+00:00'))
+        start_time = parse_booking_time(actual_start)
         now = datetime.now().astimezone()
         
-        # Конвертируем в локальное время
-        if start_time.tzinfo is None:
-            start_time = start_time.replace(tzinfo=now.tzinfo)
-        
         # Вычисляем время возврата
         return_time = start_time + timedelta(hours=duration_hours)
         time_until_return = return_time - now
@@ -302,17 +349,19 @@ class BookingStatusAutomationTask(BaseTask):
         
         # 1. Уведомление "время возврата" (за 10-15 минут до окончания)
         if 10 <= minutes_until_return <= 15:
-            if not self._was_notification_sent(booking_id, "return_time"):
-                await self._send_return_time_notification(booking)
-                self._mark_notification_sent(booking_id, "return_time")
-                notification_sent = True
+            if await self.dedup.claim(booking_id, "return_time"):
+                notification_sent = await self._send_return_time_notification(booking)
+                if not notification_sent:
+                    # Не отправилось - снимаем отметку, попробуем при следующей проверке
+                    await self.dedup.release(booking_id, "return_time")
         
         # 2. Уведомление "просрочка возврата" (от 5 до 60 минут просрочки)
         elif -60 <= minutes_until_return <= -5:
-            if not self._was_notification_sent(booking_id, "return_overdue"):
-                await self._send_return_overdue_notification(booking, abs(int(minutes_until_return)))
-                self._mark_notification_sent(booking_id, "return_overdue")
-                notification_sent = True
+            if await self.dedup.claim(booking_id, "return_overdue"):
+                notification_sent = await self._send_return_overdue_notification(booking, abs(int(minutes_until_return)))
+                if not notification_sent:
+                    # Не отправилось - снимаем отметку, попробуем при следующей проверке
+                    await self.dedup.release(booking_id, "return_overdue")
         
         return {
             "updated": False,  # Статус не меняем автоматически
@@ -325,7 +374,7 @@ class BookingStatusAutomationTask(BaseTask):
         client_name = booking.get('client_name', 'Неизвестный клиент')
         
         try:
-            await self._send_push_notification(
+            return await self._send_push_notification(
                 booking_id=booking_id,
                 client_name=client_name,
                 notification_type="return_time"
@@ -333,6 +382,7 @@ class BookingStatusAutomationTask(BaseTask):
             
         except Exception as e:
             logger.error(f"Ошибка отправки уведомления 'return_time' для {booking_id}: {e}")
+            return False
 
     async def _send_return_overdue_notification(self, booking: Dict[str, Any], minutes_overdue: int):
         """Уведомление 'просрочка возврата'"""
@@ -340,7 +390,7 @@ class BookingStatusAutomationTask(BaseTask):
         client_name = booking.get('client_name', 'Неизвестный клиент')
         
         try:
-            await self._send_push_notification(
+            return await self._send_push_notification(
                 booking_id=booking_id,
                 client_name=client_name,
                 notification_type="return_overdue",
@@ -349,28 +399,17 @@ class BookingStatusAutomationTask(BaseTask):
             
         except Exception as e:
             logger.error(f"Ошибка отправки уведомления 'return_overdue' для {booking_id}: {e}")
+            return False
     
-    def _was_notification_sent(self, booking_id: int, notification_type: str) -> bool:
-        """Проверяет, было ли уже отправлено уведомление данного типа для бронирования"""
-        return booking_id in self.sent_notifications and notification_type in self.sent_notifications[booking_id]
-    
-    def _mark_notification_sent(self, booking_id: int, notification_type: str):
-        """Отмечает уведомление как отправленное"""
-        if booking_id not in self.sent_notifications:
-            self.sent_notifications[booking_id] = set()
-        self.sent_notifications[booking_id].add(notification_type)
-        logger.debug(f"🔖 Уведомление {notification_type} отмечено как отправленное для бронирования {booking_id}")
-    
-    def _clear_notification_tracking(self, booking_id: int):
-        """Очищает отслеживание уведомлений для бронирования (например, когда статус изменился)"""
-        if booking_id in self.sent_notifications:
-            del self.sent_notifications[booking_id]
-            logger.debug(f"🧹 Очищено отслеживание уведомлений для бронирования {booking_id}")
+    async def _clear_notification_tracking(self, booking_id: int):
+        """Очищает отметки уведомлений бронирования (например, когда статус изменился)"""
+        await self.dedup.clear(booking_id)
+        logger.debug(f"🧹 Очищено отслеживание уведомлений для бронирования {booking_id}")
 
-    async def _send_push_notification(self, booking_id: int, client_name: str, notification_type: str, additional_data: Optional[Dict[str, Any]] = None):
-        """Отправка push-уведомления"""
+    async def _send_push_notification(self, booking_id: int, client_name: str, notification_type: str, additional_data: Optional[Dict[str, Any]] = None) -> bool:
+        """Отправка push-уведомления (True - API принял уведомление)"""
         try:
-            async with httpx.AsyncClient() as client:
+            async with self.http_clients.session("api") as client:
                 response = await client.post(
                     f"{self.api_base_url}/push-notifications/send-booking-notification",
                     json={
@@ -383,10 +422,12 @@ class BookingStatusAutomationTask(BaseTask):
                 )
                 response.raise_for_status()
                 logger.info(f"📤 Push-уведомление отправлено: {notification_type} для бронирования {booking_id} (клиент: {client_name})")
+                return True
                 
         except Exception as e:
             logger.error(f"Ошибка отправки push-уведомления {notification_type} для {booking_id}: {e}")
             # Не прерываем выполнение, если уведомление не отправилось
+            return False
     
     def get_schedule_info(self) -> Dict[str, Any]:
         """Информация о расписании задачи"""
@@ -420,12 +461,11 @@ async def execute_automation(**kwargs):
     try:
         logger.info("🤖 Запуск автоматизации статусов бронирований...")
         
-        # Создаем экземпляр задачи с None параметрами (для автономной работы)
-        task = BookingStatusAutomationTask(
-            scheduler_instance=None, 
-            task_manager=None, 
-            settings=None
-        )
+        from .event_worker import get_booking_automation_worker
+        
+        # Общий экземпляр задачи воркера: в нем подключены БД (repository),
+        # очередь переходов событийного режима (если воркер запущен) и отметки уведомлений
+        task = get_booking_automation_worker().automation
         
         # Выполняем автоматизацию
         await task.execute()
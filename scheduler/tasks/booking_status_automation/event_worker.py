@@ -0,0 +1,145 @@
+"""
+Событийный режим автоматизации статусов бронирований.
+
+Воркер спит до ближайшего перехода из очереди (transition_queue) или до события
+от API, обрабатывает только наступившие бронирования и переставляет их на
+следующий переход. Периодическая задача APScheduler в этом режиме выполняет
+редкую полную сверку (resync), которая заполняет очередь и подстраховывает
+от потерянных событий.
+"""
+
+import asyncio
+import logging
+import traceback
+from datetime import timedelta
+from typing import Optional
+
+import redis.asyncio as redis
+
+from core.config import scheduler_settings
+from .booking_status_task import BookingStatusAutomationTask
+from .transition_queue import BookingTransitionQueue
+
+logger = logging.getLogger(__name__)
+
+# Повтор обработки бронирования после ошибки
+RETRY_DELAY = timedelta(minutes=1)
+
+
+class BookingAutomationWorker:
+    def __init__(self, settings=None):
+        self.settings = settings or scheduler_settings
+        self._task: Optional[asyncio.Task] = None
+        self._redis: Optional[redis.Redis] = None
+        self.queue: Optional[BookingTransitionQueue] = None
+        self.automation = BookingStatusAutomationTask(scheduler_instance=None, task_manager=None, settings=self.settings)
+
+    def use_database(self, pool):
+        """Подключает прямой доступ к БД вместо выгрузки бронирований и PATCH через API"""
+        from services.booking_automation_repository import BookingAutomationRepository
+        self.automation.repository = BookingAutomationRepository(pool)
+        logger.info("🗄️ Автоматизация статусов бронирований работает напрямую с БД")
+
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def connect(self):
+        """Подключается к Redis: отметки уведомлений, общие для всех реплик шедулера"""
+        if self._redis is not None:
+            return
+        self._redis = redis.Redis(
+            host=self.settings.REDIS_HOST,
+            port=self.settings.REDIS_PORT,
+            db=self.settings.BOOKING_AUTOMATION_REDIS_DB,
+            password=self.settings.REDIS_PASSWORD,
+            decode_responses=True
+        )
+        try:
+            await self._redis.ping()
+        except Exception:
+            await self._redis.close()
+            self._redis = None
+            raise
+        self.automation.dedup.redis = self._redis
+
+    async def start(self):
+        """Запускает цикл ожидания переходов (событийный режим)"""
+        if self._task is not None:
+            return
+        await self.connect()
+        self.queue = BookingTransitionQueue(self._redis)
+        self.automation.transition_queue = self.queue
+        self._task = asyncio.create_task(self._run(), name="booking-automation-worker")
+        logger.info("🤖 Событийная автоматизация статусов бронирований запущена")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                logger.error(f"❌ Ошибка при остановке автоматизации статусов: {e}")
+            self._task = None
+        self.queue = None
+        self.automation.transition_queue = None
+        self.automation.dedup.redis = None
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+
+    async def _run(self):
+        max_idle = self.settings.BOOKING_AUTOMATION_MAX_IDLE_SECONDS
+        while True:
+            try:
+                wait = await self.queue.seconds_until_next()
+                wait = max_idle if wait is None else min(wait, max_idle)
+                if wait > 0:
+                    await self.queue.wait_for_event(wait)
+                await self.process_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка цикла автоматизации статусов: {e}")
+                logger.error(traceback.format_exc())
+                await asyncio.sleep(5)
+
+    async def process_due(self) -> int:
+        """Обрабатывает наступившие переходы, возвращает количество бронирований"""
+        processed = 0
+        while True:
+            bookings = await self.queue.claim_due()
+            if not bookings:
+                return processed
+            if self.automation.repository:
+                # Переходы - пакетно в БД, снимки из Redis заменяются актуальными строками
+                moved_ids = await self.automation.apply_due_transitions()
+                fresh = await self.automation.repository.fetch_bookings([int(b['id']) for b in bookings])
+                missing = {int(b['id']) for b in bookings} - {booking['id'] for booking in fresh}
+                if missing:
+                    # Бронирования удалены - убираем их снимки
+                    await self.queue.forget(missing)
+                bookings = [booking for booking in fresh if booking['id'] not in moved_ids]
+            for booking in bookings:
+                processed += 1
+                try:
+                    result = await self.automation._process_booking(booking)
+                    if result and result.get('updated'):
+                        # Статус изменен через API - он сам поставит бронирование в очередь с новым снимком
+                        continue
+                    due_at = await self.queue.schedule(booking)
+                    logger.debug(f"🔖 Бронирование {booking.get('id')}: следующая проверка {due_at}")
+                except Exception as e:
+                    logger.error(f"❌ Ошибка при обработке бронирования {booking.get('id', 'N/A')}: {e}")
+                    await self.queue.retry(booking, RETRY_DELAY)
+
+
+# Глобальный экземпляр (ленивая инициализация)
+_booking_automation_worker = None
+
+def get_booking_automation_worker() -> BookingAutomationWorker:
+    global _booking_automation_worker
+    if _booking_automation_worker is None:
+        _booking_automation_worker = BookingAutomationWorker()
+    return _booking_automation_worker
@@ -0,0 +1,72 @@
+"""
+Отметки отправленных уведомлений по бронированиям.
+
+Отметки хранятся в Redis: SET booking_automation:sent:{booking_id} с типами
+уведомлений и TTL. SADD атомарен, поэтому уведомление отправляет только тот
+процесс (или реплика шедулера), который первым добавил тип в множество;
+перезапуск шедулера не приводит к повторной рассылке. Без Redis используется
+локальный словарь с тем же TTL - память ограничена, но отметки не переживают
+перезапуск.
+"""
+
+import logging
+import time
+from typing import Dict, Optional, Tuple
+
+import redis.asyncio as redis
+
+logger = logging.getLogger(__name__)
+
+SENT_NOTIFICATIONS_KEY = "booking_automation:sent:{booking_id}"
+
+
+class NotificationDedupStore:
+    def __init__(self, redis_client: Optional[redis.Redis] = None, ttl_seconds: int = 86400):
+        self.redis = redis_client
+        self.ttl_seconds = ttl_seconds
+        # Резерв без Redis: (booking_id, notification_type) -> момент истечения
+        self._local: Dict[Tuple[int, str], float] = {}
+
+    async def claim(self, booking_id: int, notification_type: str) -> bool:
+        """Отметить уведомление как отправляемое. False - его уже отправили"""
+        if self.redis:
+            try:
+                key = SENT_NOTIFICATIONS_KEY.format(booking_id=booking_id)
+                pipe = self.redis.pipeline(transaction=True)
+                pipe.sadd(key, notification_type)
+                pipe.expire(key, self.ttl_seconds)
+                added, _ = await pipe.execute()
+                return bool(added)
+            except Exception as e:
+                logger.warning(f"⚠️ Redis недоступен для отметок уведомлений, используется локальный кэш: {e}")
+
+        self._purge_expired()
+        local_key = (booking_id, notification_type)
+        if local_key in self._local:
+            return False
+        self._local[local_key] = time.monotonic() + self.ttl_seconds
+        return True
+
+    async def release(self, booking_id: int, notification_type: str):
+        """Снять отметку (уведомление не отправилось - пусть повторится)"""
+        self._local.pop((booking_id, notification_type), None)
+        if self.redis:
+            try:
+                await self.redis.srem(SENT_NOTIFICATIONS_KEY.format(booking_id=booking_id), notification_type)
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось снять отметку уведомления {notification_type} для {booking_id}: {e}")
+
+    async def clear(self, booking_id: int):
+        """Сбросить все отметки бронирования (статус изменился)"""
+        for local_key in [key for key in self._local if key[0] == booking_id]:
+            del self._local[local_key]
+        if self.redis:
+            try:
+                await self.redis.delete(SENT_NOTIFICATIONS_KEY.format(booking_id=booking_id))
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось сбросить отметки уведомлений для {booking_id}: {e}")
+
+    def _purge_expired(self):
+        now = time.monotonic()
+        for local_key in [key for key, expires_at in self._local.items() if expires_at <= now]:
+            del self._local[local_key]
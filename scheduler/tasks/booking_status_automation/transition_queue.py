@@ -0,0 +1,147 @@
+"""
+Очередь ближайших переходов статусов бронирований (Redis ZSET).
+
+score бронирования - момент, когда его нужно проверить в следующий раз:
+начало окна ожидания подтверждения, момент неявки, окна напоминаний.
+API ставит бронирование в очередь с текущим временем при каждом изменении
+(см. services/booking_automation_queue.py в API сервере) и кладет снимок
+бронирования в hash, шедулер после обработки переставляет score на следующий
+переход или убирает бронирование, если переходов больше не будет.
+"""
+
+import json
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import redis.asyncio as redis
+
+logger = logging.getLogger(__name__)
+
+BOOKING_AUTOMATION_DUE_KEY = "booking_automation:due"
+BOOKING_AUTOMATION_SNAPSHOTS_KEY = "booking_automation:bookings"
+BOOKING_AUTOMATION_WAKE_KEY = "booking_automation:wake"
+
+# Границы окон относительно начала бронирования (минуты), совпадают с _process_booking.
+# Строгие сравнения (< -90, < -120) срабатывают на секунду позже границы
+_EPSILON = timedelta(seconds=1)
+_START_OFFSETS = {
+    # BOOKED -> PENDING_CONFIRMATION за 60 минут, NO_SHOW после 90 минут опоздания
+    "booked": [timedelta(minutes=-60), timedelta(minutes=90) + _EPSILON],
+    # "клиент опаздывает" с 1 минуты, NO_SHOW после 120 минут
+    "pending_confirmation": [timedelta(minutes=1), timedelta(minutes=120) + _EPSILON],
+    # "клиент скоро придет" за 20 минут, "опаздывает" с 1 минуты, NO_SHOW после 90 минут
+    "confirmed": [timedelta(minutes=-20), timedelta(minutes=1), timedelta(minutes=90) + _EPSILON],
+}
+# Окна относительно времени возврата для IN_USE: "время возврата" за 15 минут, "просрочка" с 5 минут
+_RETURN_OFFSETS = [timedelta(minutes=-15), timedelta(minutes=5)]
+
+
+def parse_booking_time(value: Any) -> Optional[datetime]:
+    """ISO-строка из API или datetime из БД -> aware datetime"""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.now().astimezone().tzinfo)
+    return parsed
+
+
+def next_transition_at(booking: Dict[str, Any], now: Optional[datetime] = None) -> Optional[datetime]:
+    """
+    Ближайший момент после now, когда решение по бронированию может измениться.
+    None - автоматических переходов и напоминаний больше не будет.
+    """
+    now = now or datetime.now(timezone.utc)
+    status = booking.get('status')
+
+    if status in _START_OFFSETS:
+        anchor = parse_booking_time(booking.get('planned_start_time'))
+        offsets = _START_OFFSETS[status]
+    elif status == 'in_use':
+        actual_start = parse_booking_time(booking.get('actual_start_time'))
+        if not actual_start:
+            return None
+        anchor = actual_start + timedelta(hours=booking.get('duration_in_hours') or 4)
+        offsets = _RETURN_OFFSETS
+    else:
+        return None
+
+    if not anchor:
+        return None
+    upcoming = [anchor + offset for offset in offsets if anchor + offset > now]
+    return min(upcoming) if upcoming else None
+
+
+class BookingTransitionQueue:
+    """Обертка над ZSET переходов и hash снимков бронирований"""
+
+    def __init__(self, redis_client: redis.Redis):
+        self.redis = redis_client
+
+    async def schedule(self, booking: Dict[str, Any], now: Optional[datetime] = None) -> Optional[datetime]:
+        """Переставить бронирование на следующий переход (или убрать из очереди)"""
+        member = str(booking['id'])
+        due_at = next_transition_at(booking, now)
+        pipe = self.redis.pipeline(transaction=False)
+        if due_at is None:
+            pipe.zrem(BOOKING_AUTOMATION_DUE_KEY, member)
+            pipe.hdel(BOOKING_AUTOMATION_SNAPSHOTS_KEY, member)
+        else:
+            pipe.hset(BOOKING_AUTOMATION_SNAPSHOTS_KEY, member, json.dumps(booking, default=str))
+            pipe.zadd(BOOKING_AUTOMATION_DUE_KEY, {member: due_at.timestamp()})
+        await pipe.execute()
+        return due_at
+
+    async def retry(self, booking: Dict[str, Any], delay: timedelta):
+        """Вернуть бронирование в очередь через delay (после ошибки обработки)"""
+        member = str(booking['id'])
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(BOOKING_AUTOMATION_SNAPSHOTS_KEY, member, json.dumps(booking, default=str))
+        pipe.zadd(BOOKING_AUTOMATION_DUE_KEY, {member: time.time() + delay.total_seconds()})
+        await pipe.execute()
+
+    async def forget(self, booking_ids):
+        """Убрать бронирования из очереди и снимков"""
+        members = [str(booking_id) for booking_id in booking_ids]
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zrem(BOOKING_AUTOMATION_DUE_KEY, *members)
+        pipe.hdel(BOOKING_AUTOMATION_SNAPSHOTS_KEY, *members)
+        await pipe.execute()
+
+    async def seconds_until_next(self) -> Optional[float]:
+        """Сколько спать до ближайшего перехода (None - очередь пуста)"""
+        head = await self.redis.zrange(BOOKING_AUTOMATION_DUE_KEY, 0, 0, withscores=True)
+        if not head:
+            return None
+        return max(0.0, head[0][1] - time.time())
+
+    async def wait_for_event(self, timeout: float):
+        """Сон до timeout секунд с пробуждением по событию от API"""
+        await self.redis.blpop(BOOKING_AUTOMATION_WAKE_KEY, timeout=max(1, int(timeout)))
+
+    async def claim_due(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Забрать наступившие переходы. ZREM атомарен - при нескольких шедулерах
+        каждое бронирование обрабатывает тот, чей ZREM вернул 1.
+        """
+        members = await self.redis.zrangebyscore(
+            BOOKING_AUTOMATION_DUE_KEY, '-inf', time.time(), start=0, num=limit
+        )
+        if not members:
+            return []
+        snapshots = await self.redis.hmget(BOOKING_AUTOMATION_SNAPSHOTS_KEY, members)
+
+        claimed = []
+        for member, snapshot in zip(members, snapshots):
+            if not await self.redis.zrem(BOOKING_AUTOMATION_DUE_KEY, member):
+                continue
+            if snapshot is None:
+                logger.warning(f"⚠️ Нет снимка бронирования {member} в очереди автоматизации, пропускаем")
+                continue
+            claimed.append(json.loads(snapshot))
+        return claimed
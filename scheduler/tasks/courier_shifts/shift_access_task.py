@@ -1,5 +1,4 @@
 import logging
-import requests
 import httpx
 import psycopg # Добавляем импорт psycopg
 # from psycopg2.extras import RealDictCursor # Убираем зависимость от psycopg2
@@ -17,6 +16,7 @@ import httpx
 # Импортируем DatabaseService и SchedulerSettings для статической функции
 from services.database_service import DatabaseService 
 from core.config import SchedulerSettings
+from tasks.job_context import get_task_manager
 
 if TYPE_CHECKING:
     from tasks.task_manager import TaskManager 
@@ -26,11 +26,14 @@ logger = logging.getLogger(__name__)
 
 
 # --- Статическая функция-обертка для APScheduler --- 
-async def execute_job(chat_id: str, db_service: DatabaseService, settings: SchedulerSettings, task_manager: 'TaskManager', task_type: str = None, scheduler_instance = None):
+async def execute_job(chat_id: str, task_type: str = None):
     """Статическая обертка, вызываемая APScheduler.
        Выполняет основную логику задачи и запускает перепланирование.
+       TaskManager и настройки берутся из tasks.job_context (в kwargs задачи их нет).
     """
     logger.info(f"[ShiftAccessTask.execute_job] Запуск для chat_id: {chat_id} (тип: {task_type})")
+    task_manager = get_task_manager()
+    settings = task_manager.settings if task_manager else scheduler_settings
     task_success = False
     try:
         # Создаем временный экземпляр ТОЛЬКО с настройками
@@ -77,7 +80,7 @@ class ShiftAccessTask(BaseTask):
             logger.info(f"({self.TASK_TYPE}) Запрос настроек доступа (async): {url}")
             
             # Используем httpx для HTTP-запросов
-            async with httpx.AsyncClient() as client:
+            async with self.http_clients.session("api") as client:
                 response = await client.get(url, timeout=10)
                 response.raise_for_status() 
                 settings_data = response.json()
@@ -99,8 +102,8 @@ class ShiftAccessTask(BaseTask):
             return None
 
     # Восстанавливаем асинхронный метод schedule
-    async def schedule(self, chat_id):
-        """Планирует задачу уведомления в телеграм (асинхронно)"""
+    async def schedule(self, chat_id, db_batch=None):
+        """Планирует задачу уведомления в телеграм (асинхронно). db_batch - см. TaskManager.save_task"""
         try:
             chat_id_str = str(chat_id)
             logger.info(f"=== ({self.TASK_TYPE}) Планирование уведомления в телеграм для чата {chat_id_str} (async) ===")
@@ -137,7 +140,7 @@ class ShiftAccessTask(BaseTask):
             
             task_id = self.generate_task_id(self.TASK_TYPE, chat_id_str)
             task_data = {'comment': f'Telegram notification for {chat_id_str}'}
-            save_result = await self.task_manager.save_task(task_id, chat_id_str, self.TASK_TYPE, next_registration, task_data)
+            save_result = await self.task_manager.save_task(task_id, chat_id_str, self.TASK_TYPE, next_registration, task_data, db_batch=db_batch)
             
             if not save_result:
                  logger.error(f"({self.TASK_TYPE}) ❌ Ошибка при сохранении/планировании задачи {task_id} через TaskManager")
@@ -258,7 +261,7 @@ class ShiftAccessTask(BaseTask):
         if hasattr(settings, 'HEALTHCHECK_BOT_SEND_MESSAGE_URL') and settings.HEALTHCHECK_BOT_SEND_MESSAGE_URL:
             logger.info(f"({self.TASK_TYPE}) 🔍 Проверка доступности эндпоинта отправки сообщений перед отправкой...")
             try:
-                async with httpx.AsyncClient() as client:
+                async with self.http_clients.session("bot") as client:
                     health_response = await client.get(settings.HEALTHCHECK_BOT_SEND_MESSAGE_URL, timeout=5)
                     if health_response.status_code != 200:
                         logger.error(f"({self.TASK_TYPE}) ❌ Эндпоинт отправки сообщений недоступен. Статус: {health_response.status_code}. Отмена отправки.")
@@ -282,7 +285,7 @@ class ShiftAccessTask(BaseTask):
         
         # Используем асинхронный HTTP-клиент
         try:
-            async with httpx.AsyncClient() as client:
+            async with self.http_clients.session("bot") as client:
                 response = await client.post(api_endpoint, json=payload)
                 if response.status_code == 200:
                     logger.info(f"({self.TASK_TYPE}) ✅ Уведомление успешно отправлено в Telegram Bot API.")
@@ -0,0 +1,98 @@
+"""
+Параллельная рассылка сообщений по чатам с ограничением скорости.
+
+Telegram допускает около 30 сообщений в секунду на бота в целом, но сообщения
+одного чата должны идти по порядку. Рассылка выполняется параллельно по чатам
+(не больше TELEGRAM_MAX_CONCURRENT_CHATS одновременно), части сообщения внутри
+чата - последовательно, а каждая отправка берет токен из общего для процесса
+token bucket. Ответ 429 от бота учитывает retry_after.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from core.config import scheduler_settings
+
+logger = logging.getLogger(__name__)
+
+# Повторы отправки при 429 (flood limit)
+MAX_FLOOD_RETRIES = 3
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity накопленных"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class ChatFanout:
+    def __init__(self, bucket: TokenBucket, max_concurrent_chats: int, per_chat_interval: float):
+        self.bucket = bucket
+        self.per_chat_interval = per_chat_interval
+        self._chat_slots = asyncio.Semaphore(max_concurrent_chats)
+
+    async def run(self, chat_ids: List[Any], send_chat: Callable[[Any], Awaitable[bool]]) -> List[bool]:
+        """Вызывает send_chat для каждого чата параллельно; результат - успех по каждому чату"""
+        async def guarded(chat_id):
+            async with self._chat_slots:
+                try:
+                    return await send_chat(chat_id)
+                except Exception as e:
+                    logger.error(f"❌ Ошибка рассылки в чат {chat_id}: {e}", exc_info=True)
+                    return False
+
+        return await asyncio.gather(*(guarded(chat_id) for chat_id in chat_ids))
+
+    async def post(self, client: httpx.AsyncClient, url: str, payload: Dict[str, Any], timeout: float = 10.0) -> httpx.Response:
+        """Одна отправка с учетом общего лимита скорости и retry_after при 429"""
+        for attempt in range(MAX_FLOOD_RETRIES + 1):
+            await self.bucket.acquire()
+            response = await client.post(url, json=payload, timeout=timeout)
+            if response.status_code != 429 or attempt == MAX_FLOOD_RETRIES:
+                return response
+            retry_after = _retry_after(response)
+            logger.warning(f"⚠️ Flood limit для чата {payload.get('chat_id')}, повтор через {retry_after} с")
+            await asyncio.sleep(retry_after)
+        return response
+
+
+def _retry_after(response: httpx.Response) -> float:
+    try:
+        return float(response.headers.get("Retry-After") or response.json()["parameters"]["retry_after"])
+    except Exception:
+        return 1.0
+
+
+# Общий для процесса лимит отправок боту (ленивая инициализация)
+_telegram_fanout = None
+
+def get_telegram_fanout() -> ChatFanout:
+    global _telegram_fanout
+    if _telegram_fanout is None:
+        settings = scheduler_settings
+        _telegram_fanout = ChatFanout(
+            TokenBucket(settings.TELEGRAM_GLOBAL_RATE_PER_SECOND),
+            max_concurrent_chats=settings.TELEGRAM_MAX_CONCURRENT_CHATS,
+            per_chat_interval=settings.TELEGRAM_PER_CHAT_INTERVAL
+        )
+    return _telegram_fanout
@@ -7,12 +7,16 @@ from apscheduler.triggers.cron import CronTrigger
 import httpx
 import asyncio # <<< Добавляем asyncio для sleep
 import json
+import time
 
 # Импортируем базовый класс и зависимости
 from ..base_task import BaseTask
-from core.config import SchedulerSettings # Используем SchedulerSettings для типизации
+from core.config import SchedulerSettings, scheduler_settings # Используем SchedulerSettings для типизации
 from services.database_service import DatabaseService # Используем DatabaseService для типизации
 from tasks.event_reminder.reminder_task import EventReminderTask
+from .fanout import get_telegram_fanout
+from tasks.job_reconciliation import task_version, versioned_job_name
+from tasks.job_context import get_task_manager
 
 # Осторожно с циклическими импортами!
 if TYPE_CHECKING:
@@ -31,20 +35,22 @@ async def send_notification(**kwargs):
     job_id = kwargs.get('job_id')
     message = kwargs.get('message')
     chat_ids = kwargs.get('chat_ids')
-    settings = kwargs.get('settings') # <<< Получаем настройки
     notification_id = kwargs.get('notification_id')
     confirmation_type = kwargs.get('confirmation_type', 'default') # По умолчанию 'default'
+    # TaskManager процесса (нужен для планирования напоминаний) и его настройки
+    task_manager = get_task_manager()
+    settings = task_manager.settings if task_manager else scheduler_settings
 
-    if not all([job_id, message, chat_ids, settings, notification_id]):
-        logger.error(f"[send_notification:{job_id}] Недостаточно данных, настроек или notification_id в kwargs для выполнения.")
+    if not all([job_id, message, chat_ids, notification_id]):
+        logger.error(f"[send_notification:{job_id}] Недостаточно данных или notification_id в kwargs для выполнения.")
         return
 
     logger.info(f"[send_notification:{job_id}] Запуск execute для уведомления.")
 
     try:
         # <<< Создаем экземпляр задачи, передавая настройки >>>
-        # scheduler_instance и task_manager не нужны для execute, передаем None
-        task_instance = EventNotificationTask(scheduler_instance=None, task_manager=None, settings=settings)
+        # scheduler_instance для execute не нужен, передаем None
+        task_instance = EventNotificationTask(scheduler_instance=None, task_manager=task_manager, settings=settings)
         # <<< Вызываем НЕСТАТИЧЕСКИЙ метод execute >>>
         await task_instance.execute(**kwargs) 
         logger.info(f"[send_notification:{job_id}] Вызов execute завершен.")
@@ -253,13 +259,11 @@ class EventNotificationTask(BaseTask):
                 'message': message,
                 'chat_ids': chat_ids,
                 'job_id': job_id,
-                'settings': self.settings,
                 'requires_confirmation': requires_confirmation,
                 'notification_id': notification_id,
                 # <<< ИЗМЕНЕНИЕ: Передаем тип подтверждения >>>
                 'confirmation_type': confirmation_type,
-                # <<< ИЗМЕНЕНИЕ: Передаем TaskManager для доступа к другим задачам >>>
-                'task_manager': self.task_manager
+                # TaskManager и настройки исполнитель берет из tasks.job_context
             }
 
             # --- Добавление/Обновление задачи в APScheduler ---
@@ -305,6 +309,10 @@ class EventNotificationTask(BaseTask):
                     if not save_db_success:
                          logger.error(f"({self.TASK_TYPE}:{job_id}) Ошибка сохранения/обновления в scheduler_tasks.")
                          # Не возвращаем False, т.к. в APScheduler уже запланировано
+                    elif job:
+                        # Версия строки БД в имени job - при перезагрузке задача не пересоздается
+                        version = task_version(self.TASK_TYPE, None, actual_next_run_time_utc, db_save_data['data'])
+                        self.scheduler.modify_job(job_id, name=versioned_job_name(f'{self.TASK_TYPE}_{job_id}', version))
                 except Exception as db_err:
                     logger.error(f"({self.TASK_TYPE}:{job_id}) Исключение при сохранении/обновлении в scheduler_tasks: {db_err}", exc_info=True)
 
@@ -359,8 +367,7 @@ class EventNotificationTask(BaseTask):
         notification_id = kwargs.get('notification_id')
         # <<< ИЗМЕНЕНИЕ: Получаем confirmation_type >>>
         confirmation_type = kwargs.get('confirmation_type', 'default')
-        # <<< ИЗМЕНЕНИЕ: Получаем task_manager >>>
-        task_manager = kwargs.get('task_manager')
+        task_manager = self.task_manager
 
         logger.info(f"({self.TASK_TYPE}:{job_id}) Начало выполнения execute. Confirmation required: {requires_confirmation}, Type: {confirmation_type}")
 
@@ -381,118 +388,106 @@ class EventNotificationTask(BaseTask):
         send_endpoint = f"{base_bot_url}/send_message"
         
         # --- Отправляем сообщение в каждый чат --- 
-        sent_count = 0
-        error_count = 0
-        
         # Разбиваем сообщение на части, если оно длинное
         # Telegram API ограничивает длину сообщения примерно 4096 символами
         message_parts = self.split_message(message, max_length=4000)
         
-        # Получаем HTTP клиент один раз
-        try:
-            async with httpx.AsyncClient() as client:
-                for chat_id in chat_ids:
-                    try:
-                        # Убедимся, что chat_id это строка для payload
-                        chat_id_str = str(chat_id)
-                        
-                        # Отправляем каждую часть сообщения последовательно
-                        for i, part in enumerate(message_parts):
-                            payload = {
-                                "chat_id": chat_id_str,
-                                "text": part,
-                                "parse_mode": "HTML" # Или другой режим
+        # Чаты обрабатываются параллельно (с общим лимитом скорости отправки боту),
+        # части сообщения внутри чата - строго по порядку
+        fanout = get_telegram_fanout()
+
+        async def send_to_chat(chat_id) -> bool:
+            # Убедимся, что chat_id это строка для payload
+            chat_id_str = str(chat_id)
+            async with self.http_clients.session("bot") as client:
+                # Отправляем каждую часть сообщения последовательно
+                for i, part in enumerate(message_parts):
+                    payload = {
+                        "chat_id": chat_id_str,
+                        "text": part,
+                        "parse_mode": "HTML" # Или другой режим
+                    }
+
+                    # Добавляем кнопку подтверждения только к последней части сообщения
+                    if requires_confirmation and i == len(message_parts) - 1:
+                        # <<< ИЗМЕНЕНИЕ: Используем confirmation_type для префикса >>>
+                        prefix = "confirm_eos:" if confirmation_type == 'end_of_shift' else "confirm:"
+                        if not notification_id:
+                            logger.error(f"({self.TASK_TYPE}:{job_id}) Не найден notification_id для создания callback_data.")
+                        else:
+                            callback_data = f"{prefix}{notification_id}"
+                            payload["reply_markup"] = {
+                                "inline_keyboard": [
+                                    [
+                                        {
+                                            "text": "Подтвердить ✅",
+                                            "callback_data": callback_data
+                                        }
+                                    ]
+                                ]
                             }
+                            logger.info(f"({self.TASK_TYPE}:{job_id}) Добавлена кнопка подтверждения с callback_data: {callback_data}")
 
-                            # Добавляем кнопку подтверждения только к последней части сообщения
-                            if requires_confirmation and i == len(message_parts) - 1:
-                                # <<< ИЗМЕНЕНИЕ: Используем confirmation_type для префикса >>>
-                                prefix = "confirm_eos:" if confirmation_type == 'end_of_shift' else "confirm:"
-                                if not notification_id:
-                                    logger.error(f"({self.TASK_TYPE}:{job_id}) Не найден notification_id для создания callback_data.")
-                                else:
-                                    callback_data = f"{prefix}{notification_id}"
-                                    payload["reply_markup"] = {
-                                        "inline_keyboard": [
-                                            [
-                                                {
-                                                    "text": "Подтвердить ✅",
-                                                    "callback_data": callback_data
-                                                }
-                                            ]
-                                        ]
-                                    }
-                                    logger.info(f"({self.TASK_TYPE}:{job_id}) Добавлена кнопка подтверждения с callback_data: {callback_data}")
-
-                            logger.info(f"({self.TASK_TYPE}:{job_id}) Отправка части {i+1}/{len(message_parts)} в чат {chat_id_str}...")
-                            logger.debug(f"({self.TASK_TYPE}:{job_id}) Payload: {json.dumps(payload, ensure_ascii=False)}") # Логируем JSON
-
-                            response = await client.post(send_endpoint, json=payload, timeout=10.0) # Таймаут на каждый запрос
-                            
-                            if response.status_code == 200:
-                                logger.info(f"({self.TASK_TYPE}:{job_id}) -> Успешно отправлена часть {i+1}/{len(message_parts)} в чат {chat_id_str}.")
-                                # Считаем успешной, если последняя часть отправлена
-                                if i == len(message_parts) - 1:
-                                    sent_count += 1
-                            else:
-                                logger.error(f"({self.TASK_TYPE}:{job_id}) -> Ошибка отправки части {i+1}/{len(message_parts)} в чат {chat_id_str}: {response.status_code}, {response.text}")
-                                if i == len(message_parts) - 1:
-                                    error_count += 1
-                                break  # Прекращаем отправку частей при ошибке
-                                
-                            # Небольшая пауза между отправкой частей
-                            await asyncio.sleep(0.3)
-
-                        # <<< ИЗМЕНЕНИЕ: Планируем напоминание, если нужно >>>
-                        if requires_confirmation and sent_count > 0:  # Только если хотя бы одно сообщение отправлено успешно
-                            if task_manager:
-                                # Время для первого напоминания - через 30 минут после этого уведомления
-                                first_reminder_time = datetime.now(self.timezone) + timedelta(minutes=30) # ВОЗВРАЩЕНО НА 30 МИНУТ
-                                # first_reminder_time = datetime.now(self.timezone) + timedelta(minutes=1) # Для теста
-
-                                # --- ДОБАВЛЕНИЕ: Преобразование chat_id к короткому формату ПЕРЕД планированием ---
-                                chat_id_long = chat_id # Сохраняем оригинальный ID (может быть int или str)
-                                chat_id_str = str(chat_id_long)
-                                logger.debug(f"Используем оригинальный chat_id {chat_id_str} для планирования напоминания")
-                                # --- КОНЕЦ ДОБАВЛЕНИЯ ---
-                                
-                                # --- ИСПОЛЬЗУЕМ ОРИГИНАЛЬНЫЙ ID для ID задачи и данных ---
-                                reminder_job_id = f"reminder:{notification_id}:{chat_id_str}" # Используем оригинальный ID
-                                reminder_data = {
-                                    'job_id': reminder_job_id,
-                                    'chat_id': chat_id_str, # Передаем оригинальный строковый ID
-                                    'notification_id': notification_id,
-                                    'confirmation_type': confirmation_type,
-                                    'run_time': first_reminder_time
-                                }
-                                # --- КОНЕЦ ИЗМЕНЕНИЯ ID ---
-                                
-                                # Получаем экземпляр задачи напоминания
-                                reminder_task_instance = task_manager.task_instances.get(EventReminderTask.TASK_TYPE)
-                                if reminder_task_instance:
-                                    # <<< ИЗМЕНЕНИЕ: Логируем с оригинальным ID >>>
-                                    logger.info(f"({self.TASK_TYPE}:{job_id}) Планирование задачи-напоминания {reminder_job_id} для чата {chat_id_str} на {first_reminder_time}")
-                                    # Запускаем планирование напоминания (не ждем завершения)
-                                    asyncio.create_task(reminder_task_instance.schedule(reminder_data))
-                                else:
-                                    logger.error(f"({self.TASK_TYPE}:{job_id}) Не найден экземпляр EventReminderTask в task_manager для планирования напоминания.")
-                            else:
-                                logger.error(f"({self.TASK_TYPE}:{job_id}) TaskManager не передан в kwargs, не могу запланировать напоминание.")
-                        # <<< Конец планирования напоминания >>>
-
-                    except Exception as send_err:
-                        logger.error(f"({self.TASK_TYPE}:{job_id}) -> Ошибка при отправке в чат {chat_id}: {send_err}", exc_info=True)
-                        error_count += 1
-                        
-                    # Небольшая пауза между запросами к разным чатам
-                    await asyncio.sleep(0.5)
-                
-        except Exception as client_err:
-             logger.error(f"({self.TASK_TYPE}:{job_id}) ❌ Ошибка при создании HTTP-клиента: {client_err}", exc_info=True)
-             # Если клиент не создался, нет смысла продолжать
-             error_count = len(chat_ids) # Считаем все ошибки
-        finally:
-            if client:
-                await client.aclose()
+                    logger.info(f"({self.TASK_TYPE}:{job_id}) Отправка части {i+1}/{len(message_parts)} в чат {chat_id_str}...")
+                    logger.debug(f"({self.TASK_TYPE}:{job_id}) Payload: {json.dumps(payload, ensure_ascii=False)}") # Логируем JSON
+
+                    response = await fanout.post(client, send_endpoint, payload, timeout=10.0) # Таймаут на каждый запрос
+
+                    if response.status_code != 200:
+                        logger.error(f"({self.TASK_TYPE}:{job_id}) -> Ошибка отправки части {i+1}/{len(message_parts)} в чат {chat_id_str}: {response.status_code}, {response.text}")
+                        return False  # Прекращаем отправку частей при ошибке
+
+                    logger.info(f"({self.TASK_TYPE}:{job_id}) -> Успешно отправлена часть {i+1}/{len(message_parts)} в чат {chat_id_str}.")
+                    if i < len(message_parts) - 1:
+                        # Небольшая пауза между частями в одном чате
+                        await asyncio.sleep(fanout.per_chat_interval)
+
+            # Считаем успешной, если последняя часть отправлена
+            delivered = True
+
+            # <<< ИЗМЕНЕНИЕ: Планируем напоминание, если нужно >>>
+            if requires_confirmation and delivered:  # Только если сообщение в этот чат отправлено успешно
+                if task_manager:
+                    # Время для первого напоминания - через 30 минут после этого уведомления
+                    first_reminder_time = datetime.now(self.timezone) + timedelta(minutes=30) # ВОЗВРАЩЕНО НА 30 МИНУТ
+                    # first_reminder_time = datetime.now(self.timezone) + timedelta(minutes=1) # Для теста
+
+                    # --- ДОБАВЛЕНИЕ: Преобразование chat_id к короткому формату ПЕРЕД планированием ---
+                    chat_id_long = chat_id # Сохраняем оригинальный ID (может быть int или str)
+                    chat_id_str = str(chat_id_long)
+                    logger.debug(f"Используем оригинальный chat_id {chat_id_str} для планирования напоминания")
+                    # --- КОНЕЦ ДОБАВЛЕНИЯ ---
+                    
+                    # --- ИСПОЛЬЗУЕМ ОРИГИНАЛЬНЫЙ ID для ID задачи и данных ---
+                    reminder_job_id = f"reminder:{notification_id}:{chat_id_str}" # Используем оригинальный ID
+                    reminder_data = {
+                        'job_id': reminder_job_id,
+                        'chat_id': chat_id_str, # Передаем оригинальный строковый ID
+                        'notification_id': notification_id,
+                        'confirmation_type': confirmation_type,
+                        'run_time': first_reminder_time
+                    }
+                    # --- КОНЕЦ ИЗМЕНЕНИЯ ID ---
+                    
+                    # Получаем экземпляр задачи напоминания
+                    reminder_task_instance = task_manager.task_instances.get(EventReminderTask.TASK_TYPE)
+                    if reminder_task_instance:
+                        # <<< ИЗМЕНЕНИЕ: Логируем с оригинальным ID >>>
+                        logger.info(f"({self.TASK_TYPE}:{job_id}) Планирование задачи-напоминания {reminder_job_id} для чата {chat_id_str} на {first_reminder_time}")
+                        # Запускаем планирование напоминания (не ждем завершения)
+                        asyncio.create_task(reminder_task_instance.schedule(reminder_data))
+                    else:
+                        logger.error(f"({self.TASK_TYPE}:{job_id}) Не найден экземпляр EventReminderTask в task_manager для планирования напоминания.")
+                else:
+                    logger.error(f"({self.TASK_TYPE}:{job_id}) TaskManager не инициализирован, не могу запланировать напоминание.")
+            # <<< Конец планирования напоминания >>>
+
+            return delivered
+
+        started = time.monotonic()
+        results = await fanout.run(chat_ids, send_to_chat)
+        sent_count = sum(1 for delivered in results if delivered)
+        error_count = len(results) - sent_count
+        logger.info(f"({self.TASK_TYPE}:{job_id}) Рассылка по {len(chat_ids)} чатам заняла {time.monotonic() - started:.1f} с")
 
         logger.info(f"({self.TASK_TYPE}:{job_id}) Завершение выполнения execute. Успешно отправлено: {sent_count}, Ошибок: {error_count}") 
\ No newline at end of file
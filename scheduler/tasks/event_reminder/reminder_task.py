@@ -9,6 +9,7 @@ import json
 # Импортируем базовый класс и зависимости
 from ..base_task import BaseTask
 from core.config import SchedulerSettings
+from tasks.job_context import get_task_manager
 import httpx # Нужен для отправки боту
 
 # Осторожно с циклическими импортами!
@@ -27,14 +28,14 @@ async def send_reminder(**kwargs):
     chat_id = kwargs.get('chat_id')
     notification_id = kwargs.get('notification_id') # ID исходного уведомления
     confirmation_type = kwargs.get('confirmation_type', 'default')
-    settings = kwargs.get('settings')
-    task_manager = kwargs.get('task_manager')
-    # Получаем планировщик из kwargs, его должен передать TaskManager
-    scheduler_instance = kwargs.get('scheduler_instance')
+    # Планировщик и настройки берем у TaskManager процесса (в kwargs только простые данные)
+    task_manager = get_task_manager()
 
-    if not all([job_id, chat_id, notification_id, settings, scheduler_instance, task_manager]):
-        logger.error(f"[send_reminder:{job_id}] Недостаточно данных, scheduler_instance или task_manager в kwargs.")
+    if not all([job_id, chat_id, notification_id, task_manager]):
+        logger.error(f"[send_reminder:{job_id}] Недостаточно данных в kwargs или TaskManager не инициализирован.")
         return
+    settings = task_manager.settings
+    scheduler_instance = task_manager.scheduler
 
     logger.info(f"[send_reminder:{job_id}] Запуск execute для напоминания в чат {chat_id}.")
 
@@ -108,7 +109,6 @@ class EventReminderTask(BaseTask):
         chat_id = kwargs.get('chat_id')
         notification_id = kwargs.get('notification_id')
         confirmation_type = kwargs.get('confirmation_type', 'default')
-        scheduler = kwargs.get('scheduler_instance') # Получаем планировщик
 
         # --- ИЗМЕНЕНИЕ: Логируем начало выполнения ---
         logger.info(f"({self.TASK_TYPE}:{job_id}) Начало выполнения execute для чата {chat_id}.")
@@ -161,7 +161,7 @@ class EventReminderTask(BaseTask):
         success_chat_id = None  # ID чата, на который успешно отправлено сообщение
         
         try:
-            async with httpx.AsyncClient() as client:
+            async with self.http_clients.session("bot") as client:
                 # Перебираем варианты ID чата
                 for variant_chat_id in chat_id_variants:
                     if send_success:
@@ -0,0 +1,25 @@
+"""
+Зависимости исполнителей задач APScheduler.
+
+Задачи хранятся в RedisJobStore (pickle), поэтому в их kwargs кладутся только
+ID и простые данные. TaskManager, а через него планировщик, db_service и
+настройки, исполнители получают отсюда во время запуска.
+"""
+
+from typing import Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from tasks.task_manager import TaskManager
+
+_task_manager: Optional['TaskManager'] = None
+
+
+def set_task_manager(task_manager: 'TaskManager'):
+    """Регистрирует TaskManager процесса (вызывается из TaskManager.__init__)"""
+    global _task_manager
+    _task_manager = task_manager
+
+
+def get_task_manager() -> Optional['TaskManager']:
+    """TaskManager процесса или None, если шедулер еще не инициализирован"""
+    return _task_manager
@@ -0,0 +1,57 @@
+"""
+Инкрементальная сверка задач scheduler_tasks с jobstore APScheduler.
+
+Каждая задача, созданная из строки scheduler_tasks, несет в имени job версию -
+короткий хэш полей строки (тип, чат, данные и, для разовых задач, время запуска).
+При перезагрузке TaskManager сравнивает версию строки БД с версией job в Redis
+и пересоздает только новые и изменившиеся задачи; совпавшие не трогает.
+"""
+
+import hashlib
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+# Разделитель версии в имени job: "event_reminder для 123 #v1a2b3c4d5e6f"
+JOB_VERSION_MARK = " #v"
+
+
+def is_recurring_task(data: Optional[Dict[str, Any]]) -> bool:
+    """Повторяющиеся задачи определяются данными, а не временем следующего запуска"""
+    data = data or {}
+    repeat = data.get('repeat') or {}
+    return bool(data.get('is_recurring')) or repeat.get('type', 'none') != 'none'
+
+
+def task_version(task_type: str, chat_id: Any, next_run_time: Optional[datetime], data: Optional[Dict[str, Any]]) -> str:
+    """Версия задачи - одинаковая для строки БД и для job, созданной из нее"""
+    run_at = None
+    if next_run_time and not is_recurring_task(data):
+        # Время следующего запуска повторяющейся задачи слушатель обновляет после
+        # каждого выполнения - в версию оно не входит
+        run_at = int(next_run_time.timestamp())
+    fingerprint = json.dumps(
+        [task_type, str(chat_id) if chat_id is not None else None, run_at, data or {}],
+        sort_keys=True, default=str
+    )
+    return hashlib.sha1(fingerprint.encode()).hexdigest()[:12]
+
+
+def versioned_job_name(name: str, version: str) -> str:
+    return f"{name}{JOB_VERSION_MARK}{version}"
+
+
+def job_version(job) -> Optional[str]:
+    """Версия из имени job (None - job создана без версии или отсутствует)"""
+    if job is None or not job.name or JOB_VERSION_MARK not in job.name:
+        return None
+    return job.name.rsplit(JOB_VERSION_MARK, 1)[1]
+
+
+def find_orphan_job_ids(jobs_by_id: Dict[str, Any], db_task_ids: Iterable[str]) -> List[str]:
+    """Job с версией (созданные из scheduler_tasks), строк которых в БД больше нет"""
+    db_task_ids = {str(task_id) for task_id in db_task_ids}
+    return [
+        job_id for job_id, job in jobs_by_id.items()
+        if job_id not in db_task_ids and job_version(job) is not None
+    ]
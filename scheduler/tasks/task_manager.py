@@ -1,5 +1,4 @@
 import logging
-import requests
 import traceback
 # Удаляем импорт os, если он больше не нужен
 # Импортируем pytz для работы с временными зонами по имени
@@ -37,6 +36,9 @@ from apscheduler.jobstores.base import JobLookupError
 from typing import Optional, Dict, Any, List
 # Импортируем DatabaseService для типизации
 from services.database_service import DatabaseService
+from services.http_clients import http_clients
+from tasks.job_reconciliation import task_version, versioned_job_name, job_version, find_orphan_job_ids
+from tasks.job_context import set_task_manager
 import asyncio # Добавляем asyncio сюда, если его еще нет
 import json # <-- Добавляем импорт json
 from tasks.event_notification.notification_task import EventNotificationTask # <<< Добавляем импорт
@@ -128,6 +130,14 @@ class TaskManager:
         self.api_url = self.settings.API_URL
         # Сохраняем сервис БД
         self.db_service = db_service
+        # Общие HTTP-клиенты (пул соединений), передаются всем задачам
+        self.http_clients = http_clients
+        # Исполнители задач берут TaskManager отсюда: в kwargs задач (RedisJobStore) его нет
+        set_task_manager(self)
+        # Фоновая синхронизация с API после сверки задач (reload_tasks не ждет ее)
+        self._api_sync_task: Optional[asyncio.Task] = None
+        # Перезагрузки (старт и /reload-tasks) выполняются по одной
+        self._reload_lock = asyncio.Lock()
         
         # Убираем создание таблицы SchedulerTaskDB отсюда, 
         # т.к. APScheduler с SQLAlchemyJobStore сам создаст свои таблицы.
@@ -170,8 +180,12 @@ class TaskManager:
                  logger.error(f"Ошибка инициализации экземпляра задачи {task_type}: {init_err}")
         # ------------------------------------------------
 
-    async def save_task(self, task_id, chat_id, task_type, next_run_time, data=None):
-        """Сохраняет задачу в БД и добавляет/обновляет в APScheduler."""
+    async def save_task(self, task_id, chat_id, task_type, next_run_time, data=None, db_batch: Optional[List[Dict[str, Any]]] = None):
+        """
+        Сохраняет задачу в БД и добавляет/обновляет в APScheduler.
+        :param db_batch: список пакетной записи (reload_tasks, синхронизация с API) - строка БД
+                         добавляется в него и пишется вызывающим через _flush_db_batch
+        """
         # <<< ИЗМЕНЕНИЕ: Преобразуем chat_id в строку перед передачей в db_service >>>
         # Также обрабатываем случай, когда chat_id может быть None (для event_notification)
         chat_id_for_db = str(chat_id) if chat_id is not None else None
@@ -184,7 +198,10 @@ class TaskManager:
         }
         # <<< КОНЕЦ ИЗМЕНЕНИЯ >>>
 
-        if self.db_service:
+        if self.db_service and db_batch is not None:
+            # Пакетная запись - задача уйдет в БД вместе с остальными задачами пачки
+            db_batch.append(db_task_data)
+        elif self.db_service:
             # Пытаемся сохранить в БД. Обрабатываем возможную ошибку с event loop.
             try:
                 # <<< ИЗМЕНЕНИЕ: Передаем db_task_data >>>
@@ -217,14 +234,11 @@ class TaskManager:
         job_args = []
 
         # --- Формируем kwargs для передачи в функцию-исполнитель --- 
+        # Только простые данные: задача сериализуется в RedisJobStore, а настройки,
+        # db_service и планировщик исполнитель получает через tasks.job_context
         job_kwargs = {
             'task_type': task_type,
             'chat_id': str(chat_id) if chat_id is not None else None, # Передаем как строку
-            # Добавляем стандартные зависимости, которые могут понадобиться исполнителю
-            'settings': self.settings,      
-            'task_manager': self,           
-            'db_service': self.db_service, # db_service тоже может быть нужен
-            'scheduler_instance': self.scheduler # <--- ДОБАВЛЕНО
         }
         
         # --- Дополнительные kwargs для конкретных типов задач --- 
@@ -256,7 +270,10 @@ class TaskManager:
                     args=job_args,          
                     kwargs=job_kwargs, # Передаем собранные kwargs
                     id=str(task_id), # ID самой задачи для APScheduler
-                    name=f'{task_type} для {chat_id if chat_id else "всех"}',
+                    name=versioned_job_name(
+                        f'{task_type} для {chat_id if chat_id else "всех"}',
+                        task_version(task_type, chat_id, next_run_time, data)
+                    ),
                     replace_existing=True,
                     # !!! ВАЖНО: Устанавливаем правильный misfire_grace_time для напоминаний !!!
                     # Ранее в EventReminderTask.schedule было 60 секунд
@@ -285,18 +302,53 @@ class TaskManager:
             logger.warning("Сервис БД не инициализирован, не могу получить активные задачи")
             return []
 
+    async def _flush_db_batch(self, db_batch: List[Dict[str, Any]]):
+        """Записать задачи пачки одним запросом; если не вышло - по одной"""
+        if not db_batch or not self.db_service:
+            return
+        saved = await self.db_service.save_tasks_bulk(db_batch)
+        if saved:
+            logger.info(f"💾 Сохранено {saved} задач в БД одной пачкой")
+            return
+        logger.error(f"❌ Не удалось пакетно сохранить {len(db_batch)} задач в БД, сохраняем по одной")
+        failed_ids = []
+        for task_data in db_batch:
+            if not await self.db_service.save_task(task_data):
+                failed_ids.append(task_data['task_id'])
+        if failed_ids:
+            logger.error(f"❌ Задачи не сохранены в БД (есть только в APScheduler): {failed_ids}")
+
     async def reload_tasks(self):
-        """Сначала восстанавливает задачи из БД, затем синхронизирует с API."""
+        """
+        Сверяет задачи из БД с jobstore APScheduler, затем запускает синхронизацию с API в фоне.
+
+        Пересоздаются только job, версия которых (см. tasks/job_reconciliation.py)
+        не совпадает со строкой scheduler_tasks; job без строки в БД удаляются.
+        """
+        if self._reload_lock.locked():
+            logger.info("ℹ️ reload_tasks уже выполняется, ждем ее завершения.")
+        # Две сверки одновременно удаляли бы и пересоздавали job друг друга
+        async with self._reload_lock:
+            return await self._reload_tasks()
+
+    async def _reload_tasks(self):
         logger.info("--- Запуск reload_tasks --- ")
+        # Задачи, которые пересохраняются при восстановлении, пишутся в БД одной пачкой
+        # после сверки (у синхронизации с API своя пачка)
+        db_batch: List[Dict[str, Any]] = []
         
         # --- Шаг 1: Восстановление задач из нашей БД --- 
         logger.info("🔄 Шаг 1: Восстановление задач из базы данных scheduler_tasks...")
         restored_count = 0
+        unchanged_count = 0
+        orphan_count = 0
         failed_count = 0
         try:
             if self.db_service:
+                # Снимок jobstore берем до чтения БД: job, добавленные после снимка, сверка не трогает
+                jobs_by_id = {job.id: job for job in self.scheduler.get_jobs()}
                 active_db_tasks = await self.get_all_active_tasks() # Используем существующий метод
-                logger.info(f"Найдено {len(active_db_tasks)} активных задач в scheduler_tasks для восстановления.")
+                logger.info(f"Найдено {len(active_db_tasks)} активных задач в scheduler_tasks, {len(jobs_by_id)} задач в APScheduler.")
                 
                 for task_info in active_db_tasks:
                     try:
@@ -321,6 +373,12 @@ class TaskManager:
                              failed_count += 1
                              continue
                         
+                        version = task_version(task_type, chat_id, next_run_time_aware, data)
+                        if job_version(jobs_by_id.get(str(task_id))) == version:
+                            # Job в Redis совпадает со строкой БД - пересоздавать нечего
+                            unchanged_count += 1
+                            continue
+
                         logger.info(f"Восстановление задачи {task_id} (тип: {task_type}, время: {next_run_time_aware})...")
 
                         # <<< НАЧАЛО ИЗМЕНЕННОЙ ЛОГИКИ ВОССТАНОВЛЕНИЯ >>>
@@ -413,12 +471,9 @@ class TaskManager:
                                 'message': message,
                                 'chat_ids': chat_ids,
                                 'job_id': task_id, # Передаем ID для логирования внутри задачи
-                                'settings': self.settings, # Передаем настройки
                                 # <<< ИЗМЕНЕНИЕ: Добавляем извлеченные поля >>>
                                 'requires_confirmation': requires_confirmation,
                                 'notification_id': notification_id,
-                                # <<< ИЗМЕНЕНИЕ: Передаем TaskManager при восстановлении >>>
-                                'task_manager': self,
                                 # !!! ДОБАВЛЯЕМ confirmation_type В kwargs !!!
                                 'confirmation_type': confirmation_type_from_db
                             }
@@ -430,7 +485,7 @@ class TaskManager:
                                     trigger=trigger,
                                     kwargs=job_kwargs_for_executor,
                                     id=str(task_id),
-                                    name=f'{task_type} для всех', # Имя можно сделать информативнее, если нужно
+                                    name=versioned_job_name(f'{task_type} для всех', version),
                                     replace_existing=True,
                                     misfire_grace_time=3600 
                                 )
@@ -460,8 +515,9 @@ class TaskManager:
                             # Создаем CronTrigger на основе сохраненного выражения
                             trigger = None
                             try:
-                                if cron_expression == 'minute=*':
-                                    trigger = CronTrigger(minute='*', timezone=self.timezone)
+                                if cron_expression.startswith('minute='):
+                                    # Расписание могло смениться (событийный режим) - берем актуальное из настроек
+                                    trigger = CronTrigger(minute=self._booking_automation_cron_minute(), timezone=self.timezone)
                                 else:
                                     logger.error(f"Неподдерживаемое cron выражение для {task_id}: {cron_expression}")
                                     failed_count += 1
@@ -477,7 +533,7 @@ class TaskManager:
                                     'tasks.booking_status_automation.booking_status_task:execute_automation',
                                     trigger=trigger,
                                     id=task_id,
-                                    name='Автоматизация статусов бронирований',
+                                    name=versioned_job_name('Автоматизация статусов бронирований', version),
                                     max_instances=1,
                                     coalesce=True,
                                     misfire_grace_time=30,
@@ -501,7 +557,7 @@ class TaskManager:
                             # <<< СТАРАЯ ЛОГИКА для других типов задач >>>
                             # Вызываем save_task, который подходит для courier_shift_access
                             save_success = await self.save_task(
-                                task_id, chat_id, task_type, next_run_time_aware, data
+                                task_id, chat_id, task_type, next_run_time_aware, data, db_batch=db_batch
                             )
                             if save_success:
                                 restored_count += 1
@@ -514,13 +570,30 @@ class TaskManager:
                         logger.error(f"Ошибка при обработке задачи {task_info.get('task_id', 'N/A')} из БД: {task_restore_err}")
                         logger.error(traceback.format_exc())
                         failed_count += 1
+
+                # Job из scheduler_tasks, строк которых больше нет (кроме еще не записанных в БД пачкой)
+                known_ids = [task_info.get('task_id') for task_info in active_db_tasks]
+                known_ids += [task_data['task_id'] for task_data in db_batch]
+                for job_id in find_orphan_job_ids(jobs_by_id, known_ids):
+                    # Строка могла появиться после чтения БД или быть неактивной (просроченной) -
+                    # такие job оставляем, просроченные уберет шаг 1.5
+                    if await self.db_service.get_task_by_id(job_id):
+                        continue
+                    try:
+                        self.scheduler.remove_job(job_id)
+                        orphan_count += 1
+                    except JobLookupError:
+                        pass # Уже удалена или выполнена
             else:
                 logger.warning("db_service не инициализирован, пропуск восстановления задач из БД.")
         except Exception as db_restore_err:
              logger.error(f"Критическая ошибка при восстановлении задач из БД: {db_restore_err}")
              logger.error(traceback.format_exc())
              
-        logger.info(f"✅ Шаг 1 завершен: Восстановлено={restored_count}, Ошибок={failed_count}")
+        logger.info(
+            f"✅ Шаг 1 завершен: Восстановлено={restored_count}, Без изменений={unchanged_count}, "
+            f"Удалено лишних={orphan_count}, Ошибок={failed_count}"
+        )
         # ------------------------------------------------ 
         
         # --- Шаг 1.5: Очистка просроченных задач --- 
@@ -529,18 +602,19 @@ class TaskManager:
         delete_failed_count = 0
         try:
             if self.db_service:
-                overdue_ids = await self.db_service.get_overdue_task_ids()
+                # Один DELETE ... RETURNING вместо удаления задач по одной
+                overdue_ids = await self.db_service.delete_overdue_tasks()
                 if overdue_ids:
-                    logger.info(f"Найдено {len(overdue_ids)} просроченных задач для удаления: {overdue_ids}")
+                    logger.info(f"Удалено {len(overdue_ids)} просроченных задач из БД: {overdue_ids}")
+                    deleted_count = len(overdue_ids)
                     for task_id in overdue_ids:
-                        logger.info(f"Удаление просроченной задачи {task_id}...")
-                        # Используем delete_task, который удаляет из БД и APScheduler
-                        delete_success = await self.delete_task(task_id)
-                        if delete_success:
-                            deleted_count += 1
-                        else:
+                        try:
+                            self.scheduler.remove_job(str(task_id))
+                        except JobLookupError:
+                            pass # В APScheduler задачи уже нет
+                        except Exception as e:
                             delete_failed_count += 1
-                            logger.error(f"Не удалось удалить просроченную задачу {task_id}.")
+                            logger.error(f"Не удалось удалить просроченную задачу {task_id} из APScheduler: {e}")
                 else:
                     logger.info("Просроченных задач в scheduler_tasks не найдено.")
             else:
@@ -552,7 +626,21 @@ class TaskManager:
         logger.info(f"✅ Шаг 1.5 завершен: Удалено={deleted_count}, Ошибок={delete_failed_count}")
         # -------------------------------------------
         
-        # --- Шаг 2: Синхронизация с API (существующая логика) --- 
+        # Сверка из БД записана - дальше планировщик готов к работе
+        await self._flush_db_batch(db_batch)
+
+        # --- Шаг 2: Синхронизация с API - в фоне, чтобы не задерживать старт --- 
+        if self._api_sync_task and not self._api_sync_task.done():
+            logger.info("ℹ️ Синхронизация с API уже выполняется, повторно не запускаем.")
+        else:
+            self._api_sync_task = asyncio.create_task(self._sync_tasks_with_api())
+            logger.info("🔄 Шаг 2: Синхронизация задач с API запущена в фоне.")
+        logger.info("--- Завершение reload_tasks --- ")
+        return True
+
+    async def _sync_tasks_with_api(self):
+        """Шаг 2 reload_tasks: планирует/обновляет задачи чатов из API (работает в фоне)"""
+        db_batch: List[Dict[str, Any]] = []
         logger.info("🔄 Шаг 2: Синхронизация задач с API...")
         try:
             logger.info("🔌 Проверка соединения с API...")
@@ -576,10 +664,10 @@ class TaskManager:
                     
                     # Вызываем методы schedule у конкретных задач
                     # Эти методы вызовут save_task, который использует replace_existing=True
-                    reg_result = await self.schedule_registration_open_event(chat_id)
+                    reg_result = await self.schedule_registration_open_event(chat_id, db_batch=db_batch)
                     logger.info(f"Синхронизация registration_open_event для {chat_id}: {'✅' if reg_result else '❌'}")
                     
-                    shift_result = await self.schedule_shift_access(chat_id)
+                    shift_result = await self.schedule_shift_access(chat_id, db_batch=db_batch)
                     logger.info(f"Синхронизация shift_access для {chat_id}: {'✅' if shift_result else '❌'}")
                     
                     processed_chats += 1
@@ -588,7 +676,6 @@ class TaskManager:
                 logger.warning("Не найдено курьерских чатов в API для синхронизации.")
 
             logger.info("✅ Шаг 2 завершен: Синхронизация с API.")
-            # Возвращаем True, если хотя бы один шаг прошел успешно (например, восстановление)
             return True 
 
         except Exception as e:
@@ -596,23 +683,23 @@ class TaskManager:
             logger.error(traceback.format_exc())
             return False
         finally:
-            logger.info("--- Завершение reload_tasks --- ")
+            await self._flush_db_batch(db_batch)
 
     # Метод для существующей задачи (остается без изменений)
-    async def schedule_shift_access(self, chat_id):
+    async def schedule_shift_access(self, chat_id, db_batch: Optional[List[Dict[str, Any]]] = None):
         """Планирует задачу проверки доступа к сменам"""
         # Импортируем класс здесь, чтобы избежать циклических зависимостей
         from tasks.courier_shifts.shift_access_task import ShiftAccessTask
         instance = ShiftAccessTask(self.scheduler, self, self.settings)
-        return await instance.schedule(chat_id)
+        return await instance.schedule(chat_id, db_batch=db_batch)
 
     # Метод для нашей задачи (остается без изменений)
-    async def schedule_registration_open_event(self, chat_id):
+    async def schedule_registration_open_event(self, chat_id, db_batch: Optional[List[Dict[str, Any]]] = None):
         """Планирует задачу отправки WS события об открытии регистрации"""
         # Импортируем класс здесь
         from tasks.websocket_events.registration_open_event_task import RegistrationOpenEventTask
         instance = RegistrationOpenEventTask(self.scheduler, self, self.settings)
-        return await instance.schedule(chat_id)
+        return await instance.schedule(chat_id, db_batch=db_batch)
 
     async def schedule_booking_status_automation(self):
         """Планирует периодическую задачу автоматизации статусов бронирований."""
@@ -628,20 +715,30 @@ class TaskManager:
         except JobLookupError:
             pass  # Задача не найдена, продолжаем создание
         
-        # Удаляем существующую задачу из БД (если есть)
-        if self.db_service:
-            await self.db_service.delete_task(task_id)
-            logger.info(f"Существующая задача {task_id} удалена из БД")
+        # Строку в БД не удаляем: save_task ниже обновит ее (upsert), и сверка
+        # в reload_tasks не увидит job без строки
         
-        # Добавляем cron задачу (каждую минуту) с правильным timezone
+        # Добавляем cron задачу (каждую минуту) с правильным timezone.
+        # В событийном режиме переходы обрабатывает BookingAutomationWorker,
+        # а cron выполняет только редкую полную сверку
         from apscheduler.triggers.cron import CronTrigger
-        trigger = CronTrigger(minute='*', timezone=self.timezone)  # Добавляем timezone
+        cron_minute = self._booking_automation_cron_minute()
+        trigger = CronTrigger(minute=cron_minute, timezone=self.timezone)  # Добавляем timezone
         
+        task_data = {
+            'is_recurring': True,
+            'cron_expression': f'minute={cron_minute}',
+            'description': 'Автоматизация статусов бронирований',
+            'executor_path': 'tasks.booking_status_automation.booking_status_task:execute_automation'
+        }
         job = self.scheduler.add_job(
             'tasks.booking_status_automation.booking_status_task:execute_automation',
             trigger=trigger,
             id=task_id,
-            name='Автоматизация статусов бронирований',
+            name=versioned_job_name(
+                'Автоматизация статусов бронирований',
+                task_version(task_type, None, None, task_data)
+            ),
             max_instances=1,  # Не запускать новую, если предыдущая еще выполняется
             coalesce=True,  # Если пропустили выполнение, запустить только одно
             misfire_grace_time=30,  # Допустимая задержка в секундах
@@ -660,19 +757,20 @@ class TaskManager:
                 chat_id=None,  # Для системных задач chat_id = None
                 task_type=task_type,
                 next_run_time=job.next_run_time,
-                data={
-                    'is_recurring': True,
-                    'cron_expression': 'minute=*',
-                    'description': 'Автоматизация статусов бронирований',
-                    'executor_path': 'tasks.booking_status_automation.booking_status_task:execute_automation'
-                }
+                data=task_data
             )
             logger.info(f"✅ Задача {task_id} сохранена в БД")
         
-        logger.info(f"✅ Задача автоматизации статусов бронирований запланирована (каждую минуту)")
+        logger.info(f"✅ Задача автоматизации статусов бронирований запланирована (cron minute={cron_minute})")
         logger.info(f"📅 Следующий запуск: {job.next_run_time}")
         logger.info("ℹ️ Первое выполнение произойдет по расписанию cron задачи")
 
+    def _booking_automation_cron_minute(self) -> str:
+        """Каждую минуту (опрос) или раз в BOOKING_AUTOMATION_RESYNC_MINUTES (событийный режим)"""
+        if self.settings.BOOKING_AUTOMATION_EVENT_DRIVEN:
+            return f"*/{max(1, self.settings.BOOKING_AUTOMATION_RESYNC_MINUTES)}"
+        return '*'
+
     # Метод _get_courier_chat_ids (остается без изменений, использует self.api_url)
     def _get_courier_chat_ids(self) -> list[str]:
         """Получает список ID курьерских чатов из API сервера.
@@ -916,7 +1014,7 @@ class TaskManager:
             }
             
             # Отправляем запрос используя httpx вместо aiohttp
-            async with httpx.AsyncClient() as client:
+            async with self.http_clients.session("api") as client:
                 response = await client.patch(update_url, json=payload)
                 if response.status_code == 200:
                     logger.info(f"Статус уведомления {notification_id} успешно обновлен на 'completed'")
@@ -16,17 +16,22 @@ import httpx
 # Импортируем Optional, Dict, Any для типизации
 from typing import Optional, Dict, Any, TYPE_CHECKING
 from services.database_service import DatabaseService 
+from tasks.job_context import get_task_manager
 if TYPE_CHECKING:
     from tasks.task_manager import TaskManager
 
 logger = logging.getLogger(__name__)
 
 # --- Статическая функция-обертка для APScheduler --- 
-async def execute_job(chat_id: str, db_service: DatabaseService, settings: SchedulerSettings, task_manager: 'TaskManager', task_type: str = None):
+async def execute_job(chat_id: str, task_type: str = None):
     """Статическая обертка, вызываемая APScheduler.
        Выполняет основную логику задачи и запускает перепланирование.
+       TaskManager, db_service и настройки берутся из tasks.job_context (в kwargs задачи их нет).
     """
     logger.info(f"[RegOpenEventTask.execute_job] Запуск для chat_id: {chat_id} (тип: {task_type})")
+    task_manager = get_task_manager()
+    settings = task_manager.settings if task_manager else scheduler_settings
+    db_service = task_manager.db_service if task_manager else None
     task_success = False
     try:
         task_instance = RegistrationOpenEventTask(scheduler_instance=None, task_manager=None, settings=settings)
@@ -71,7 +76,7 @@ class RegistrationOpenEventTask(BaseTask):
             chat_id_param = str(chat_id)
             url = f"{settings.API_URL}/api/v1/groups/{chat_id_param}/settings"
             logger.info(f"({self.TASK_TYPE}) Запрос настроек доступа (async): {url}")
-            async with httpx.AsyncClient() as client:
+            async with self.http_clients.session("api") as client:
                 response = await client.get(url, timeout=10)
                 response.raise_for_status()
                 settings_data = response.json()
@@ -136,8 +141,8 @@ class RegistrationOpenEventTask(BaseTask):
             return None
 
     # Делаем schedule асинхронным
-    async def schedule(self, chat_id) -> bool:
-        """Планирует задачу уведомления об открытии регистрации (асинхронно)."""
+    async def schedule(self, chat_id, db_batch=None) -> bool:
+        """Планирует задачу уведомления об открытии регистрации (асинхронно). db_batch - см. TaskManager.save_task"""
         try:
             chat_id_str = str(chat_id)
             logger.info(f"=== ({self.TASK_TYPE}) Планирование события WS для чата {chat_id_str} (async) ===")
@@ -173,7 +178,8 @@ class RegistrationOpenEventTask(BaseTask):
                  chat_id_str, 
                  self.TASK_TYPE, 
                  next_registration, 
-                 task_data
+                 task_data,
+                 db_batch=db_batch
             )
             # ----------------------------------------
 
@@ -223,7 +229,7 @@ class RegistrationOpenEventTask(BaseTask):
                 logger.info(f"({self.TASK_TYPE}) Отправка NOTIFY в канал '{channel}' для chat_id: {chat_id_str}")
             
             # Вызываем метод DatabaseService
-            notify_success = await db_service.notify_websocket(channel, payload_dict)
+            notify_success = await db_service.notify_channel(channel, payload_dict)
             
             if notify_success:
                 logger.info(f"({self.TASK_TYPE}) ✅ NOTIFY для {chat_id_str} успешно отправлен через DatabaseService.")
@@ -30,13 +30,52 @@ async def listen_for_notifications(sio: socketio.AsyncServer):
     """
     logger.info(f"Запуск слушателя PostgreSQL для канала '{PG_CHANNEL}'...")
     conn = None
+    outbox_pool = None # Отдельные соединения для чтения ws_outbox (на conn висит LISTEN)
     stop_event = asyncio.Event() # Событие для сигнала остановки
 
+    async def _load_outbox_event(outbox_id):
+        """Большое событие, которое шедулер сохранил в ws_outbox вместо NOTIFY."""
+        nonlocal outbox_pool
+        if outbox_pool is None:
+            outbox_pool = await asyncpg.create_pool(
+                user=POSTGRES_USER,
+                password=POSTGRES_PASSWORD,
+                database=POSTGRES_DB,
+                host=POSTGRES_HOST,
+                port=POSTGRES_PORT,
+                min_size=1,
+                max_size=2
+            )
+        payload = await outbox_pool.fetchval("SELECT payload FROM ws_outbox WHERE id = $1", outbox_id)
+        if payload is None:
+            logger.warning(f"Событие ws_outbox #{outbox_id} не найдено (удалено по сроку хранения?)")
+            return None
+        return json.loads(payload)
+
     async def _notification_handler(connection, pid, channel, payload):
-        """Обработчик уведомлений от asyncpg."""
+        """Обработчик уведомлений от asyncpg: одно событие, пачка или ссылка на ws_outbox."""
         logger.info(f"Получен NOTIFY на канале '{channel}' от PID {pid}")
         try:
             data = json.loads(payload)
+        except json.JSONDecodeError:
+            logger.error(f"Ошибка декодирования JSON из payload: {payload}")
+            return
+
+        events = data.get('events', []) if data.get('type') == 'batch' else [data]
+        for event in events:
+            try:
+                if event.get('type') == 'outbox':
+                    event = await _load_outbox_event(event.get('outbox_id'))
+                    if event is None:
+                        continue
+                await _emit_event(event)
+            except Exception as e:
+                logger.error(f"Ошибка при обработке события из NOTIFY: {e}")
+                logger.exception("Стек ошибки обработчика уведомлений:")
+
+    async def _emit_event(data):
+        """Пересылает одно событие через Socket.IO."""
+        try:
             logger.info(f"Payload: {data}")
 
             event_type = data.get('type')
@@ -73,8 +112,6 @@ async def listen_for_notifications(sio: socketio.AsyncServer):
                 logger.info(f"✅ Событие '{event_type}' успешно отправлено в комнату '{room_name}'")
             # <<< КОНЕЦ ИЗМЕНЕННОЙ ЛОГИКИ >>>
 
-        except json.JSONDecodeError:
-            logger.error(f"Ошибка декодирования JSON из payload: {payload}")
         except Exception as e:
             logger.error(f"Ошибка при обработке уведомления или отправке sio.emit: {e}")
             logger.exception("Стек ошибки обработчика уведомлений:")
@@ -125,6 +162,8 @@ async def listen_for_notifications(sio: socketio.AsyncServer):
                 logger.info("Соединение PostgreSQL для слушателя успешно закрыто.")
             except Exception as e:
                 logger.error(f"Ошибка при закрытии соединения PostgreSQL: {e}")
+        if outbox_pool:
+            await outbox_pool.close()
 
     # Запускаем основной цикл слушателя
     listener_task = asyncio.create_task(_keep_listening())